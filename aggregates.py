@@ -0,0 +1,256 @@
+import os
+import threading
+import numpy as np
+import pandas as pd
+from schema import day_number_to_datetime
+from tracing import span
+
+
+
+# directory of the persisted aggregates
+aggregates_dir = "data/aggregates"
+
+# aggregates maintained in this process, with their names as keys
+_aggregates = {}
+_aggregates_lock = threading.Lock()
+
+
+class DateGroupAggregate:
+    """Materialized view of the sums and counts of a value per (date, group) of an append-only long table.
+
+    The aggregate remembers how many rows of the table it has folded in, so an update only reads the rows appended
+    since (one new day per ETL run) instead of the whole history. The sums and counts are kept as `(days, groups)`
+    NumPy arrays and the means are computed from them on read.
+
+    When the keys are mapped to new groups (e.g. new tracks get a cluster), only the rows already folded in of the keys
+    whose group changed are moved from their old group to the new one (see `regroup`).
+
+    Args:
+        value_column (str): The column of the aggregated values, e.g. 'track_popularity'.
+        key_column (str, optional): The column mapped to the groups, e.g. 'track_id'. Defaults to None, i.e. a single group.
+        group_of (pandas.Series, optional): The group of every key, indexed by key, e.g. the cluster of every track.
+            Rows whose key is missing from it are left out. Defaults to None, i.e. a single group.
+        groups_key (str, optional): Identifies the groups (e.g. the version of the clustering model),
+            a persisted aggregate built with other groups is discarded. Defaults to None.
+    """
+
+    def __init__(self, value_column, key_column=None, group_of=None, groups_key=None):
+        self.value_column = value_column
+        self.key_column = key_column
+        self.groups_key = groups_key
+        if group_of is None:
+            self.groups = np.zeros(1, dtype=np.int64)
+            self._keys, self._key_groups = None, None
+        else:
+            self.groups = group_labels(group_of)
+            self._keys = pd.Index(group_of.index)
+            self._key_groups = np.searchsorted(self.groups, group_labels(group_of, unique=False))
+        self.reset()
+
+    def reset(self):
+        """Empty the aggregate, so that the next `update` folds in the whole table."""
+        self.days = np.empty(0, dtype=np.int64)
+        self.sums = np.zeros((0, len(self.groups)), dtype=np.float64)
+        self.counts = np.zeros((0, len(self.groups)), dtype=np.int64)
+        self.rows = 0
+        self.last_day = -1
+
+    def group_codes(self, rows):
+        # position of the group of every row, -1 for the rows without a group
+        if self._keys is None:
+            return np.zeros(len(rows), dtype=np.int64)
+        positions = self._keys.get_indexer(rows[self.key_column])
+        return np.where(positions >= 0, self._key_groups[positions], -1)
+
+    def check_table(self, table):
+        # the table must start with the rows already folded in, otherwise (e.g. it was reloaded from a replaced file)
+        # the aggregate is rebuilt from the whole table
+        if len(table) < self.rows or (self.rows > 0 and int(table['date'].iat[self.rows - 1]) != self.last_day):
+            self.reset()
+
+    def fold(self, rows, sign=1):
+        """Adds (or with `sign=-1`, subtracts) the values of rows to the sums and counts of their (date, group)."""
+        group_codes = self.group_codes(rows)
+        keep = group_codes >= 0
+        row_days = rows['date'].to_numpy().astype(np.int64)[keep]
+        values = rows[self.value_column].to_numpy(dtype=np.float64)[keep]
+        group_codes = group_codes[keep]
+
+        # extend the date axis with the new days
+        days = np.union1d(self.days, row_days)
+        if len(days) > len(self.days):
+            positions = np.searchsorted(days, self.days)
+            sums = np.zeros((len(days), len(self.groups)), dtype=np.float64)
+            counts = np.zeros((len(days), len(self.groups)), dtype=np.int64)
+            sums[positions], counts[positions] = self.sums, self.counts
+            self.days, self.sums, self.counts = days, sums, counts
+
+        cells = np.searchsorted(self.days, row_days) * len(self.groups) + group_codes
+        self.sums += sign * np.bincount(cells, weights=values, minlength=self.sums.size).reshape(self.sums.shape)
+        self.counts += sign * np.bincount(cells, minlength=self.counts.size).reshape(self.counts.shape)
+
+    def update(self, table):
+        """
+        Folds in the rows appended to the table since the last update.
+
+        The table must be append-only with day numbers in its 'date' column (see `schema.apply_schema`), as the tables
+        returned by `sync_table`. If it no longer starts with the rows already folded in (e.g. it was reloaded
+        from a replaced file), the aggregate is rebuilt from the whole table.
+
+        Args:
+            table (pandas.DataFrame): The long table.
+
+        Returns:
+            int: The number of rows folded in.
+        """
+        self.check_table(table)
+        rows = table.iloc[self.rows:]
+        if rows.empty:
+            return 0
+        self.fold(rows)
+        self.rows = len(table)
+        self.last_day = int(table['date'].iat[-1])
+        return len(rows)
+
+    def regroup(self, group_of, table):
+        """
+        Maps the keys to new groups, e.g. the clusters of the tracks of a new data snapshot.
+
+        Only the keys whose group changed are read: the rows already folded in of these keys (new keys, keys mapped
+        to another group and keys no longer mapped) are subtracted from their old group and added to their new one.
+
+        Args:
+            group_of (pandas.Series): The new group of every key, indexed by key.
+            table (pandas.DataFrame): The long table the aggregate was updated with.
+
+        Returns:
+            int: The number of keys whose group changed.
+        """
+        # the groups only grow, so the sums and counts of the existing groups keep their columns
+        groups = np.union1d(self.groups, group_labels(group_of))
+        if len(groups) > len(self.groups):
+            positions = np.searchsorted(groups, self.groups)
+            sums = np.zeros((len(self.days), len(groups)), dtype=np.float64)
+            counts = np.zeros((len(self.days), len(groups)), dtype=np.int64)
+            sums[:, positions], counts[:, positions] = self.sums, self.counts
+            self.sums, self.counts = sums, counts
+            self._key_groups = positions[self._key_groups]
+            self.groups = groups
+        keys = pd.Index(group_of.index)
+        key_groups = np.searchsorted(self.groups, group_labels(group_of, unique=False))
+
+        # keys whose group changed, including the new keys and the keys no longer mapped
+        old_positions = self._keys.get_indexer(keys)
+        old_groups = np.where(old_positions >= 0, self._key_groups[old_positions], -1)
+        changed = keys[old_groups != key_groups].append(self._keys.difference(keys))
+        if len(changed) > 0:
+            self.check_table(table)
+            folded = table.iloc[:self.rows]
+            rows = folded[folded[self.key_column].isin(changed)]
+            self.fold(rows, sign=-1)
+            self._keys, self._key_groups = keys, key_groups
+            self.fold(rows)
+        else:
+            self._keys, self._key_groups = keys, key_groups
+        return len(changed)
+
+    def means(self):
+        """
+        Returns the mean value of every (date, group) with at least one row.
+
+        Returns:
+            pandas.DataFrame: The columns 'date' (datetime), 'group' (only if the aggregate has groups) and 'mean',
+            sorted by date and group.
+        """
+        day_positions, group_positions = np.nonzero(self.counts)
+        means = pd.DataFrame({
+            'date': day_number_to_datetime(self.days[day_positions]),
+            'group': self.groups[group_positions],
+            'mean': self.sums[day_positions, group_positions] / self.counts[day_positions, group_positions],
+        })
+        if self._keys is None:
+            means = means.drop(columns='group')
+        return means
+
+    def save(self, path):
+        """Persist the aggregate, written to a temporary file first so that it is never left half-written."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # the keys and their groups are persisted with the sums, as the groups the rows were folded in with
+        keys = np.empty(0, dtype=str) if self._keys is None else np.asarray(self._keys, dtype=str)
+        key_groups = np.empty(0, dtype=np.int64) if self._keys is None else self._key_groups
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f, days=self.days, sums=self.sums, counts=self.counts, groups=self.groups, keys=keys,
+                     key_groups=key_groups, rows=self.rows, last_day=self.last_day, groups_key=str(self.groups_key))
+        os.replace(path + '.tmp', path)
+
+    def load(self, path):
+        """
+        Loads the aggregate persisted at `path`, if it was built with the same `groups_key`, with the groups of the keys
+        it was built with (see `regroup` to map the keys to the current groups).
+        A file that cannot be read (e.g. truncated, or written by another version of the app) is ignored, so the
+        aggregate is rebuilt from the table instead.
+
+        Returns:
+            bool: Whether the aggregate was loaded.
+        """
+        if not os.path.exists(path):
+            return False
+        try:
+            with np.load(path, allow_pickle=False) as saved:
+                if str(saved['groups_key']) != str(self.groups_key) or saved['groups'].dtype.kind != self.groups.dtype.kind:
+                    return False
+                days, sums, counts, groups = saved['days'], saved['sums'], saved['counts'], saved['groups']
+                keys, key_groups = saved['keys'], saved['key_groups']
+                rows, last_day = int(saved['rows']), int(saved['last_day'])
+        except Exception as e:
+            print(f"Failed to load the aggregate {path}, rebuilding it. Exception raised: {e}")
+            return False
+        self.days, self.sums, self.counts, self.groups = days, sums, counts, groups
+        if self._keys is not None:
+            self._keys, self._key_groups = pd.Index(keys.astype(object)), key_groups
+        self.rows, self.last_day = rows, last_day
+        return True
+
+
+def group_labels(group_of, unique=True):
+    """Return the sorted group labels of a mapping (or with `unique=False`, the label of every key), as a NumPy array
+    that is persisted without pickling, e.g. the cluster strings as a fixed-width array."""
+    labels = np.asarray(group_of)
+    if labels.dtype == object:
+        labels = labels.astype(str)
+    return np.unique(labels) if unique else labels
+
+
+def date_group_means(name, table, value_column, key_column=None, group_of=None, groups_key=None):
+    """
+    Returns the mean of a value per date (and group) of an append-only table, from a materialized aggregate
+    maintained across calls (see `DateGroupAggregate`).
+
+    The aggregate is kept in memory for the life of the process and persisted to `aggregates_dir`, so that only the rows
+    appended to the table since the last call, or since the last run of the app, are aggregated.
+
+    Args:
+        name (str): The name of the aggregate, e.g. 'tracks_popularity_by_date'.
+        table (pandas.DataFrame): The append-only long table, e.g. the tracks popularity table returned by `sync_table`.
+        value_column (str): The column of the aggregated values.
+        key_column (str, optional): The column mapped to the groups. Defaults to None, i.e. a mean per date.
+        group_of (pandas.Series, optional): The group of every key, indexed by key. Defaults to None.
+        groups_key (str, optional): Identifies the groups, e.g. the version of the clustering model. Defaults to None.
+
+    Returns:
+        pandas.DataFrame: The means (see `DateGroupAggregate.means`).
+    """
+    path = os.path.join(aggregates_dir, f"{name}.npz")
+    with span('aggregates.date_group_means', aggregate=name) as call, _aggregates_lock:
+        aggregate = _aggregates.get(name)
+        if aggregate is None or aggregate.groups_key != groups_key:
+            aggregate = DateGroupAggregate(value_column, key_column, group_of, groups_key)
+            aggregate.load(path)
+            _aggregates[name] = aggregate
+        # the keys whose group changed since the aggregate was built, e.g. the new tracks of the snapshot
+        regrouped = aggregate.regroup(group_of, table) if group_of is not None else 0
+        new_rows = aggregate.update(table)
+        if new_rows > 0 or regrouped > 0:
+            aggregate.save(path)
+        call.set(new_rows=new_rows, regrouped=regrouped)
+        return aggregate.means()
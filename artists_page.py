@@ -3,26 +3,24 @@ import plotly.graph_objs as go
 #import plotly.express as px
 from plotly.subplots import make_subplots
 import numpy as np
-from functions import show_artists_table
+from functions import show_artists_table, full_history_toggle, lazy_tabs, load_datasets, trend_series
+from trend_charts import build_trend_traces
+from data_snapshot import get_snapshot
+from figure_cache import show_figure
+from tracing import span, traced
 
 
 
 
-def artist_trend_line(selected_artists, key_word='artist_popularity'):
-    # Create a list to store the trend line traces
-    trend_line_traces = []
-    
-    # Iterate over the selected artists
-    for index, artist in selected_artists.iterrows():
-        # Create a trend line trace for each artist
-        trend_line_trace = go.Scatter(
-            x = [date for date, _ in artist[f'date_{key_word}_list']],
-            y = [popularity for _, popularity in artist[f'date_{key_word}_list']],
-            mode = 'lines',
-            name = artist['artist_name']
-        )
-        # Add the trend line trace to the list
-        trend_line_traces.append(trend_line_trace)
+@traced('artists.trend_line_figure')
+def artist_trend_line(selected_artists, artists_series, key_word='artist_popularity', full_history=None):
+    # series store of the selected metric
+    series = artists_series[key_word]
+    # Create the (downsampled) trend line traces of the selected artists
+    trend_line_traces = build_trend_traces([
+        (name, *trend_series(series, artist_id, full_history))
+        for artist_id, name in zip(selected_artists['artist_id'], selected_artists['artist_name'])
+    ])
     
     # Create the trend line plot layout
     if key_word == 'artist_popularity':
@@ -54,40 +52,8 @@ def artist_trend_line(selected_artists, key_word='artist_popularity'):
     return trend_line_fig
 
 
-#############################
-# App page
-
-
-st.title("🧑🏽‍🎤 Artists")
-
-# Load the cached data
-artists_data = st.session_state['cached_artist_data']
-artists_data = artists_data.sort_values(by='current_artist_popularity', ascending=False)
-
-# add a chart column to select artists to be displayed in the charts
-artists_data['chart'] = False
-artists_data.loc[artists_data.index[0], 'chart'] = True
-
-
-# Add a checkbox to unselect all 'Chart' ticks
-clear_charts_button = st.button('Unselect all artists')
-if clear_charts_button:
-    artists_data['chart'] = False
-
-#   display the artists table
-artists_data = show_artists_table(artists_data)
-
-# Filter the selected artists to show in the charts
-selected_artists = artists_data[artists_data['chart']]
-
-
-
-tab1, tab2, tab3 = st.tabs(["Current Artist Popularity & Followers", "Artist Popularity Trend", "Artist Followers Trend"])
-with tab2:
-    st.plotly_chart(artist_trend_line(selected_artists, key_word='artist_popularity'), use_container_width=True)
-with tab3:
-    st.plotly_chart(artist_trend_line(selected_artists, key_word='followers'), use_container_width=True)
-with tab1:
+@traced('artists.popularity_followers_figure')
+def artists_popularity_followers_figure(artists_data):
     artists_data_shorted = artists_data.sort_values(by='current_followers', ascending=False)
     fig = make_subplots(specs=[[{"secondary_y": True}]])
 
@@ -135,7 +101,60 @@ with tab1:
         )
     )
     fig.update_yaxes(showgrid=False ,secondary_y=True)
-        
-    #fig.update_yaxes(showgrid=False, secondary_y=True)
-    st.plotly_chart(fig, use_container_width=True)
-    
+
+    return fig
+
+
+#############################
+# App page
+
+
+st.title("🧑🏽‍🎤 Artists")
+
+# Load the data snapshot shared by all the sessions (read-only, sorted by current artist popularity)
+# and build (on first use) only the datasets of this page
+snapshot = get_snapshot()
+snapshot_artists_data, artist_popularity_series, followers_series = load_datasets(
+    snapshot, 'artists_data', 'artist_popularity_series', 'followers_series')
+artists_series = {'artist_popularity': artist_popularity_series, 'followers': followers_series}
+# per-rerun view of the artists table for this session: popularity sparklines, read as slices of the series store,
+# and a chart column to select artists to be displayed in the charts
+artists_data = snapshot_artists_data.assign(
+    artist_popularity_list=artists_series['artist_popularity'].values_list(snapshot_artists_data['artist_id']),
+    chart=False,
+)
+artists_data.loc[artists_data.index[0], 'chart'] = True
+
+
+# Add a checkbox to unselect all 'Chart' ticks
+clear_charts_button = st.button('Unselect all artists')
+if clear_charts_button:
+    artists_data['chart'] = False
+
+#   display the artists table
+with span('artists.table', rows=len(artists_data)):
+    artists_data = show_artists_table(artists_data)
+
+# Filter the selected artists to show in the charts
+selected_artists = artists_data[artists_data['chart']]
+
+
+
+# only the selected tab is built (see `lazy_tabs`)
+tab1, tab2, tab3 = lazy_tabs(["Current Artist Popularity & Followers", "Artist Popularity Trend", "Artist Followers Trend"], key='artists_tab')
+# the figures are cached per data snapshot and selected artists (see `figure_cache`)
+selected_artist_ids = selected_artists['artist_id'].tolist()
+if tab2:
+    full_history = full_history_toggle(snapshot, 'artists_popularity_table', selected_artists['artist_id'], key='artists_popularity_full_history')
+    show_figure('artists.popularity_trend', snapshot.version, {'artists': selected_artist_ids, 'full_history': full_history is not None},
+                lambda: artist_trend_line(selected_artists, artists_series, key_word='artist_popularity', full_history=full_history),
+                use_container_width=True)
+if tab3:
+    full_history = full_history_toggle(snapshot, 'artists_followers_table', selected_artists['artist_id'], key='artists_followers_full_history')
+    show_figure('artists.followers_trend', snapshot.version, {'artists': selected_artist_ids, 'full_history': full_history is not None},
+                lambda: artist_trend_line(selected_artists, artists_series, key_word='followers', full_history=full_history),
+                use_container_width=True)
+if tab1:
+    # the same for every session until the data snapshot changes
+    show_figure('artists.popularity_followers', snapshot.version, {},
+                lambda: artists_popularity_followers_figure(artists_data), use_container_width=True)
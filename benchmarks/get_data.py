@@ -0,0 +1,235 @@
+"""Benchmark of the data pipeline (`data_pipeline.get_data`) on synthetic data, at growing catalogue and history sizes.
+
+The synthetic tables have the columns of the real tables and the compact dtypes of `schema.table_schemas`, as the
+pipeline gets them from `read_table` and `sync_table`, so no database is needed. The catalogue (artists, albums and
+tracks) is scaled from the size of the real one (30 artists, 438 albums, 5956 tracks) and the history is given in days.
+
+Run from the repository root:
+    python -m benchmarks.get_data --catalogue 1 10 --days 365 1825 --output benchmarks/results/get_data.json
+"""
+import argparse
+import json
+import os
+import platform
+import time
+import numpy as np
+import pandas as pd
+from schema import to_day_number
+from aggregates import DateGroupAggregate
+from data_pipeline import (filter_columns, get_popularity, merge_tracks_data, process_artists_data,
+                           process_tracks_data)
+from filter_engine import FilterEngine
+from nearest_neighbors import NeighborIndex
+
+
+
+# size of the real catalogue, i.e. the 1x scale
+base_artists, base_albums, base_tracks = 30, 438, 5956
+# share of the tracks that are other versions (remasters, live recordings, etc.) of another track of the album's artist
+version_share = 0.15
+
+
+def spotify_ids(prefix, n):
+    # fixed-width ids, like the 22-char Spotify ids
+    return np.char.add(prefix, np.char.zfill(np.arange(n).astype(str), 22 - len(prefix)))
+
+
+def categorical(values, codes):
+    return pd.Categorical.from_codes(codes, categories=pd.Index(values))
+
+
+def synthetic_static_tables(scale, seed=0):
+    """
+    Generates the static tables (artists, albums, tracks and tracks features) of a catalogue `scale` times the real one.
+
+    Returns:
+        tuple: artists_table, albums_table, tracks_table and tracks_features_table, as returned by `load_static_data`.
+    """
+    rng = np.random.default_rng(seed)
+    n_artists, n_albums, n_tracks = (max(1, round(n * scale)) for n in (base_artists, base_albums, base_tracks))
+    artist_ids, album_ids, track_ids = spotify_ids('ar', n_artists), spotify_ids('al', n_albums), spotify_ids('tr', n_tracks)
+
+    artists_table = pd.DataFrame({
+        'artist_id': pd.Categorical(artist_ids),
+        'artist_name': np.char.add('Artist ', np.arange(n_artists).astype(str)).astype(object),
+        'artist_url': np.char.add('https://open.spotify.com/artist/', artist_ids).astype(object),
+        'artist_image_large': 'https://i.scdn.co/image/large',
+        'artist_image_medium': 'https://i.scdn.co/image/medium',
+        'artist_image_small': 'https://i.scdn.co/image/small',
+    })
+    album_artists = rng.integers(n_artists, size=n_albums)
+    albums_table = pd.DataFrame({
+        'album_id': pd.Categorical(album_ids),
+        'artist_id': categorical(artist_ids, album_artists),
+        'album_name': np.char.add('Album ', np.arange(n_albums).astype(str)).astype(object),
+        'album_release_date': rng.integers(1960, 2025, size=n_albums).astype('uint16'),
+        'album_total_tracks': rng.integers(8, 20, size=n_albums).astype('uint16'),
+        'album_image_large': 'https://i.scdn.co/image/large',
+        'album_image_medium': 'https://i.scdn.co/image/medium',
+        'album_image_small': 'https://i.scdn.co/image/small',
+        'original_album_name': np.char.add('Album ', np.arange(n_albums).astype(str)).astype(object),
+    })
+    track_albums = rng.integers(n_albums, size=n_tracks)
+    # some tracks are versions of an earlier track, i.e. share its original name
+    original = np.arange(n_tracks)
+    versions = np.flatnonzero(rng.random(n_tracks) < version_share)
+    original[versions] = rng.integers(np.maximum(versions, 1), size=len(versions))
+    # versions of versions point to the first track of their family
+    while (original[original] != original).any():
+        original = original[original]
+    track_albums[versions] = track_albums[original[versions]]
+    original_names = np.char.add('Track ', original.astype(str)).astype(object)
+    tracks_table = pd.DataFrame({
+        'track_id': pd.Categorical(track_ids),
+        'album_id': categorical(album_ids, track_albums),
+        'track_name': original_names,
+        'track_duration_ms': rng.integers(120_000, 480_000, size=n_tracks).astype('uint32'),
+        'track_spotify_url': np.char.add('https://open.spotify.com/track/', track_ids).astype(object),
+        'track_preview_url': None,
+        'track_duration_display': '4:00',
+        'original_track_name': original_names,
+    })
+    tracks_features_table = pd.DataFrame({
+        'track_id': pd.Categorical(track_ids),
+        'uri': np.char.add('spotify:track:', track_ids).astype(object),
+        'track_href': np.char.add('https://api.spotify.com/v1/tracks/', track_ids).astype(object),
+        'analysis_url': np.char.add('https://api.spotify.com/v1/audio-analysis/', track_ids).astype(object),
+        'duration_ms': tracks_table['track_duration_ms'],
+        'time_signature': rng.choice(np.array([3, 4, 5], dtype='uint8'), size=n_tracks),
+        'danceability': rng.random(n_tracks),
+        'energy': rng.random(n_tracks),
+        'track_key': rng.integers(12, size=n_tracks).astype('uint8'),
+        'loudness': rng.uniform(-35, 0, size=n_tracks),
+        'mode': rng.integers(2, size=n_tracks).astype('uint8'),
+        'speechiness': rng.random(n_tracks) * 0.3,
+        'acousticness': rng.random(n_tracks),
+        'instrumentalness': rng.random(n_tracks) ** 3,
+        'liveness': rng.random(n_tracks),
+        'valence': rng.random(n_tracks),
+        'tempo': rng.uniform(60, 200, size=n_tracks),
+        'type': pd.Categorical(['audio_features'] * n_tracks),
+    })
+    return artists_table, albums_table, tracks_table, tracks_features_table
+
+
+def synthetic_history(ids, id_column, value_column, n_days, low, high, dtype, seed=0):
+    """
+    Generates a daily history table (one row per entity and day, in date order as it is synced) with random-walk values.
+
+    Returns:
+        pandas.DataFrame: The table with the columns 'date' (day numbers), `id_column` and `value_column`.
+    """
+    rng = np.random.default_rng(seed)
+    ids = pd.Index(ids)
+    start = to_day_number(['2023-12-28'])[0]
+    steps = rng.integers(-1, 2, size=(n_days, len(ids)), dtype=np.int8)
+    if high > 1000:
+        # followers move by a few per mille a day
+        values = rng.uniform(low, high, size=len(ids)) * np.cumprod(1 + steps * 0.001, axis=0)
+    else:
+        values = rng.integers(low, high, size=len(ids), dtype=np.int16) + steps.cumsum(axis=0, dtype=np.int16)
+    table = pd.DataFrame({
+        'date': np.repeat(np.arange(start, start + n_days), len(ids)).astype('uint16'),
+        id_column: pd.Categorical.from_codes(np.tile(np.arange(len(ids), dtype=np.int32), n_days), categories=ids),
+        value_column: np.clip(values, low, high).ravel().astype(dtype),
+    })
+    return table
+
+
+def synthetic_tables(scale, n_days, seed=0):
+    """
+    Generates all the tables of the pipeline: the static tables of `synthetic_static_tables` and `n_days` of
+    tracks popularity, artists popularity and artists followers history.
+
+    Returns:
+        dict: The tables, with table names as keys.
+    """
+    artists_table, albums_table, tracks_table, tracks_features_table = synthetic_static_tables(scale, seed)
+    artist_ids, track_ids = artists_table['artist_id'].cat.categories, tracks_table['track_id'].cat.categories
+    return {
+        'artists_table': artists_table,
+        'albums_table': albums_table,
+        'tracks_table': tracks_table,
+        'tracks_features_table': tracks_features_table,
+        'tracks_popularity_table': synthetic_history(track_ids, 'track_id', 'track_popularity', n_days, 0, 100, 'uint8', seed + 1),
+        'artists_popularity_table': synthetic_history(artist_ids, 'artist_id', 'artist_popularity', n_days, 0, 100, 'uint8', seed + 2),
+        'artists_followers_table': synthetic_history(artist_ids, 'artist_id', 'followers', n_days, 10_000, 30_000_000, 'uint32', seed + 3),
+    }
+
+
+def run_stages(tables):
+    """
+    Runs the stages of `get_data` on the tables and times them.
+
+    Returns:
+        dict: The seconds spent in every stage.
+    """
+    timings = {}
+
+    def timed(stage, function, *args, **kwargs):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        timings[stage] = round(time.perf_counter() - start, 4)
+        return result
+
+    tracks_data = timed('merge_tracks_data', merge_tracks_data, tables['tracks_table'], tables['albums_table'],
+                        tables['artists_table'], tables['tracks_features_table'])
+    tracks_popularity = timed('get_popularity_tracks', get_popularity, tables['tracks_popularity_table'], key_word='track')
+    tracks_data, _ = timed('process_tracks_data', process_tracks_data, tracks_data, tracks_popularity)
+    artists_popularity = timed('get_popularity_artists', get_popularity, tables['artists_popularity_table'], key_word='artist')
+    artists_followers = timed('get_popularity_followers', get_popularity, tables['artists_followers_table'],
+                              key_word='artist', artist_followers=True)
+    timed('process_artists_data', process_artists_data, tables['artists_table'], artists_popularity, artists_followers)
+
+    # the mean popularity aggregate, built from the whole history and then updated with one more day
+    history = tables['tracks_popularity_table']
+    last_day = history['date'].iat[-1]
+    previous_days = history.iloc[:np.searchsorted(history['date'].to_numpy(), last_day)]
+    aggregate = DateGroupAggregate('track_popularity')
+    timed('mean_popularity_full', aggregate.update, previous_days)
+    timed('mean_popularity_new_day', aggregate.update, history)
+    timed('mean_popularity_read', aggregate.means)
+
+    timed('filter_engine', FilterEngine, tracks_data, filter_columns)
+    timed('neighbor_index', NeighborIndex, tracks_data)
+    timings['total'] = round(sum(timings.values()), 4)
+    return timings
+
+
+def run(catalogue, days, seed=0):
+    results = []
+    for n_days in days:
+        for scale in catalogue:
+            start = time.perf_counter()
+            tables = synthetic_tables(scale, n_days, seed)
+            generate_seconds = time.perf_counter() - start
+            results.append({
+                'catalogue_scale': scale,
+                'days': n_days,
+                'tracks': len(tables['tracks_table']),
+                'artists': len(tables['artists_table']),
+                'history_rows': len(tables['tracks_popularity_table']),
+                'generate_seconds': round(generate_seconds, 4),
+                'stages': run_stages(tables),
+            })
+            print(results[-1])
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--catalogue', type=float, nargs='+', default=[1, 10], help='catalogue scales, e.g. 1 10 100')
+    parser.add_argument('--days', type=int, nargs='+', default=[365, 1825], help='days of history')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmarks/results/get_data.json')
+    args = parser.parse_args()
+    results = {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'seed': args.seed,
+        'runs': run(args.catalogue, args.days, args.seed),
+    }
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
@@ -0,0 +1,141 @@
+"""Startup profile of the app: the import time of every module imported by the app and by each page, cold.
+
+Each target is imported in a fresh interpreter with `python -X importtime`, i.e. with empty module caches as on
+a cold container start: the app (`streamlit_app.py`) first, then the imports of each page on top of it, so the cost
+of a page is what it adds to the app. The report gives the total time, the self time per top-level package and the
+cumulative time of the modules of this repository.
+
+Run from the repository root:
+    python -m benchmarks.import_time --output benchmarks/results/import_time.json
+
+To profile a real server start instead, log its imports and summarize the log:
+    PYTHONPROFILEIMPORTTIME=1 streamlit run streamlit_app.py 2> imports.log
+    python -m benchmarks.import_time --log imports.log
+"""
+import argparse
+import ast
+import json
+import os
+import platform
+import subprocess
+import sys
+from collections import defaultdict
+
+
+
+app_path = 'streamlit_app.py'
+page_paths = ['main.py', 'artists_page.py', 'clustering_page.py', 'about_page.py']
+
+
+def module_imports(path):
+    """Return the source of the module-level import statements of a script, e.g. of a page."""
+    with open(path, encoding='utf-8') as f:
+        source = f.read()
+    tree = ast.parse(source)
+    return '\n'.join(ast.get_source_segment(source, node) for node in tree.body
+                     if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+def parse_importtime(lines):
+    """
+    Parses the output of `python -X importtime`.
+
+    Returns:
+        list: A dict per imported module, in import order: 'module', 'self_us', 'cumulative_us' and 'depth'
+        (0 for the modules imported by the profiled code itself).
+    """
+    modules = []
+    for line in lines:
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules.append({
+            'module': name.strip(),
+            'self_us': int(self_us),
+            'cumulative_us': int(cumulative_us),
+            'depth': (len(name) - len(name.lstrip()) - 1) // 2,
+        })
+    return modules
+
+
+def profile_imports(code, preload=''):
+    """
+    Runs code in a fresh interpreter with `-X importtime` and returns the imports it triggers.
+
+    Args:
+        code (str): The import statements to profile.
+        preload (str, optional): Import statements run before, whose imports are not reported. Defaults to ''.
+
+    Returns:
+        list: The imported modules (see `parse_importtime`).
+    """
+    script = f'{preload}\nimport sys\nsys.stderr.write("--- profile ---\\n")\n{code}\n'
+    # the modules of the repository root are importable from the subprocess
+    python_path = os.pathsep.join(filter(None, [os.getcwd(), os.environ.get('PYTHONPATH')]))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', script],
+                            capture_output=True, text=True, env={**os.environ, 'PYTHONPATH': python_path})
+    if result.returncode != 0:
+        raise RuntimeError(f"Import failed:\n{result.stderr[-2000:]}")
+    lines = result.stderr.splitlines()
+    return parse_importtime(lines[lines.index('--- profile ---') + 1:])
+
+
+def first_party_modules():
+    # the modules of this repository, i.e. the .py files of the root
+    return {name[:-3] for name in os.listdir('.') if name.endswith('.py')}
+
+
+def summarize(modules, top=15):
+    """
+    Summarizes the imports of a target.
+
+    Returns:
+        dict: The total milliseconds, the self milliseconds per top-level package (descending, `top` first)
+        and the cumulative milliseconds of every module of this repository.
+    """
+    packages = defaultdict(int)
+    for module in modules:
+        packages[module['module'].split('.')[0]] += module['self_us']
+    repository = first_party_modules()
+    return {
+        'total_ms': round(sum(module['self_us'] for module in modules) / 1000, 1),
+        'modules': len(modules),
+        'packages_ms': {name: round(us / 1000, 1) for name, us in sorted(packages.items(), key=lambda item: -item[1])[:top]},
+        'repository_ms': {module['module']: round(module['cumulative_us'] / 1000, 1) for module in modules
+                          if module['module'] in repository},
+    }
+
+
+def print_summary(name, summary):
+    print(f"{name}: {summary['total_ms']:.1f} ms, {summary['modules']} modules")
+    for package, ms in summary['packages_ms'].items():
+        print(f'    {package:<30} {ms:>8.1f} ms')
+
+
+def run(top=15):
+    results = {}
+    app_imports = module_imports(app_path)
+    results[app_path] = summarize(profile_imports(app_imports), top)
+    print_summary(app_path, results[app_path])
+    for page_path in page_paths:
+        results[page_path] = summarize(profile_imports(module_imports(page_path), preload=app_imports), top)
+        print_summary(f'{page_path} (after {app_path})', results[page_path])
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--log', default=None, help='summarize the log of PYTHONPROFILEIMPORTTIME=1 instead')
+    parser.add_argument('--top', type=int, default=15, help='number of packages to report')
+    parser.add_argument('--output', default='benchmarks/results/import_time.json')
+    args = parser.parse_args()
+    if args.log is not None:
+        with open(args.log, encoding='utf-8', errors='replace') as f:
+            results = {args.log: summarize(parse_importtime(f), args.top)}
+        print_summary(args.log, results[args.log])
+    else:
+        results = run(args.top)
+    results = {'python': platform.python_version(), 'targets': results}
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
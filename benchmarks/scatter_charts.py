@@ -0,0 +1,79 @@
+"""Benchmark of the cluster scatter plot: figure build time and JSON payload size.
+
+The legacy figure is the `px.scatter_3d` of all the tracks, with the name of every track on hover, the Clustering page
+used to draw; the budgeted figures are built by `scatter_charts.build_group_scatter_traces`, with the number of every
+drawn track on hover (as the Clustering page), with the name of the tracks (only sent when all the tracks are drawn)
+or with neither.
+
+Run from the repository root:
+    python -m benchmarks.scatter_charts --tracks 5000 50000 200000 --output benchmarks/results/scatter_charts.json
+"""
+import argparse
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io
+from scatter_charts import build_group_scatter_traces, max_scatter_points
+
+
+
+def synthetic_tracks(n_tracks, seed=0):
+    """Build clustered tracks with unbalanced clusters and a 'track by artist' hover title, as `clustering.clustered_data`."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'cluster': rng.choice(5, n_tracks, p=[0.4, 0.3, 0.15, 0.1, 0.05]).astype(str),
+        'energy': rng.random(n_tracks),
+        'valence': rng.random(n_tracks),
+        'acousticness': rng.random(n_tracks),
+        'hover_info': [f'Track number {i} by Artist number {i % 997}' for i in range(n_tracks)],
+        'track_number': np.arange(n_tracks, dtype=np.int32),
+    })
+
+
+def legacy_figure(data):
+    import plotly.express as px
+    return px.scatter_3d(data, x='energy', y='valence', z='acousticness', color='cluster', hover_name='hover_info')
+
+
+def budgeted_figure(data, id_column=None, hover_column=None):
+    return go.Figure(build_group_scatter_traces(data, 'cluster', ['energy', 'valence', 'acousticness'],
+                                                id_column=id_column, hover_column=hover_column))
+
+
+def run(tracks):
+    results = []
+    for n_tracks in tracks:
+        data = synthetic_tracks(n_tracks)
+        for mode, build in [('legacy', legacy_figure),
+                            ('budgeted_ids', lambda data: budgeted_figure(data, id_column='track_number')),
+                            ('budgeted_names', lambda data: budgeted_figure(data, hover_column='hover_info')),
+                            ('budgeted', budgeted_figure)]:
+            start = time.perf_counter()
+            fig = build(data)
+            build_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            payload = plotly.io.to_json(fig, validate=False)
+            results.append({
+                'mode': mode,
+                'tracks': n_tracks,
+                'points': sum(len(trace.x) for trace in fig.data),
+                'build_seconds': round(build_seconds, 4),
+                'serialize_seconds': round(time.perf_counter() - start, 4),
+                'payload_bytes': len(payload),
+            })
+            print(results[-1])
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tracks', type=int, nargs='+', default=[max_scatter_points, 50000, 200000])
+    parser.add_argument('--output', default='benchmarks/results/scatter_charts.json')
+    args = parser.parse_args()
+    results = run(args.tracks)
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
@@ -0,0 +1,80 @@
+"""Benchmark of the trend charts: figure build time and JSON payload size, with and without downsampling.
+
+Run from the repository root:
+    python -m benchmarks.trend_charts --tracks 10 100 500 --days 365 1095 --output benchmarks/results/trend_charts.json
+"""
+import argparse
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from series_store import SeriesStore
+from trend_charts import build_trend_traces
+
+
+
+def synthetic_series(n_tracks, n_days, seed=0):
+    """Build a SeriesStore of random-walk popularity series, one per track."""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2023-12-28', periods=n_days)
+    steps = rng.integers(-2, 3, size=(n_tracks, n_days))
+    popularity = np.clip(rng.integers(10, 90, size=(n_tracks, 1)) + steps.cumsum(axis=1), 0, 100).astype(np.uint8)
+    table = pd.DataFrame({
+        'date': np.tile(dates, n_tracks),
+        'track_id': np.repeat([f'track_{i:06d}' for i in range(n_tracks)], n_days),
+        'track_popularity': popularity.ravel(),
+    })
+    return SeriesStore.from_table(table, 'track_id', 'track_popularity')
+
+
+def legacy_figure(store):
+    # one SVG trace per track from lists of (date, popularity) tuples, as the pages used to build them
+    traces = []
+    for track_id in store.ids:
+        pairs = list(zip(store.dates_of(track_id), store.values_of(track_id)))
+        traces.append(go.Scatter(x=[date for date, _ in pairs], y=[popularity for _, popularity in pairs],
+                                 mode='lines', name=track_id))
+    return go.Figure(data=traces)
+
+
+def downsampled_figure(store):
+    return go.Figure(data=build_trend_traces([(track_id, store.dates_of(track_id), store.values_of(track_id))
+                                              for track_id in store.ids]))
+
+
+def run(tracks, days):
+    results = []
+    for n_days in days:
+        for n_tracks in tracks:
+            store = synthetic_series(n_tracks, n_days)
+            for mode, build in [('legacy', legacy_figure), ('downsampled', downsampled_figure)]:
+                start = time.perf_counter()
+                fig = build(store)
+                build_seconds = time.perf_counter() - start
+                start = time.perf_counter()
+                payload = fig.to_json()
+                results.append({
+                    'mode': mode,
+                    'tracks': n_tracks,
+                    'days': n_days,
+                    'trace_type': fig.data[0].type if fig.data else None,
+                    'build_seconds': round(build_seconds, 4),
+                    'serialize_seconds': round(time.perf_counter() - start, 4),
+                    'payload_bytes': len(payload),
+                })
+                print(results[-1])
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tracks', type=int, nargs='+', default=[10, 100, 500])
+    parser.add_argument('--days', type=int, nargs='+', default=[365, 1095])
+    parser.add_argument('--output', default='benchmarks/results/trend_charts.json')
+    args = parser.parse_args()
+    results = run(args.tracks, args.days)
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
@@ -0,0 +1,350 @@
+import argparse
+import hashlib
+import os
+import threading
+import numpy as np
+import pandas as pd
+from aggregates import date_group_means
+from data_pipeline import datasets, load_static_data, merge_tracks_data
+from filter_engine import FilterEngine
+
+
+
+# audio features of the clustering model (see files/clustering_notebook.ipynb), loudness and tempo are MinMax scaled
+cluster_features = ['danceability', 'energy', 'loudness', 'speechiness', 'acousticness', 'instrumentalness', 'valence', 'tempo']
+scaled_features = ['loudness', 'tempo']
+
+# file of the fitted model (centroids and scaler parameters)
+model_path = "data/clustering_model.npz"
+# clusters exported by the notebook, used to bootstrap the model when there is no model file yet
+notebook_clusters_path = "data/tracks_clustered.csv"
+# colors of the clusters of the Clustering page, whose cluster interpretations are written for the 5 notebook clusters:
+# an installed model must have as many clusters (see `clustering_selection.py --install`)
+cluster_colors = {'0': '#fde725', '1': '#5ec962', '2': '#21918c', '3': '#3b528b', '4': '#440154'}
+# the model can be loaded by several threads at once (the warm-up and the reruns), only one of them bootstraps it
+_bootstrap_lock = threading.Lock()
+
+
+def squared_distances(X, centroids):
+    """Return the squared euclidean distances between the rows of `X` and the centroids, shape `(len(X), len(centroids))`."""
+    distances = (X * X).sum(axis=1)[:, None] - 2 * X @ centroids.T + (centroids * centroids).sum(axis=1)[None, :]
+    return np.maximum(distances, 0)
+
+
+def assign_clusters(X, centroids, batch_size=8192):
+    """
+    Assigns every row of `X` to its nearest centroid, in batches so that the distance matrix stays small.
+
+    Args:
+        X (numpy.ndarray): The points, shape `(n, features)`.
+        centroids (numpy.ndarray): The centroids, shape `(k, features)`.
+        batch_size (int, optional): The number of rows per batch. Defaults to 8192.
+
+    Returns:
+        tuple: The labels (numpy.ndarray of int) and the squared distance of every point to its centroid.
+    """
+    labels = np.empty(len(X), dtype=np.int64)
+    distances = np.empty(len(X), dtype=np.float64)
+    for start in range(0, len(X), batch_size):
+        batch_distances = squared_distances(X[start:start + batch_size], centroids)
+        labels[start:start + batch_size] = batch_distances.argmin(axis=1)
+        distances[start:start + batch_size] = batch_distances[np.arange(len(batch_distances)), labels[start:start + batch_size]]
+    return labels, distances
+
+
+def kmeans_plus_plus(X, k, rng):
+    """Pick `k` initial centroids among the rows of `X` with the k-means++ seeding."""
+    centroids = np.empty((k, X.shape[1]), dtype=np.float64)
+    centroids[0] = X[rng.integers(len(X))]
+    closest = squared_distances(X, centroids[:1])[:, 0]
+    for i in range(1, k):
+        total = closest.sum()
+        index = rng.choice(len(X), p=closest / total) if total > 0 else rng.integers(len(X))
+        centroids[i] = X[index]
+        closest = np.minimum(closest, squared_distances(X, centroids[i:i + 1])[:, 0])
+    return centroids
+
+
+def fit_kmeans(X, k, seed=42, init=None, batch_size=1024, max_iter=300, tol=1e-6):
+    """
+    Fits k-means with mini-batch updates: every iteration assigns a random batch of points to their nearest centroids
+    and moves each centroid towards the mean of its batch points, with a step size decreasing with the number
+    of points the centroid has seen so far.
+
+    Args:
+        X (numpy.ndarray): The points, shape `(n, features)`.
+        k (int): The number of clusters.
+        seed (int, optional): The seed of the random batches and of the k-means++ seeding. Defaults to 42.
+        init (numpy.ndarray, optional): The initial centroids, e.g. of a previous fit (warm start).
+            Defaults to None, i.e. k-means++ seeding.
+        batch_size (int, optional): The number of points per batch. If the data has fewer points, every iteration
+            is a full (Lloyd) iteration. Defaults to 1024.
+        max_iter (int, optional): The maximum number of iterations. Defaults to 300.
+        tol (float, optional): The iterations stop when no centroid moves more than this (squared distance). Defaults to 1e-6.
+
+    Returns:
+        tuple: The centroids, the labels of `X` and the inertia (sum of squared distances to the centroids).
+    """
+    rng = np.random.default_rng(seed)
+    X = np.asarray(X, dtype=np.float64)
+    centroids = kmeans_plus_plus(X, k, rng) if init is None else np.array(init, dtype=np.float64)
+    full_batch = len(X) <= batch_size
+    seen = np.zeros(k, dtype=np.int64)
+    for _ in range(max_iter):
+        batch = X if full_batch else X[rng.choice(len(X), batch_size, replace=False)]
+        labels, _ = assign_clusters(batch, centroids)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, batch)
+        updated = counts > 0
+        if full_batch:
+            new_centroids = centroids.copy()
+            new_centroids[updated] = sums[updated] / counts[updated, None]
+        else:
+            seen += counts
+            # step of every centroid towards its batch mean, 1 / (points seen) per point
+            step = np.zeros(k)
+            step[updated] = counts[updated] / seen[updated]
+            batch_means = np.zeros_like(centroids)
+            batch_means[updated] = sums[updated] / counts[updated, None]
+            new_centroids = centroids + step[:, None] * (batch_means - centroids)
+        shift = ((new_centroids - centroids) ** 2).sum(axis=1).max()
+        centroids = new_centroids
+        if shift <= tol:
+            break
+    labels, distances = assign_clusters(X, centroids)
+    return centroids, labels, distances.sum()
+
+
+class ClusteringModel:
+    """k-means model of the tracks' audio features: the MinMax scaler parameters and the centroids.
+
+    Args:
+        centroids (numpy.ndarray): The centroids in the scaled feature space, shape `(k, len(cluster_features))`.
+        scale_min (numpy.ndarray): The minimum of every feature of `scaled_features`.
+        scale_max (numpy.ndarray): The maximum of every feature of `scaled_features`.
+    """
+
+    def __init__(self, centroids, scale_min, scale_max):
+        self.centroids = np.asarray(centroids, dtype=np.float64)
+        self.scale_min = np.asarray(scale_min, dtype=np.float64)
+        self.scale_max = np.asarray(scale_max, dtype=np.float64)
+
+    @property
+    def k(self):
+        return len(self.centroids)
+
+    @property
+    def version(self):
+        """Hash of the model parameters, e.g. to key the data derived from its labels."""
+        sha256 = hashlib.sha256()
+        for array in (self.centroids, self.scale_min, self.scale_max):
+            sha256.update(np.ascontiguousarray(array).tobytes())
+        return sha256.hexdigest()[:16]
+
+    @staticmethod
+    def fit_scaler(tracks):
+        """Return the MinMax scaler parameters (minimum and maximum of `scaled_features`) of the tracks."""
+        values = tracks[scaled_features].to_numpy(dtype=np.float64)
+        return values.min(axis=0), values.max(axis=0)
+
+    def scale(self, tracks):
+        """Return the MinMax scaled `scaled_features` of the tracks, shape `(len(tracks), len(scaled_features))`."""
+        values = tracks[scaled_features].to_numpy(dtype=np.float64)
+        return (values - self.scale_min) / (self.scale_max - self.scale_min)
+
+    def transform(self, tracks):
+        """Return the feature matrix of the tracks, with `scaled_features` scaled."""
+        X = tracks[cluster_features].to_numpy(dtype=np.float64)
+        X[:, [cluster_features.index(feature) for feature in scaled_features]] = self.scale(tracks)
+        return X
+
+    def assign(self, tracks):
+        """
+        Labels the tracks with their nearest centroid, e.g. the new tracks of the daily ETL.
+
+        Args:
+            tracks (pandas.DataFrame): The tracks, with the `cluster_features` columns.
+
+        Returns:
+            numpy.ndarray: The cluster of every track.
+        """
+        labels, _ = assign_clusters(self.transform(tracks), self.centroids)
+        return labels
+
+    @classmethod
+    def fit(cls, tracks, k=5, seed=42, **kwargs):
+        """
+        Fits a new model on the tracks (see `fit_kmeans` for the keyword arguments).
+
+        Returns:
+            ClusteringModel: The model.
+        """
+        model = cls(np.zeros((k, len(cluster_features))), *cls.fit_scaler(tracks))
+        model.centroids, _, _ = fit_kmeans(model.transform(tracks), k, seed=seed, **kwargs)
+        return model
+
+    def refit(self, tracks, seed=42, **kwargs):
+        """
+        Refits the model on the tracks, starting from the current centroids (warm start) and keeping the scaler,
+        so the clusters keep their numbers and only move with the new data.
+
+        Returns:
+            ClusteringModel: The refitted model.
+        """
+        centroids, _, _ = fit_kmeans(self.transform(tracks), self.k, seed=seed, init=self.centroids, **kwargs)
+        return ClusteringModel(centroids, self.scale_min, self.scale_max)
+
+    @classmethod
+    def from_labels(cls, tracks, labels):
+        """
+        Builds the model of an existing clustering, e.g. the notebook's: the scaler is fitted on the tracks
+        and the centroids are the means of the clusters.
+
+        Args:
+            tracks (pandas.DataFrame): The tracks, with the `cluster_features` columns.
+            labels (array-like): The cluster of every track, from 0 to k - 1.
+
+        Returns:
+            ClusteringModel: The model.
+        """
+        labels = np.asarray(labels, dtype=np.int64)
+        model = cls(np.zeros((labels.max() + 1, len(cluster_features))), *cls.fit_scaler(tracks))
+        X = model.transform(tracks)
+        counts = np.bincount(labels)
+        sums = np.zeros_like(model.centroids)
+        np.add.at(sums, labels, X)
+        model.centroids = sums / counts[:, None]
+        return model
+
+    def save(self, path=model_path):
+        """Persist the model, written to a temporary file first so that it is never left half-written."""
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f, centroids=self.centroids, scale_min=self.scale_min, scale_max=self.scale_max,
+                     features=np.array(cluster_features))
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path=model_path):
+        """Load a model saved with `save`."""
+        with np.load(path, allow_pickle=False) as saved:
+            if saved['features'].tolist() != cluster_features:
+                raise ValueError(f"The model at {path} was fitted on other features: {saved['features'].tolist()}")
+            return cls(saved['centroids'], saved['scale_min'], saved['scale_max'])
+
+
+def load_model(path=model_path):
+    """
+    Loads the clustering model, bootstrapping it from the notebook's clusters (see `ClusteringModel.from_labels`)
+    the first time, so that the clusters keep the numbers (and interpretations) of the notebook.
+
+    Returns:
+        ClusteringModel: The model.
+    """
+    with _bootstrap_lock:
+        if not os.path.exists(path):
+            clustered = pd.read_csv(notebook_clusters_path, usecols=cluster_features + ['cluster'])
+            ClusteringModel.from_labels(clustered, clustered['cluster']).save(path)
+            print(f"Bootstrapped the clustering model from {notebook_clusters_path}")
+    return ClusteringModel.load(path)
+
+
+def cluster_tracks(tracks, model):
+    """
+    Labels the tracks with the model and adds the scaled features shown on the Clustering page.
+
+    Args:
+        tracks (pandas.DataFrame): The tracks, with the `cluster_features` columns.
+        model (ClusteringModel): The clustering model.
+
+    Returns:
+        pandas.DataFrame: A copy of the tracks with the columns 'cluster', 'loudness_scaled' and 'tempo_scaled'.
+    """
+    tracks = tracks.copy()
+    tracks['cluster'] = model.assign(tracks).astype(np.uint8)
+    tracks[[f'{feature}_scaled' for feature in scaled_features]] = model.scale(tracks)
+    return tracks
+
+
+def load_tracks():
+    """Return the tracks of the static tables with their audio features, one version per artist and track name."""
+    artists_table, albums_table, tracks_table, tracks_features_table = load_static_data()
+    tracks = merge_tracks_data(tracks_table, albums_table, artists_table, tracks_features_table)
+    return tracks.drop_duplicates(['artist_name', 'original_track_name'])
+
+
+
+################################################
+# Datasets of the Clustering page (see `data_pipeline.datasets`)
+@datasets.dataset('clustering_model')
+def clustering_model():
+    # the model file is one of the sources of the data snapshot, so a refit model is picked up by its next refresh
+    return load_model()
+
+
+@datasets.dataset('clustered_data', depends_on=('static_tables', 'tracks_data', 'clustering_model'))
+def clustered_data(static_tables, tracks_data, clustering_model):
+    """
+    Labels the tracks of the data snapshot with the clustering model and merges them with their current track popularity.
+
+    This function performs the following steps:
+    1. Merges the static tables into the tracks with their audio features.
+    2. Keeps the tracks of the snapshot (the most popular version of every track) with their current track popularity.
+    3. Labels the tracks with their nearest cluster and adds the scaled features (see `cluster_tracks`),
+       so new tracks are clustered as soon as they are ingested.
+    4. Converts the 'cluster' column to string type.
+    5. Numbers the tracks in a column 'track_number', the compact id of the tracks in the scatter plot.
+
+    Returns:
+        pandas.DataFrame: The clustered tracks.
+    """
+    artists_table, albums_table, tracks_table, tracks_features_table = static_tables
+    data = merge_tracks_data(tracks_table, albums_table, artists_table, tracks_features_table)
+    data = pd.merge(data, tracks_data[['track_id', 'current_track_popularity']], on='track_id')
+    data = cluster_tracks(data, clustering_model)
+    data = data.astype({'cluster': 'str'})
+    data['track_number'] = np.arange(len(data), dtype=np.int32)
+    return data
+
+
+@datasets.dataset('clustering_filter_engine', depends_on=('clustered_data',))
+def clustering_filter_engine(clustered_data):
+    # the popularity range and artist filters of the Clustering page, holding the clustered data in its `data` attribute
+    return FilterEngine(clustered_data, ['current_track_popularity'])
+
+
+@datasets.dataset('cluster_popularity_trend', depends_on=('clustered_data', 'clustering_model', 'tracks_popularity_table'))
+def cluster_popularity_trend(clustered_data, clustering_model, tracks_popularity_table):
+    """
+    Returns the mean track popularity by date and cluster, read from a materialized aggregate of sums and counts
+    (see `aggregates.date_group_means`), which only aggregates the days synced since its last update
+    and is rebuilt if the model changes. The rows of the tracks whose cluster changed (new tracks, or another most popular
+    version of a track) are moved to their new cluster (see `aggregates.DateGroupAggregate.regroup`).
+
+    Returns:
+        pandas.DataFrame: The columns 'date', 'cluster' and 'track_popularity'.
+    """
+    cluster_of = clustered_data.set_index('track_id')['cluster']
+    return (date_group_means('tracks_popularity_by_cluster', tracks_popularity_table, 'track_popularity',
+                             key_column='track_id', group_of=cluster_of, groups_key=clustering_model.version)
+            .rename(columns={'group': 'cluster', 'mean': 'track_popularity'})
+            )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Refit the clustering model of the Clustering page on the current tracks.')
+    parser.add_argument('--k', type=int, default=None,
+                        help='fit a new model with k clusters (k-means++ seeding) instead of warm-starting from the current model')
+    parser.add_argument('--seed', type=int, default=42, help='random seed of the batches and of the seeding')
+    parser.add_argument('--batch-size', type=int, default=1024, help='number of tracks per mini-batch')
+    args = parser.parse_args()
+
+    tracks = load_tracks()
+    if args.k is None:
+        model = load_model().refit(tracks, seed=args.seed, batch_size=args.batch_size)
+    else:
+        model = ClusteringModel.fit(tracks, k=args.k, seed=args.seed, batch_size=args.batch_size)
+    model.save()
+    labels = model.assign(tracks)
+    print(f"Saved the clustering model ({model.k} clusters, version {model.version}) to {model_path}")
+    print('Tracks per cluster:', dict(enumerate(np.bincount(labels, minlength=model.k).tolist())))
@@ -1,130 +1,48 @@
 import streamlit as st
-import streamlit.components.v1 as components
 import pandas as pd
 import plotly.graph_objects as go
-import plotly.express as px
 #import plotly.colors
 import numpy as np
-from connect_to_database import load_from_db
+from clustering import cluster_colors
+from data_snapshot import get_snapshot
+from figure_cache import show_figure
+from scatter_charts import build_group_scatter_traces, lookup_point, max_scatter_points
+from functions import lazy_tabs, load_datasets, show_html_file
+from tracing import span, traced
 
 
 
 
-@st.cache_data(ttl="1d")
-def get_clustered_data(file_path):
+@traced('clustering.scatter_figure')
+def cluster_scatter_plot(df, x, y, z, max_points=max_scatter_points):
     """
-    Reads a CSV file, processes the data, and merges it with cached clustering data.
-
-    This function performs the following steps:
-    1. Reads the CSV file from the provided file path.
-    2. Converts the 'cluster' column to string type.
-    3. Creates a new column 'hover_info' by concatenating 'original_track_name' and 'artist_name'.
-    4. Checks for 'cached_clustering_data' in the session state and raises a KeyError if not found.
-    5. Merges the read data with the cached clustering data on 'track_id'.
-    6. Returns the processed DataFrame.
-
-    If any error occurs during these steps, an error message is displayed using Streamlit's error handling, 
-    and the function returns None.
-
-    Parameters:
-    file_path (str): The file path of the CSV file to be read.
-
-    Returns:
-    pd.DataFrame: The processed DataFrame containing the merged data.
-    None: If an error occurs during processing.
-    """
-    try:
-        data = pd.read_csv(file_path)
-        data = data.astype({'cluster': 'str'})
-        data['hover_info'] = data['original_track_name'] + ' by ' + data['artist_name']
-        
-        if 'cached_clustering_data' not in st.session_state:
-            raise KeyError("cached_clustering_data not found in session state")
-        
-        cached_data = st.session_state['cached_clustering_data']
-        data = pd.merge(data, cached_data, on='track_id')
-        
-        return data
-    except Exception as e:
-        st.error(f"An error occurred: {e}")
-        return None
-
-
-# mean popularity by cluster
-@st.cache_data(ttl="1d")
-def clustered_data_trend():
-    """
-    Reads track data, merges them, and calculates the mean popularity of tracks
-    grouped by date and cluster.
-
-    The function performs the following steps:
-    1. Reads 'track_id' and 'track_name' from 'data/tracks_table.csv'.
-    2. Reads 'track_id' and 'cluster' from 'data/tracks_clustered.csv'.
-    3. Reads all columns from 'data/tracks_popularity_table.csv'.
-    4. Merges the data from the three CSV files on 'track_id'.
-    5. Groups the merged data by 'date' and 'cluster', and calculates the mean 'track_popularity'.
-    6. Returns the grouped data as a DataFrame.
-
-    Returns:
-        pd.DataFrame: A DataFrame containing the mean popularity of tracks grouped by date and cluster.
-    """
-    # read the data
-    tracks_table = pd.read_csv('data/tracks_table.csv')[['track_id', 'track_name']]
-    tracks_clustered = pd.read_csv('data/tracks_clustered.csv')[['track_id', 'cluster']]
-    tracks_clustered['cluster'] = tracks_clustered['cluster'].astype(str)
-    #tracks_popularity = pd.read_csv('data/tracks_popularity_table.csv')
-    try:
-        if 'cached_tracks_popularity_table' not in st.session_state:
-            raise KeyError("cached_tracks_popularity_table not found in session state")
-        tracks_popularity = st.session_state['cached_tracks_popularity_table']
-        #sql = '''SELECT * FROM tracks_popularity_table '''
-        #tracks_popularity = load_from_db(sql)
-        tracks_data = pd.merge(tracks_table, tracks_clustered, on='track_id')
-        tracks_data = pd.merge(tracks_data, tracks_popularity, on='track_id')
-        # group by date and cluster aggregating the mean popularity
-        group = (tracks_data
-                .groupby(['date', 'cluster'])
-                .agg({'track_popularity': 'mean'})
-                .reset_index()
-        )
-        return group
-    except Exception as e:
-        st.error(f"An error occurred: {e}")
-        return None          
-             
-             
-def cluster_scatter_plot(df, x, y, z):
-    """
-    Generate a 3D scatter plot with clustered data.
+    Generate a 3D scatter plot with clustered data, one WebGL trace per cluster built from the NumPy arrays of the
+    columns (see `scatter_charts.build_group_scatter_traces`). The tracks are shown on hover by their number,
+    looked up below the plot.
 
     Args:
         df (pandas.DataFrame): The input dataframe containing the data.
         x (str): The column name for the x-axis.
         y (str): The column name for the y-axis.
         z (str): The column name for the z-axis.
+        max_points (int, optional): The number of tracks drawn, sampled per cluster. Defaults to `max_scatter_points`.
 
     Returns:
         plotly.graph_objects.Figure: The generated 3D scatter plot.
     """
-    fig = px.scatter_3d(
-        data_frame=df,
-        x=x,
-        y=y,
-        z=z,
-        opacity=1,
-        color='cluster',
-        color_discrete_map={'0': '#fde725', '1': '#5ec962', '2': '#21918c',
-                            '3': '#3b528b', '4': '#440154'},
-        category_orders={'cluster': ['0', '1', '2', '3', '4']},
-        hover_name='hover_info',
+    traces = build_group_scatter_traces(df, 'cluster', [x, y, z], group_order=list(cluster_colors), colors=cluster_colors,
+                                        id_column='track_number', marker=dict(size=4, opacity=1), max_points=max_points)
+    fig = go.Figure(data=traces)
+    fig.update_layout(
+        scene=dict(xaxis_title=x, yaxis_title=y, zaxis_title=z),
+        legend=dict(title_text='cluster', tracegroupgap=0),
+        # margins
+        margin=dict(l=0, r=0, b=0, t=0),
     )
-    # Update marker size
-    fig.update_traces(marker=dict(size=4))
-    # margins
-    fig.update_layout(margin=dict(l=0, r=0, b=0, t=0))
     return fig
 
 
+@traced('clustering.heatmap_figure')
 def cluster_features_heatmap(clustered_data):
     group = (clustered_data
             .groupby('cluster')[['danceability', 'energy', 'loudness_scaled', 'speechiness', 'acousticness', 'instrumentalness', 'liveness', 'valence', 'tempo_scaled']]
@@ -165,15 +83,43 @@ def cluster_features_heatmap(clustered_data):
     return fig
 
 
+@traced('clustering.cluster_counts_figure')
+def cluster_counts_bar_chart(filtered_data, selected_artist):
+    group = (filtered_data
+            .groupby(['artist_name', 'cluster'])
+            .agg({'track_id': 'count'})
+            .reset_index()
+            .groupby('cluster')
+            .agg({'track_id': 'sum'})
+            .reset_index()
+    )
+    # Convert cluster to categorical type to ensure categorical treatment
+    group['cluster_display'] = group['cluster'].apply(lambda x: f'Cluster {x}')
+    # Create the bar plot
+    import plotly.express as px
+    fig = px.bar(
+        group, 
+        x='cluster_display', 
+        y='track_id',
+        labels={'track_id': 'Number of Tracks', 'cluster': 'Cluster'},
+        title=f'Number of Tracks per Cluster for {selected_artist}',
+        text='track_id',
+        category_orders={'cluster_display': ['0', '1', '2', '3', '4']}
+    )
+    fig.update_traces(textposition='outside')
+    return fig
+
+
+@traced('clustering.trend_figure')
 def cluster_trend_plot(clustered_data_trend):
+    import plotly.express as px
     fig = px.line(
         clustered_data_trend,
         x='date',
         y='track_popularity',
         color='cluster',
-        color_discrete_map={'0': '#fde725', '1': '#5ec962', '2': '#21918c',
-                            '3': '#3b528b', '4': '#440154'},
-        category_orders={'cluster': ['0', '1', '2', '3', '4']},
+        color_discrete_map=cluster_colors,
+        category_orders={'cluster': list(cluster_colors)},
         labels={'track_popularity': 'Mean Track Popularity', 'cluster': 'Cluster'},
         #title='Popularity Trend by Cluster'
     )
@@ -182,8 +128,10 @@ def cluster_trend_plot(clustered_data_trend):
 #########################
 # App interface
 st.title('📊 Clustering Analysis')
-# get the clustered data
-clustered_data = get_clustered_data(file_path='data/tracks_clustered.csv')
+# get the clustered data and its filter engine, built (on first use) with the clustering model of the data snapshot
+snapshot = get_snapshot()
+filter_engine, = load_datasets(snapshot, 'clustering_filter_engine')
+clustered_data = filter_engine.data
 
 
 # sidebar
@@ -194,14 +142,13 @@ selected_track_popularity = st.sidebar.slider('Select a Track Popularity Range',
 
 artist_options = ['All Artists'] + clustered_data['artist_name'].unique().tolist()
 selected_artist = st.sidebar.selectbox('Select an Artist', artist_options, key='artist_selection_scatter_plot')
-    
-if selected_artist == 'All Artists':
-    filtered_data = clustered_data
-else:
-    filtered_data = clustered_data.query('artist_name == @selected_artist')
 
-# filter the data based on the selected track popularity range
-filtered_data = filtered_data.query('current_track_popularity >= @selected_track_popularity[0] & current_track_popularity <= @selected_track_popularity[1]')
+# filter the data based on the selected artist and track popularity range
+with span('clustering.filter'):
+    filtered_data = filter_engine.select({'current_track_popularity': selected_track_popularity},
+                                         artists=None if selected_artist == 'All Artists' else [selected_artist])
+# the figures of the filtered data are cached per data snapshot and filters (see `figure_cache`)
+filter_state = {'popularity': selected_track_popularity, 'artist': selected_artist}
 
 
 # cluster interpretation
@@ -223,91 +170,59 @@ This cluster includes non-instrumental acoustic tracks that have low energy and
 This cluster consists of instrumental tracks that are positive in mood and highly energetic.</p>
 '''
 
-tab1, tab2, tab3, tab4, tab5 = st.tabs(['3D Scatter Plot', 'Features Heatmap', 'Number of Tracks', 'Popularity Trend by Cluster', 'Jupyter Notebooks'])
-with tab1:
+# only the selected tab is built (see `lazy_tabs`), e.g. the notebooks are only read and sent when they are shown
+tab1, tab2, tab3, tab4, tab5 = lazy_tabs(['3D Scatter Plot', 'Features Heatmap', 'Number of Tracks', 'Popularity Trend by Cluster', 'Jupyter Notebooks'], key='clustering_tab')
+if tab1:
     # Display the scatter plot
     st.write('#### 3D Scatter Plot of Clusters')
     z = st.selectbox('Select z-axis', ['instrumentalness', 'acousticness' ])
-    fig = cluster_scatter_plot(filtered_data, x='energy', y='valence', z=z)
-    st.plotly_chart(fig, use_container_width=True)
+    show_figure('clustering.scatter', snapshot.version, {**filter_state, 'z': z},
+                lambda: cluster_scatter_plot(filtered_data, x='energy', y='valence', z=z), use_container_width=True)
+    if len(filtered_data) > max_scatter_points:
+        st.caption(f'Showing {max_scatter_points:,} of the {len(filtered_data):,} tracks, sampled in proportion to the size of every cluster.')
+    # the tracks are numbered on hover, looked up here instead of sending the name of every track with the plot
+    track_number = st.number_input('Look up a track by its number (#)', min_value=0, max_value=len(clustered_data) - 1,
+                                   value=None, step=1, key='cluster_scatter_track_number')
+    if track_number is not None:
+        track = lookup_point(clustered_data, 'track_number', track_number)
+        st.write(f"**{track['original_track_name']}** by {track['artist_name']}: cluster {track['cluster']}, "
+                 f"popularity {track['current_track_popularity']}")
     # cluster interpretation
     st.markdown(html_content, unsafe_allow_html=True)
     
-with tab2:
+if tab2:
     st.write('#### Heatmap of Average Feature Values by Cluster')
     st.write('The aggregation has been applied to all tracks in the dataset. Sidebar filters are not applied to this plot.')
     # Show the figure
-    fig = cluster_features_heatmap(clustered_data)
-    st.plotly_chart(fig, use_container_width=True)
+    show_figure('clustering.heatmap', snapshot.version, {}, lambda: cluster_features_heatmap(clustered_data), use_container_width=True)
     # cluster interpretation
     st.markdown(html_content, unsafe_allow_html=True)
 
-with tab3:
+if tab3:
     # Display the number of tracks per cluster by artist
-    group = (filtered_data
-            .groupby(['artist_name', 'cluster'])
-            .agg({'track_id': 'count'})
-            .reset_index()
-            .groupby('cluster')
-            .agg({'track_id': 'sum'})
-            .reset_index()
-    )
-    # Convert cluster to categorical type to ensure categorical treatment
-    group['cluster_display'] = group['cluster'].apply(lambda x: f'Cluster {x}')
-    # Create the bar plot
-    fig = px.bar(
-        group, 
-        x='cluster_display', 
-        y='track_id',
-        labels={'track_id': 'Number of Tracks', 'cluster': 'Cluster'},
-        title=f'Number of Tracks per Cluster for {selected_artist}',
-        text='track_id',
-        category_orders={'cluster_display': ['0', '1', '2', '3', '4']}
-    )
-    fig.update_traces(textposition='outside')
-    st.plotly_chart(fig, use_container_width=True)
+    show_figure('clustering.cluster_counts', snapshot.version, filter_state,
+                lambda: cluster_counts_bar_chart(filtered_data, selected_artist), use_container_width=True)
     # cluster interpretation
     st.markdown(html_content, unsafe_allow_html=True)
     
-with tab4:
+if tab4:
     st.write('#### Mean Popularity Trend by Cluster')
     st.write('''The following plot displays the mean popularity of tracks by cluster and date. 
              The aggregation has been applied to all tracks in the dataset. Sidebar filters are not applied to this plot.''')
-    # Get the popularity trend data
-    popularity_data = clustered_data_trend()
-    # Create the line plot
-    fig = cluster_trend_plot(popularity_data)  
-    st.plotly_chart(fig, use_container_width=True)
+    # Create the line plot of the popularity trend data, built on a miss only
+    show_figure('clustering.trend', snapshot.version, {},
+                lambda: cluster_trend_plot(load_datasets(snapshot, 'cluster_popularity_trend')[0]), use_container_width=True)
     # cluster interpretation
     st.markdown(html_content, unsafe_allow_html=True)
     
-with tab5:
-    tab51, tab52 = st.tabs(['Exploratory Data Analysis', 'Clustering'])
+if tab5:
+    tab51, tab52 = lazy_tabs(['Exploratory Data Analysis', 'Clustering'], key='clustering_notebook_tab')
     # EDA notebook tab
-    with tab51:
+    if tab51:
         st.write('#### Exploratory Data Analysis')
-        path_to_html = "files/EDA.html" 
-        with open(path_to_html, 'r', encoding='utf-8') as f:
-            html_data = f.read()
         # display the HTML content
-        st.components.v1.html(html_data, scrolling=True, height=1000, width=1100)
+        show_html_file("files/EDA.html")
     # clustering notebook tab
-    with tab52:
+    if tab52:
         st.write('#### Clustering Analysis')
-        path_to_html = "files/clustering_notebook.html" 
-        with open(path_to_html, 'r', encoding='utf-8') as f:
-            html_data = f.read()
-        # display the HTML content
-        st.components.v1.html(html_data, scrolling=True, height=1000, width=1100)
-
-
-
-
-
-
-
-
-
-
-
-
+        show_html_file("files/clustering_notebook.html")
@@ -0,0 +1,209 @@
+"""Model selection of the clustering: fits k-means for every (k, seed) pair in a process pool and ranks the fits.
+
+Every fit is scored with the silhouette on a stratified sample of the tracks (the exact silhouette is O(n^2))
+and the Davies-Bouldin index on all the tracks (it only needs the distances to the centroids).
+The features are prepared as for the Clustering page (see `clustering.ClusteringModel.transform`).
+
+Run from the repository root:
+    python clustering_selection.py --k 2 3 4 5 6 7 8 9 10 --seeds 0 1 2 3 4 --output data/clustering_selection
+
+The ranked report is written to `<output>/report.json` and the centroids of the chosen fit to `<output>/model.npz`,
+which the Clustering page uses after `--install` (or after copying it to `data/clustering_model.npz`). Only a model
+with the clusters of the page (`clustering.cluster_colors`, the 5 clusters of the notebook) can be installed.
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from clustering import ClusteringModel, cluster_colors, fit_kmeans, load_tracks, model_path, squared_distances
+
+
+
+def silhouette_sample(labels, sample_size, rng):
+    """
+    Returns the positions of a sample stratified by cluster: every cluster is sampled in proportion to its size,
+    with at least two points per cluster (when it has them) so that its silhouette is defined.
+
+    Args:
+        labels (numpy.ndarray): The cluster of every point.
+        sample_size (int): The approximate size of the sample.
+        rng (numpy.random.Generator): The random generator.
+
+    Returns:
+        numpy.ndarray: The sorted positions of the sampled points.
+    """
+    if sample_size >= len(labels):
+        return np.arange(len(labels))
+    positions = []
+    for cluster in np.unique(labels):
+        members = np.flatnonzero(labels == cluster)
+        size = min(len(members), max(2, round(sample_size * len(members) / len(labels))))
+        positions.append(rng.choice(members, size, replace=False))
+    return np.sort(np.concatenate(positions))
+
+
+def silhouette_score(X, labels):
+    """
+    Returns the mean silhouette of the points, from their pairwise distances: `(b - a) / max(a, b)` with `a` the mean
+    distance to the other points of the cluster and `b` the mean distance to the points of the nearest other cluster.
+    Points alone in their cluster have a silhouette of 0.
+
+    Args:
+        X (numpy.ndarray): The points, shape `(n, features)`. The cost is O(n^2), see `silhouette_sample`.
+        labels (numpy.ndarray): The cluster of every point, from 0 to k - 1.
+
+    Returns:
+        float: The mean silhouette, between -1 and 1 (higher is better).
+    """
+    k = labels.max() + 1
+    distances = np.sqrt(squared_distances(X, X))
+    # sum of the distances of every point to the points of every cluster
+    one_hot = np.zeros((len(X), k))
+    one_hot[np.arange(len(X)), labels] = 1
+    sums = distances @ one_hot
+    counts = one_hot.sum(axis=0)
+    own = np.arange(len(X)), labels
+    own_counts = counts[labels]
+    a = np.where(own_counts > 1, sums[own] / np.maximum(own_counts - 1, 1), 0)
+    mean_distances = np.divide(sums, counts, out=np.full_like(sums, np.inf), where=counts > 0)
+    mean_distances[own] = np.inf
+    b = mean_distances.min(axis=1)
+    silhouettes = np.where(own_counts > 1, (b - a) / np.maximum(np.maximum(a, b), 1e-12), 0)
+    return float(silhouettes.mean())
+
+
+def davies_bouldin_score(X, labels, centroids):
+    """
+    Returns the Davies-Bouldin index of a clustering: the mean over the clusters of the highest ratio
+    `(s_i + s_j) / d(c_i, c_j)` to another cluster, with `s_i` the mean distance of the points of cluster `i`
+    to its centroid `c_i`.
+
+    Returns:
+        float: The index, 0 or more (lower is better).
+    """
+    k = len(centroids)
+    distances = np.sqrt(squared_distances(X, centroids)[np.arange(len(X)), labels])
+    counts = np.bincount(labels, minlength=k)
+    scatter = np.bincount(labels, weights=distances, minlength=k) / np.maximum(counts, 1)
+    separation = np.sqrt(squared_distances(centroids, centroids))
+    np.fill_diagonal(separation, np.inf)
+    ratios = (scatter[:, None] + scatter[None, :]) / np.maximum(separation, 1e-12)
+    return float(ratios.max(axis=1).mean())
+
+
+# feature matrix of the tracks, set once in every worker process of the pool
+_X = None
+
+
+def init_worker(X):
+    global _X
+    _X = X
+
+
+def evaluate(k, seed, sample_size, batch_size):
+    """
+    Fits k-means with `k` clusters and `seed` on the features of the worker (see `init_worker`) and scores the fit.
+
+    Returns:
+        dict: The parameters, the scores, the centroids and the fit time of the fit.
+    """
+    start = time.perf_counter()
+    centroids, labels, inertia = fit_kmeans(_X, k, seed=seed, batch_size=batch_size)
+    fit_seconds = time.perf_counter() - start
+    sample = silhouette_sample(labels, sample_size, np.random.default_rng(seed))
+    return {
+        'k': k,
+        'seed': seed,
+        'inertia': float(inertia),
+        'silhouette': silhouette_score(_X[sample], labels[sample]),
+        'davies_bouldin': davies_bouldin_score(_X, labels, centroids),
+        'cluster_sizes': np.bincount(labels, minlength=k).tolist(),
+        'fit_seconds': fit_seconds,
+        'seconds': time.perf_counter() - start,
+        'centroids': centroids,
+    }
+
+
+def run(X, ks, seeds, sample_size=2000, batch_size=1024, max_workers=None, rank_by='silhouette'):
+    """
+    Fits and scores every (k, seed) pair in a process pool and ranks the fits.
+
+    Args:
+        X (numpy.ndarray): The features of the tracks.
+        ks (list): The numbers of clusters.
+        seeds (list): The seeds.
+        sample_size (int, optional): The size of the stratified sample of the silhouette. Defaults to 2000.
+        batch_size (int, optional): The mini-batch size of the fits. Defaults to 1024.
+        max_workers (int, optional): The number of processes. Defaults to the number of CPUs.
+        rank_by (str, optional): 'silhouette' (descending) or 'davies_bouldin' (ascending). Defaults to 'silhouette'.
+
+    Returns:
+        list: The results of `evaluate`, best first, with their 'rank'.
+    """
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker, initargs=(X,)) as executor:
+        futures = [executor.submit(evaluate, k, seed, sample_size, batch_size) for k in ks for seed in seeds]
+        results = [future.result() for future in futures]
+    if rank_by == 'silhouette':
+        results.sort(key=lambda result: (-result['silhouette'], result['davies_bouldin']))
+    else:
+        results.sort(key=lambda result: (result['davies_bouldin'], -result['silhouette']))
+    for rank, result in enumerate(results, start=1):
+        result['rank'] = rank
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--k', type=int, nargs='+', default=list(range(2, 11)), help='numbers of clusters')
+    parser.add_argument('--seeds', type=int, nargs='+', default=[0, 1, 2, 3, 4], help='seeds of every k')
+    parser.add_argument('--sample-size', type=int, default=2000, help='size of the stratified sample of the silhouette')
+    parser.add_argument('--batch-size', type=int, default=1024, help='number of tracks per mini-batch')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes, defaults to the number of CPUs')
+    parser.add_argument('--rank-by', choices=['silhouette', 'davies_bouldin'], default='silhouette')
+    parser.add_argument('--output', default='data/clustering_selection', help='directory of the report and of the chosen model')
+    parser.add_argument('--install', action='store_true',
+                        help=f'also save the chosen model to {model_path}, for the Clustering page; only a model '
+                             f'with {len(cluster_colors)} clusters, the clusters of the page, can be installed')
+    args = parser.parse_args()
+    if args.install and len(cluster_colors) not in args.k:
+        parser.error(f"--install needs a model with {len(cluster_colors)} clusters, add it to --k")
+
+    start = time.perf_counter()
+    tracks = load_tracks()
+    scale_min, scale_max = ClusteringModel.fit_scaler(tracks)
+    X = ClusteringModel(np.zeros((1, 1)), scale_min, scale_max).transform(tracks)
+    results = run(X, args.k, args.seeds, args.sample_size, args.batch_size, args.workers, args.rank_by)
+    elapsed = time.perf_counter() - start
+
+    chosen = results[0]
+    model = ClusteringModel(chosen['centroids'], scale_min, scale_max)
+    os.makedirs(args.output, exist_ok=True)
+    model.save(os.path.join(args.output, 'model.npz'))
+    report = {
+        'tracks': len(tracks),
+        'sample_size': args.sample_size,
+        'rank_by': args.rank_by,
+        'seconds': elapsed,
+        'chosen': {'k': chosen['k'], 'seed': chosen['seed'], 'model_version': model.version},
+        'results': [{key: value for key, value in result.items() if key != 'centroids'} for result in results],
+    }
+    with open(os.path.join(args.output, 'report.json'), 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    install = args.install and chosen['k'] == len(cluster_colors)
+    if install:
+        shutil.copyfile(os.path.join(args.output, 'model.npz'), model_path)
+
+    print(f"{len(results)} fits of {len(tracks)} tracks in {elapsed:.2f}s, ranked by {args.rank_by}:")
+    print(f"{'rank':>4} {'k':>3} {'seed':>4} {'silhouette':>10} {'davies_bouldin':>14} {'inertia':>10}")
+    for result in results[:10]:
+        print(f"{result['rank']:>4} {result['k']:>3} {result['seed']:>4} {result['silhouette']:>10.4f} "
+              f"{result['davies_bouldin']:>14.4f} {result['inertia']:>10.2f}")
+    print(f"Chosen: k={chosen['k']}, seed={chosen['seed']}, saved to {os.path.join(args.output, 'model.npz')}"
+          + (f" and {model_path}" if install else ''))
+    if args.install and not install:
+        # the colors and the cluster interpretations of the Clustering page are written for its clusters
+        raise SystemExit(f"Not installed: the chosen model has {chosen['k']} clusters, the Clustering page needs "
+                         f"{len(cluster_colors)} (run with --k {len(cluster_colors)} to install its best fit)")
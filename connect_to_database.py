@@ -1,14 +1,18 @@
-import pypyodbc as odbc
-import pyodbc
-from sqlalchemy import create_engine
-from sqlalchemy.pool import StaticPool
 import pandas as pd
-from dotenv import load_dotenv
+from contextlib import contextmanager
+import json
 import os
+import random
+import threading
 import time
 import streamlit as st
+from schema import apply_schema, concat_tables
+from tracing import span
 
 
+# The database driver (pyodbc) and SQLAlchemy are imported on the first connection, not with this module: every page
+# imports it, but the reruns served from the data snapshot never query the database (see `benchmarks.import_time`).
+
 
 def set_connection_string():
     # connect to database
@@ -18,6 +22,7 @@ def set_connection_string():
 
     # load credentials
     try:
+        #from dotenv import load_dotenv
         #load_dotenv()
         # get password locally
         #password = os.getenv("PASSWORD")
@@ -44,99 +49,204 @@ def set_connection_string():
 
 
 # connect to database using pyodbc (without SQLAlchemy)
-def database_connection(connection_string, max_retries=15, retry_delay=1):
-    """Connect to SQL Server using pyodbc
+def database_connection(connection_string, max_retries=6, retry_delay=0.5, max_delay=30):
+    """Connect to SQL Server using pyodbc, retrying with exponential backoff and jitter
 
     Args:
         connection_string (string): The connection string to the database
-        max_retries (int, optional): Max number of retries. Defaults to 15.
-        retry_delay (int, optional): Number of seconds to delay between retries. Defaults to 1.
+        max_retries (int, optional): Max number of retries. Defaults to 6.
+        retry_delay (float, optional): Base number of seconds to delay between retries, doubled after every failed attempt. Defaults to 0.5.
+        max_delay (float, optional): Upper bound of the delay between retries in seconds. Defaults to 30.
 
     Returns:
         odbc connection: The connection to the database
+
+    Raises:
+        ConnectionError: If the connection failed after `max_retries` attempts.
     """
-    attempts = 0
-    while attempts < max_retries:
+    import pyodbc
+    #import pypyodbc as odbc
+    for attempt in range(max_retries):
         try:
             #conn = odbc.connect(connection_string)
             conn = pyodbc.connect(connection_string)
             return conn
         except Exception as e:
             #logging.error(f"An exception occurred: connect with DB failed (Attempt {attempts + 1}/{max_retries})", exc_info=False)
-            attempts += 1
-            time.sleep(retry_delay)
-            print(f"Failed to connect to the database. Exception raised: {e}")
-    return None
+            print(f"Failed to connect to the database (Attempt {attempt + 1}/{max_retries}). Exception raised: {e}")
+            last_exception = e
+            if attempt + 1 < max_retries:
+                # full jitter: sleep a random time up to the exponential backoff delay
+                time.sleep(random.uniform(0, min(max_delay, retry_delay * 2 ** attempt)))
+    raise ConnectionError(f"Failed to connect to the database after {max_retries} attempts") from last_exception
 
 
-# set SQLAlchemy engine
-def set_engine(conn, max_retries=5, retry_delay=2):
-    """Creates a SQLAlchemy engine using a preexisting connection
+class EngineManager:
+    """Long-lived SQLAlchemy engine with a bounded connection pool, shared by all the loaders of the process.
 
-    Args:
-        conn (odbc deonnection): The connection to the database
-        max_retries (int, optional): Max number of retries. Defaults to 5.
-        retry_delay (int, optional): Number of seconds to delay between retries. Defaults to 2.
+    Connections are checked out from the pool, health-checked with a pre-ping and returned to the pool after every query,
+    so the TLS and login handshake is paid once per pooled connection instead of once per query.
+    The manager also records metrics on the pool usage (see `metrics`).
 
-    Returns:
-        SQLAlchemy engine: The SQLAlchemy engine
+    Args:
+        url (str, optional): The SQLAlchemy database URL. Defaults to "mssql+pyodbc://", to be used with `creator`.
+            Any other URL (e.g. "sqlite:///data/local.db") can be used as a local stand-in of the database.
+        creator (callable, optional): Function returning a new DBAPI connection. Defaults to None.
+        pool_size (int, optional): Number of connections kept open in the pool. Defaults to 5.
+        max_overflow (int, optional): Number of connections allowed above `pool_size` under load. Defaults to 5.
+        pool_timeout (float, optional): Seconds to wait for a free connection before giving up. Defaults to 30.
+        pool_recycle (int, optional): Seconds after which a pooled connection is replaced. Defaults to 1800.
     """
-    attempts = 0
-    while attempts < max_retries:
-        try:
-            engine = create_engine("mssql+pyodbc://", poolclass=StaticPool, creator=lambda: conn)
-            return engine
-        except Exception as e:
-            print(f"An exception occurred: SQLAlcehmy engine error (Attempt {attempts + 1}/{max_retries})")
-            attempts += 1
-            time.sleep(retry_delay)
 
-    print(f"Failed to create the SQLAlchemy engine after {max_retries} attempts. Exception raised: {e}")
-    try:
-        conn.close()
-        print("Connection closed")
-    except Exception as e:
-        print(f"An exception occurred: failed to close the connection. Exception raised: {e}")
-    return None
+    def __init__(self, url="mssql+pyodbc://", creator=None, pool_size=5, max_overflow=5, pool_timeout=30, pool_recycle=1800):
+        self.url = url
+        self.creator = creator
+        self.pool_options = dict(pool_size=pool_size, max_overflow=max_overflow, pool_timeout=pool_timeout,
+                                 pool_recycle=pool_recycle, pool_pre_ping=True)
+        self._engine = None
+        self._lock = threading.Lock()
+        self._metrics = {
+            'connects': 0,
+            'checkouts': 0,
+            'checkins': 0,
+            'invalidations': 0,
+            'queries': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0,
+        }
+
+    @property
+    def engine(self):
+        """The SQLAlchemy engine, created on first use."""
+        if self._engine is None:
+            with self._lock:
+                if self._engine is None:
+                    from sqlalchemy import create_engine
+                    from sqlalchemy.pool import QueuePool
+                    options = dict(self.pool_options)
+                    if self.creator is not None:
+                        options['creator'] = self.creator
+                    engine = create_engine(self.url, poolclass=QueuePool, **options)
+                    self._listen(engine)
+                    self._engine = engine
+        return self._engine
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self._metrics[key] += value
+
+    def _listen(self, engine):
+        # count the pool events
+        from sqlalchemy import event
+        event.listen(engine, 'connect', lambda *args: self._count('connects'))
+        event.listen(engine, 'checkout', lambda *args: self._count('checkouts'))
+        event.listen(engine, 'checkin', lambda *args: self._count('checkins'))
+        event.listen(engine, 'invalidate', lambda *args: self._count('invalidations'))
+
+    @contextmanager
+    def connect(self):
+        """Check out a connection from the pool, recording the time spent waiting for it.
+
+        Yields:
+            sqlalchemy.engine.Connection: The pooled connection, returned to the pool on exit.
+        """
+        start = time.perf_counter()
+        with self.engine.connect() as conn:
+            waited = time.perf_counter() - start
+            with self._lock:
+                self._metrics['wait_seconds_total'] += waited
+                self._metrics['wait_seconds_max'] = max(self._metrics['wait_seconds_max'], waited)
+            yield conn
+
+    def read_sql(self, sql, params=None):
+        """Run a SQL query on a pooled connection.
+
+        Args:
+            sql (string): The SQL query. Use named placeholders (e.g. `:date`) for the values in `params`.
+            params (dict, optional): The query parameters. Defaults to None.
+
+        Returns:
+            pandas.DataFrame: The data from the database
+        """
+        from sqlalchemy import text
+        with self.connect() as conn:
+            data = pd.read_sql(text(sql), conn, params=params)
+        self._count('queries')
+        return data
 
+    def metrics(self):
+        """Return the pool metrics.
 
+        Returns:
+            dict: The counts of new connections, checkouts, checkins, invalidations and queries, the total and max
+            seconds spent waiting for a connection, and the current pool status.
+        """
+        with self._lock:
+            metrics = dict(self._metrics)
+        if self._engine is not None:
+            metrics['checked_out'] = self._engine.pool.checkedout()
+            metrics['pool_status'] = self._engine.pool.status()
+        return metrics
 
-def get_data_from_db(sql, engine):
-    """Get data from database using a SQL query
+    def dispose(self):
+        """Close all the pooled connections."""
+        with self._lock:
+            engine, self._engine = self._engine, None
+        if engine is not None:
+            engine.dispose()
 
-    Args:
-        sql (string): The SQL query
-        engine (SQL Alchemy engine, optional): Defaults to set_engine(database_connection(connection_string)).
+
+# process-wide engine manager shared by all the loaders
+_engine_manager = None
+_engine_manager_lock = threading.Lock()
+
+
+def get_engine_manager():
+    """Return the process-wide engine manager, connecting to the Azure SQL database.
 
     Returns:
-        pandas.DataFrame: The data from the database
+        EngineManager: The shared engine manager.
     """
-    try:
-        data = pd.read_sql(sql, engine)
-        engine.dispose()
-        return data
-    except Exception as e:
-        print(f"An exception occurred: SQL query failed. Exception raised: {e}")
-        engine.dispose()
-        return None
-    
+    global _engine_manager
+    with _engine_manager_lock:
+        if _engine_manager is None:
+            connection_string = set_connection_string()
+            _engine_manager = EngineManager(creator=lambda: database_connection(connection_string))
+        return _engine_manager
+
+
+def set_engine_manager(engine_manager):
+    """Replace the process-wide engine manager, e.g. with `EngineManager("sqlite:///data/local.db")` for local runs and benchmarks.
+
+    Args:
+        engine_manager (EngineManager): The new engine manager. The previous one is disposed.
+    """
+    global _engine_manager
+    with _engine_manager_lock:
+        previous, _engine_manager = _engine_manager, engine_manager
+    if previous is not None and previous is not engine_manager:
+        previous.dispose()
 
 
-def load_from_db(sql):
+def load_from_db(sql, params=None):
     """Load data from database using a SQL query
 
     Args:
         sql (string): The SQL query
+        params (dict, optional): The query parameters. Defaults to None.
+
+    Returns:
+        pandas.DataFrame: The data from the database, or None if the query failed.
     """
-    # get connection string
-    connection_string = set_connection_string()
-    # connect to database
-    conn = database_connection(connection_string)
-    # set SQLAlchemy engine
-    engine = set_engine(conn)
-    # get data from database
-    data = get_data_from_db(sql, engine)
-    return data 
+    with span('connect_to_database.load_from_db') as call:
+        try:
+            data = get_engine_manager().read_sql(sql, params)
+            call.set(rows=len(data))
+            return data
+        except Exception as e:
+            call.set(error=type(e).__name__)
+            print(f"An exception occurred: SQL query failed. Exception raised: {e}")
+            return None
 
 
 
@@ -148,6 +258,14 @@ table_names = [
     'artists_followers_table'
 ]
 
+# file with the high-water mark (latest synced date) of every local table snapshot
+watermarks_path = "data/sync_watermarks.json"
+
+# tables synced in this process and their watermarks, with table names as keys
+_synced_tables = {}
+_sync_locks = {table_name: threading.Lock() for table_name in table_names}
+
+
 # Function to load data from CSV
 def load_data_from_csv(table_name):
     return pd.read_csv(f"data/{table_name}.csv")
@@ -156,6 +274,21 @@ def load_data_from_csv(table_name):
 def get_latest_date(data):
     return data['date'].max()
 
+# Functions to read and write the high-water marks of the local snapshots
+def load_watermarks():
+    if not os.path.exists(watermarks_path):
+        return {}
+    with open(watermarks_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_watermark(table_name, watermark):
+    watermarks = load_watermarks()
+    watermarks[table_name] = watermark
+    # write to a temporary file first, so the watermarks file is never left half-written
+    with open(watermarks_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(watermarks, f, indent=2)
+    os.replace(watermarks_path + '.tmp', watermarks_path)
+
 # Function to query new data from the database
 def get_new_data(table_name, latest_date):
     """
@@ -163,23 +296,29 @@ def get_new_data(table_name, latest_date):
 
     Args:
         table_name (str): The name of the table to retrieve data from.
-        latest_date (str): The latest date to filter the data.
+        latest_date (str): The latest date to filter the data. If None, the whole table is retrieved.
 
     Returns:
-        pandas.DataFrame: A DataFrame of new data records retrieved from the database.
+        pandas.DataFrame: A DataFrame of new data records retrieved from the database, or None if the query failed.
     """
-    sql_query = f"SELECT * FROM {table_name} WHERE date > '{latest_date}';"
-    new_data = load_from_db(sql_query)
+    # table names cannot be query parameters, so only known tables are allowed in the query
+    if table_name not in table_names:
+        raise ValueError(f"Unknown table: {table_name}")
+    if latest_date is None:
+        return load_from_db(f"SELECT * FROM {table_name};")
+    sql_query = f"SELECT * FROM {table_name} WHERE date > :latest_date;"
+    new_data = load_from_db(sql_query, params={'latest_date': pd.Timestamp(latest_date).date()})
     return new_data
 
 # Function to update the CSV file with new data
 def update_data(table_name, data, new_data, update_csv):
     """
-    Updates the given data with new_data and optionally updates the corresponding CSV file.
+    Updates the given data with new_data and optionally appends new_data to the corresponding CSV file.
+    The new data is converted to the compact dtypes of the table schema (see `schema.apply_schema`) after it is written.
 
     Args:
         table_name (str): The name of the table or dataset.
-        data (pandas.DataFrame): The original data to be updated.
+        data (pandas.DataFrame): The original data to be updated, with compact dtypes. If None, the new data is returned.
         new_data (pandas.DataFrame): The new data to be added to the original data.
         update_csv (bool, optional): Whether to update the corresponding CSV file. Defaults to False.
 
@@ -188,24 +327,72 @@ def update_data(table_name, data, new_data, update_csv):
 
     """
     if not new_data.empty:
-        updated_data = pd.concat([data, new_data], ignore_index=True)
         if update_csv == True:
-            updated_data.to_csv(f"data/{table_name}.csv", index=False)
+            # append only the new rows, the CSV file is created (with a header) on the first sync
+            csv_path = f"data/{table_name}.csv"
+            new_data.to_csv(csv_path, mode='a', header=not os.path.exists(csv_path), index=False)
+        new_data = apply_schema(new_data, table_name)
+        updated_data = new_data if data is None else concat_tables([data, new_data])
     else:
         updated_data = data
     return updated_data
 
 
+def sync_table(table_name, update_csv=True):
+    """
+    Brings a table up to date with the database, pulling only the rows newer than its high-water mark.
+
+    The first call in the process loads the local CSV snapshot, or the whole table from the database if there is no snapshot.
+    Every call then retrieves the rows with `date` greater than the watermark, appends them to the snapshot and
+    moves the watermark forward. If the database cannot be reached, the local data is returned as is.
+    The rows are converted to the compact dtypes of the table schema (see `schema.apply_schema`) as they are loaded.
+
+    Args:
+        table_name (str): The name of the table.
+        update_csv (bool, optional): Whether to append the new rows to the local CSV snapshot. Defaults to True.
+
+    Returns:
+        pandas.DataFrame: The up-to-date table, or None if there is no local data and the database query failed.
+    """
+    with span('connect_to_database.sync_table', table=table_name) as call, _sync_locks[table_name]:
+        data, watermark = _synced_tables.get(table_name, (None, None))
+        if data is None and os.path.exists(f"data/{table_name}.csv"):
+            data = load_data_from_csv(table_name)
+            # the rows are appended to the CSV before the watermark is saved, so after a crash between the two
+            # the stored watermark lags the data: the latest date of the data wins, the same days are not synced twice
+            if not data.empty:
+                latest_date = pd.Timestamp(get_latest_date(data))
+                stored = load_watermarks().get(table_name)
+                watermark = max(latest_date, pd.Timestamp(stored)) if stored else latest_date
+                watermark = watermark.strftime('%Y-%m-%d')
+            data = apply_schema(data, table_name)
+
+        new_data = get_new_data(table_name, watermark)
+        if new_data is None:
+            print(f"Failed to sync {table_name}, serving the local data.")
+        elif not new_data.empty:
+            watermark = pd.Timestamp(pd.to_datetime(new_data['date']).max()).strftime('%Y-%m-%d')
+            data = update_data(table_name, data, new_data, update_csv)
+            if update_csv == True:
+                save_watermark(table_name, watermark)
+            print(f"Synced {table_name} with {len(new_data)} new records.")
+        call.set(new_rows=0 if new_data is None else len(new_data))
+
+        if data is not None:
+            _synced_tables[table_name] = (data, watermark)
+        return data
+
+
 # Main function to update all tables and return the updated data
 def update_dynamic_tables():
     """
-    Updates all tables in the database with new data.
+    Updates all the local tables with the new data of the database (see `sync_table`).
     
     This function iterates over a list of table names and performs the following steps for each table:
-    1. Loads existing data from a CSV file.
-    2. Determines the latest date in the existing data.
-    3. Retrieves new data from the database that is more recent than the latest date.
-    4. Updates the CSV file with the new data and stores the updated data.
+    1. Loads existing data from a CSV file (once per process).
+    2. Determines the high-water mark (latest date) of the existing data.
+    3. Retrieves new data from the database that is more recent than the high-water mark.
+    4. Appends the new data to the CSV file and stores the updated data.
     
     Returns:
         dict: A dictionary containing the updated data for each table, with table names as keys.
@@ -213,20 +400,7 @@ def update_dynamic_tables():
     updated_tables = {}
     
     for table_name in table_names:
-        # Load existing data from CSV
-        data = load_data_from_csv(table_name)
-        
-        # Get the latest date in the existing data
-        latest_date = get_latest_date(data)
-        
-        # Get new data from the database
-        new_data = get_new_data(table_name, latest_date)
-        
-        # Update the CSV with new data and store the updated data
-        updated_data = update_data(table_name, data, new_data, update_csv=False)
-        updated_tables[table_name] = updated_data
-        
-        #print(f"Updated {table_name}.csv with {len(new_data)} new records.")
+        updated_tables[table_name] = sync_table(table_name)
     
     return updated_tables
 
@@ -277,7 +451,8 @@ conn = database_connection(conn_str)
 print(conn)
 
 # test engine
-engine = set_engine(conn)
-print(engine)
-engine.dispose()
+engine_manager = get_engine_manager()
+print(engine_manager.read_sql('SELECT 1 AS one;'))
+print(engine_manager.metrics())
+engine_manager.dispose()
 '''
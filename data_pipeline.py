@@ -0,0 +1,371 @@
+import os
+import pandas as pd
+import numpy as np
+from connect_to_database import sync_table
+from series_store import SeriesStore
+from static_snapshot import read_table
+from filter_engine import FilterEngine
+from nearest_neighbors import NeighborIndex
+from data_registry import DataRegistry, LazyDatasets
+from aggregates import date_group_means
+from queries import current_values, daily_means, history
+from tracing import span, traced
+
+
+
+# days of history loaded into the data snapshot (APP_HISTORY_DAYS), e.g. 90 for the sparklines and trend charts of the
+# last 90 days, with the current values and the mean popularity computed by the database (see `queries`);
+# None loads the full history, synced incrementally to the local CSV snapshots (see `sync_table`)
+history_days = int(os.environ['APP_HISTORY_DAYS']) if os.environ.get('APP_HISTORY_DAYS') else None
+
+# dynamic tables of the pipeline
+dynamic_table_names = ['tracks_popularity_table', 'artists_popularity_table', 'artists_followers_table']
+# static tables of the pipeline
+static_table_paths = ['data/artists_table.csv', 'data/albums_table.csv', 'data/tracks_table.csv', 'data/tracks_features_table.csv']
+
+
+################################################
+# Load the data
+@traced('data_pipeline.load_static_data')
+def load_static_data():
+    """
+    Load static data from CSV files, read through their compiled columnar snapshots (see `static_snapshot.read_table`).
+    
+    Returns:
+        artists_table (pandas.DataFrame): DataFrame containing artist information.
+        albums_table (pandas.DataFrame): DataFrame containing album information.
+        tracks_table (pandas.DataFrame): DataFrame containing track information.
+        tracks_features_table (pandas.DataFrame): DataFrame containing track features information.
+    """
+    artists_table, albums_table, tracks_table, tracks_features_table = (read_table(path) for path in static_table_paths)
+    return artists_table, albums_table, tracks_table, tracks_features_table
+
+
+def load_dynamic_table(table_name, history_days=None):
+    """
+    Loads a dynamic table: syncs it with the database (see `sync_table`), or with `history_days`, queries only
+    the rows of its last days (see `queries.history`).
+    The table has the compact dtypes of `schema.table_schemas`, with the 'date' column as day numbers.
+
+    Args:
+        table_name (str): The name of the table, e.g. 'tracks_popularity_table'.
+        history_days (int, optional): The number of days to load. Defaults to None, i.e. the full history.
+
+    Returns:
+        pandas.DataFrame: The table.
+
+    Raises:
+        RuntimeError: If the table failed to load.
+    """
+    with span('data_pipeline.load_dynamic_table', table=table_name, history_days=history_days):
+        if history_days is None:
+            table = sync_table(table_name)
+        else:
+            table = history(table_name, days=history_days)
+    if table is None:
+        raise RuntimeError(f"Failed to load {table_name}")
+    return table
+
+
+def load_current_values(table_name):
+    """
+    Queries the current value of every track or artist (see `queries.current_values`), for a data snapshot that
+    does not hold the full history.
+
+    Returns:
+        pandas.Series: The current values, indexed by id.
+
+    Raises:
+        RuntimeError: If the query failed.
+    """
+    values = current_values(table_name)
+    if values is None:
+        raise RuntimeError(f"Failed to load the current values of {table_name}")
+    return values
+
+
+@traced('data_pipeline.merge_tracks_data')
+def merge_tracks_data(tracks_table, albums_table, artists_table, tracks_features_table):
+    """
+    Merges multiple tables to create a consolidated dataset. 
+
+    Parameters:
+    - tracks_table (pandas.DataFrame): The table containing information about tracks.
+    - albums_table (pandas.DataFrame): The table containing information about albums.
+    - artists_table (pandas.DataFrame): The table containing information about artists.
+    - tracks_features_table (pandas.DataFrame): The table containing features of tracks.
+
+    Returns:
+    - data (pandas.DataFrame): The merged dataset containing information from all the input tables.
+    """
+    data = pd.merge(tracks_table, albums_table, on='album_id')
+    data = pd.merge(data, artists_table[['artist_id', 'artist_name']], on='artist_id')
+    data = pd.merge(data, tracks_features_table, on='track_id')
+    return data
+
+
+@traced('data_pipeline.get_popularity')
+def get_popularity(popularity_table, key_word, artist_followers=False):
+    """
+    Builds a columnar series store from the popularity table of tracks or artists (or the followers table of artists).
+    The store keeps one sorted NumPy array of values, an offsets index per `track_id`/`artist_id` and a shared date axis,
+    so the series of every entity can be read as a zero-copy slice (see `series_store.SeriesStore`).
+
+    Parameters:
+    popularity_table : pd.DataFrame
+        A DataFrame containing track or artist popularity information. It must include the columns `track_id`, `date`, 
+        and `track_popularity` if `key_word='track'` and `artist_followers` is False,
+        or `artist_id`, `date`, and `artist_popularity` if `key_word='artist'` and `artist_followers` is False, or `artist_id`,
+        `date`, and `followers` if `artist_followers` is True.
+    key_word : str, optional
+        The keyword to use for the column names, either 'track' or 'artist'.
+    artist_followers : bool, optional
+        If True, the function processes artist followers data. If False, it processes track or artist popularity data based on `key_word`. 
+        Default is False.
+
+    Returns:
+    SeriesStore
+        The popularity (or followers) series of every track or artist.
+    """
+    if not artist_followers:
+        return SeriesStore.from_table(popularity_table, f'{key_word}_id', f'{key_word}_popularity')
+    return SeriesStore.from_table(popularity_table, 'artist_id', 'followers')
+
+
+def get_track_versions(data):
+    """
+    Ranks the versions (remasters, live recordings, etc.) of every track, i.e. all the track_ids sharing the same
+    artist name and original track name, from the most to the least popular one.
+    The ranking is done in a single sort; ties in popularity are broken by `track_id`, so the result is deterministic.
+
+    Args:
+        data (pandas.DataFrame): Tracks data with the columns `track_id`, `artist_name`, `original_track_name` 
+        and `current_track_popularity`.
+
+    Returns:
+        pandas.DataFrame: The version family index, sorted by artist name, original track name and version rank, with the columns:
+        - track_id: The id of the track version.
+        - canonical_track_id: The id of the most popular version of the track.
+        - version_rank: The rank of the version within its family, 0 being the canonical (most popular) version.
+    """
+    keys = ['artist_name', 'original_track_name']
+    versions = (data[keys + ['current_track_popularity', 'track_id']]
+                .sort_values(keys + ['current_track_popularity', 'track_id'], ascending=[True, True, False, True])
+                .reset_index(drop=True)
+                )
+    group = versions.groupby(keys, sort=False)
+    versions['canonical_track_id'] = group['track_id'].transform('first')
+    versions['version_rank'] = group.cumcount()
+    return versions[['track_id', 'canonical_track_id', 'version_rank']]
+
+
+@traced('data_pipeline.process_tracks_data')
+def process_tracks_data(data, tracks_popularity, current_track_popularity=None):
+    """
+    Process the given data by merging it with tracks_popularity, calculating the current track popularity,
+    converting the mode values to 'major' or 'minor', and selecting the most popular track version for each 
+    artist and track name.
+
+    Args:
+        data (pandas.DataFrame): The input data to be processed.
+        tracks_popularity (SeriesStore): The track popularity series.
+        current_track_popularity (pandas.Series, optional): The current popularity of every track, indexed by track_id.
+            Defaults to None, i.e. the latest value of every series of `tracks_popularity`.
+
+    Returns:
+        pandas.DataFrame: The processed data with the most popular track version for each artist and track name.
+        pandas.DataFrame: The version family of every track (see `get_track_versions`).
+    """
+    # Convert mode values to 'major' or 'minor'
+    data['mode'] = np.where(data['mode'] == 1, 'major', 'minor')
+    # we scale tempo to be between 0 and 1 for the radar chart
+    data['tempo_scaled'] = (data['tempo'] - data['tempo'].min()) / (data['tempo'].max() - data['tempo'].min())
+    # and loudness, for the similar tracks (see `nearest_neighbors.neighbor_features`)
+    data['loudness_scaled'] = (data['loudness'] - data['loudness'].min()) / (data['loudness'].max() - data['loudness'].min())
+    # Merge the data with the current (latest) track popularity
+    if current_track_popularity is None:
+        current_track_popularity = tracks_popularity.latest()
+    current_track_popularity = current_track_popularity.rename('current_track_popularity').rename_axis('track_id')
+    data = pd.merge(data, current_track_popularity, left_on='track_id', right_index=True)
+    # Select the most popular track version for each artist and track name
+    track_versions = get_track_versions(data)
+    canonical_track_ids = track_versions.loc[track_versions['version_rank'] == 0, 'track_id']
+    data = data.set_index('track_id').loc[canonical_track_ids].reset_index()
+    # keep only the required columns
+    data = data[['track_id', 'original_track_name', 'artist_name', 'album_image_medium', 
+                                    'current_track_popularity',
+                                    'track_spotify_url', 'track_preview_url', 'album_release_date',
+                                    'acousticness', 'danceability', 'energy', 'instrumentalness', 'valence', 'tempo','mode', 'tempo_scaled', 'loudness_scaled']]
+    return data, track_versions
+
+
+@traced('data_pipeline.process_artists_data')
+def process_artists_data(data, artists_popularity, artists_followers, current_artist_popularity=None, current_followers=None):
+    # Merge the data with the current (latest) artist popularity and followers,
+    # the latest values of the series unless they are given (indexed by artist_id)
+    if current_artist_popularity is None:
+        current_artist_popularity = artists_popularity.latest()
+    if current_followers is None:
+        current_followers = artists_followers.latest()
+    current_artist_popularity = current_artist_popularity.rename('current_artist_popularity').rename_axis('artist_id')
+    current_followers = current_followers.rename('current_followers').rename_axis('artist_id')
+    data = pd.merge(data, current_artist_popularity, left_on='artist_id', right_index=True)
+    data = pd.merge(data, current_followers, left_on='artist_id', right_index=True)
+    return data
+    
+
+# columns of the tracks data filtered by the sidebar sliders
+filter_columns = ['current_track_popularity', 'tempo', 'energy', 'valence', 'danceability', 'acousticness',
+                  'instrumentalness', 'album_release_date']
+
+
+################################################
+# Datasets of the app, declared with their dependencies and built lazily, once per data snapshot
+# (see `data_registry.LazyDatasets`): each page only builds the datasets it reads, in any navigation order
+datasets = DataRegistry()
+
+
+@datasets.dataset('static_tables')
+def static_tables():
+    return load_static_data()
+
+
+@datasets.dataset('tracks_popularity_table')
+def tracks_popularity_table():
+    return load_dynamic_table('tracks_popularity_table', history_days)
+
+
+@datasets.dataset('artists_popularity_table')
+def artists_popularity_table():
+    return load_dynamic_table('artists_popularity_table', history_days)
+
+
+@datasets.dataset('artists_followers_table')
+def artists_followers_table():
+    return load_dynamic_table('artists_followers_table', history_days)
+
+
+@datasets.dataset('track_popularity_series', depends_on=('tracks_popularity_table',))
+def track_popularity_series(tracks_popularity_table):
+    return get_popularity(tracks_popularity_table, key_word='track')
+
+
+@datasets.dataset('artist_popularity_series', depends_on=('artists_popularity_table',))
+def artist_popularity_series(artists_popularity_table):
+    return get_popularity(artists_popularity_table, key_word='artist')
+
+
+@datasets.dataset('followers_series', depends_on=('artists_followers_table',))
+def followers_series(artists_followers_table):
+    return get_popularity(artists_followers_table, key_word='artist', artist_followers=True)
+
+
+@datasets.dataset('tracks_view', depends_on=('static_tables', 'track_popularity_series'))
+def tracks_view(static_tables, track_popularity_series):
+    # the tracks data and the version families of the tracks, processed together (see `process_tracks_data`)
+    artists_table, albums_table, tracks_table, tracks_features_table = static_tables
+    data = merge_tracks_data(tracks_table, albums_table, artists_table, tracks_features_table)
+    # the current popularity of the full history is computed by the database when only the last days are loaded
+    current = None if history_days is None else load_current_values('tracks_popularity_table')
+    return process_tracks_data(data, track_popularity_series, current)
+
+
+@datasets.dataset('tracks_data', depends_on=('tracks_view',))
+def tracks_data(tracks_view):
+    return tracks_view[0]
+
+
+@datasets.dataset('track_versions', depends_on=('tracks_view',))
+def track_versions(tracks_view):
+    return tracks_view[1]
+
+
+@datasets.dataset('artists_data', depends_on=('static_tables', 'artist_popularity_series', 'followers_series'))
+def artists_data(static_tables, artist_popularity_series, followers_series):
+    artists_table = static_tables[0]
+    if history_days is None:
+        current_artist_popularity, current_followers = None, None
+    else:
+        current_artist_popularity = load_current_values('artists_popularity_table')
+        current_followers = load_current_values('artists_followers_table')
+    data = process_artists_data(artists_table, artist_popularity_series, followers_series,
+                                current_artist_popularity, current_followers)
+    # the Artists page lists the artists by popularity, so they are sorted once here instead of on every rerun
+    return data.sort_values(by='current_artist_popularity', ascending=False).reset_index(drop=True)
+
+
+@datasets.dataset('mean_track_popularity', depends_on=('tracks_popularity_table',))
+def mean_track_popularity(tracks_popularity_table):
+    # the mean track popularity over time, from the aggregate maintained as the new days are synced,
+    # or computed by the database when only the last days are loaded
+    if history_days is None:
+        means = date_group_means('mean_track_popularity', tracks_popularity_table, 'track_popularity')
+    else:
+        means = daily_means('tracks_popularity_table')
+        if means is None:
+            raise RuntimeError("Failed to load the mean track popularity")
+    return means.rename(columns={'mean': 'mean_track_popularity'})
+
+
+@datasets.dataset('filter_engine', depends_on=('tracks_data',))
+def filter_engine(tracks_data):
+    # the filter engine of the Tracks page sidebar
+    return FilterEngine(tracks_data, filter_columns)
+
+
+@datasets.dataset('neighbor_index', depends_on=('tracks_data',))
+def neighbor_index(tracks_data):
+    # the similar tracks are looked up in a KD-tree of the audio features
+    return NeighborIndex(tracks_data)
+
+
+@traced('data_pipeline.get_data')
+def get_data(progress=None):
+    ''' Load, process, and merge static and dynamic music data tables.
+
+    This function builds every dataset of `datasets` at once, e.g. for a script or a benchmark; the app builds them
+    lazily instead (see `data_snapshot.DataSnapshot`). The steps are:
+    1. Loads static data tables from CSV files.
+    2. Loads dynamic data tables with updated information (the last `history_days` days, if set), in parallel
+       with each other and with the static data tables (see `data_registry.LazyDatasets.build_all`).
+    3. Merges the static data tables into a single dataset.
+    4. Aggregates and processes the tracks popularity data.
+    5. Finalizes the dataset by integrating all data and retaining the most popular version of duplicate tracks.
+
+    Parameters:
+    progress (callable, optional): Called with the name of every dataset and the fraction of the datasets built
+        before it (see `data_registry.LazyDatasets.build_all`). Defaults to None.
+
+    Returns:
+    -------
+    pd.DataFrame
+        A DataFrame containing the merged and processed data with the following columns:
+        - artist_id
+        - album_id
+        - track_id
+        - original_track_name
+        - mode
+        - other columns from the static dat a tables
+        - current_track_popularity: The latest popularity value for each track.
+    pd.DataFrame
+        The artists data with the current artist popularity and followers, sorted by current artist popularity.
+    pd.DataFrame
+        The mean track popularity per date.
+    pd.DataFrame
+        The tracks popularity table (of the last `history_days` days, if set).
+    dict
+        The `SeriesStore` of every metric: 'track_popularity', 'artist_popularity' and 'followers'.
+    pd.DataFrame
+        The version family index of the tracks: every track_id with its canonical (most popular) track_id.
+    FilterEngine
+        The filter engine of the tracks data, for the sidebar filters of the Tracks page.
+    '''
+    data = LazyDatasets(datasets)
+    data.build_all(['tracks_data', 'track_versions', 'artists_data', 'mean_track_popularity', 'filter_engine'], progress)
+    popularity_series = {
+        'track_popularity': data.get('track_popularity_series'),
+        'artist_popularity': data.get('artist_popularity_series'),
+        'followers': data.get('followers_series'),
+    }
+    return (data.get('tracks_data'), data.get('artists_data'), data.get('mean_track_popularity'),
+            data.get('tracks_popularity_table'), popularity_series, data.get('track_versions'), data.get('filter_engine'))
@@ -0,0 +1,186 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from tracing import span
+
+
+
+class DataRegistry:
+    """Declarations of the datasets of the app: how every dataset is built and which datasets it is built from.
+
+    Example:
+        datasets = DataRegistry()
+
+        @datasets.dataset('artists_data', depends_on=('static_tables', 'artist_popularity_series', 'followers_series'))
+        def artists_data(static_tables, artist_popularity_series, followers_series): ...
+
+    The datasets are built by `LazyDatasets`, once per data snapshot and only when they are requested.
+    """
+
+    def __init__(self):
+        self.definitions = {}
+
+    def dataset(self, name, depends_on=()):
+        """Decorator registering the function building a dataset from its dependencies (passed as positional arguments)."""
+        def register(builder):
+            if name in self.definitions:
+                raise ValueError(f"Dataset '{name}' is already registered")
+            self.definitions[name] = (builder, tuple(depends_on))
+            return builder
+        return register
+
+    def __contains__(self, name):
+        return name in self.definitions
+
+    def order(self, names=None):
+        """
+        Returns datasets and all their dependencies, every dataset after its dependencies.
+
+        Args:
+            names (iterable, optional): The datasets. Defaults to None, i.e. all the registered datasets.
+
+        Returns:
+            list: The names of the datasets in build order.
+
+        Raises:
+            ValueError: If a dataset is not registered or depends on itself.
+        """
+        ordered, visiting = [], set()
+
+        def visit(name):
+            if name in ordered:
+                return
+            if name not in self.definitions:
+                raise ValueError(f"Unknown dataset: {name}")
+            if name in visiting:
+                raise ValueError(f"Circular dependency of dataset '{name}'")
+            visiting.add(name)
+            for dependency in self.definitions[name][1]:
+                visit(dependency)
+            visiting.discard(name)
+            ordered.append(name)
+
+        for name in (self.definitions if names is None else names):
+            visit(name)
+        return ordered
+
+
+class LazyDatasets:
+    """The datasets of a registry for one data snapshot, each built on its first request and then kept.
+
+    Every dataset is built at most once: concurrent requests of a dataset being built wait for it, and a failed build
+    is not kept, so the next request retries it. When a dataset has several dependencies that are not built yet,
+    they are built in parallel threads (e.g. the tables loaded from the database), as are the datasets without
+    dependencies of `build_all`.
+
+    Args:
+        registry (DataRegistry): The declarations of the datasets.
+        on_built (callable, optional): Called with the name and the value of every dataset once it is built,
+            e.g. to freeze its arrays. Defaults to None.
+    """
+
+    def __init__(self, registry, on_built=None):
+        self.registry = registry
+        self.on_built = on_built
+        self._values = {}
+        self._locks = {name: threading.Lock() for name in registry.definitions}
+
+    def is_built(self, name):
+        return name in self._values
+
+    def built(self):
+        """Return the names of the datasets built so far."""
+        return list(self._values)
+
+    def missing(self):
+        """Return the names of the datasets not built yet."""
+        return [name for name in self.registry.definitions if name not in self._values]
+
+    def get(self, name):
+        """
+        Returns a dataset, building it and its missing dependencies first if needed.
+
+        Args:
+            name (str): The name of the dataset.
+
+        Returns:
+            The dataset.
+        """
+        if name in self._values:
+            return self._values[name]
+        if name not in self.registry:
+            raise ValueError(f"Unknown dataset: {name}")
+        builder, depends_on = self.registry.definitions[name]
+        missing = [dependency for dependency in depends_on if dependency not in self._values]
+        if len(missing) > 1:
+            with ThreadPoolExecutor(max_workers=len(missing)) as executor:
+                for future in [executor.submit(self.get, dependency) for dependency in missing]:
+                    future.result()
+        dependencies = [self.get(dependency) for dependency in depends_on]
+        with self._locks[name]:
+            if name in self._values:
+                return self._values[name]
+            with span(f'dataset.{name}', cache='miss'):
+                value = builder(*dependencies)
+            if self.on_built is not None:
+                self.on_built(name, value)
+            self._values[name] = value
+        return value
+
+    def build_all(self, names=None, progress=None):
+        """
+        Builds datasets and their dependencies, e.g. all the datasets of a snapshot before it is served.
+
+        The datasets without dependencies (the static tables and the tables loaded from the database) are built
+        together first, so that loading them takes the time of the slowest one.
+
+        Args:
+            names (iterable, optional): The datasets. Defaults to None, i.e. all the registered datasets.
+            progress (callable, optional): Called with the name of every dataset and the fraction of the datasets
+                built before it. Defaults to None.
+
+        Returns:
+            dict: The seconds spent on every dataset without dependencies built by this call, plus the wall-clock
+            seconds of the whole build under the key 'total'.
+
+        Raises:
+            RuntimeError: If a dataset without dependencies failed to build, naming it. The ones that did not start
+                yet are cancelled.
+        """
+        start = time.perf_counter()
+        ordered = self.registry.order(names)
+        sources = [name for name in ordered if not self.registry.definitions[name][1] and name not in self._values]
+        timings = {}
+        if sources:
+            if progress is not None:
+                progress(', '.join(sources), 0.0)
+            timings = self._build_sources(sources)
+        for position, name in enumerate(ordered):
+            if progress is not None and name not in self._values:
+                progress(name, position / len(ordered))
+            self.get(name)
+        timings['total'] = time.perf_counter() - start
+        if sources:
+            print(f"Built {len(ordered)} datasets in {timings['total']:.2f}s, sources: "
+                  + ', '.join(f"{name} {timings[name]:.2f}s" for name in sources))
+        return timings
+
+    def _build_sources(self, sources):
+        # build the datasets in parallel threads, returning the seconds spent on every one
+        def timed(name):
+            source_start = time.perf_counter()
+            self.get(name)
+            return time.perf_counter() - source_start
+
+        timings = {}
+        with ThreadPoolExecutor(max_workers=len(sources)) as executor:
+            futures = {executor.submit(timed, name): name for name in sources}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    timings[name] = future.result()
+                except Exception as e:
+                    for pending in futures:
+                        pending.cancel()
+                    raise RuntimeError(f"Failed to load {name}. Exception raised: {e}") from e
+        return timings
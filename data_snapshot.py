@@ -0,0 +1,326 @@
+import threading
+import time
+import numpy as np
+import clustering
+from data_pipeline import datasets as dataset_registry, dynamic_table_names, history_days, static_table_paths
+from data_registry import LazyDatasets
+from filter_engine import FilterEngine
+from freshness import changed_sources, probe_sources
+from nearest_neighbors import NeighborIndex
+from series_store import SeriesStore
+from tracing import span, traced
+
+
+
+# seconds between two freshness probes of the sources of the snapshot (see `freshness.probe_sources`);
+# the snapshot is rebuilt when a probe finds that a source changed, e.g. after the daily ETL
+probe_interval = 5 * 60
+# whether the probe and the rebuild run in a background thread while the reruns keep being served the current
+# snapshot (stale-while-revalidate), instead of blocking the rerun that found the change
+stale_while_revalidate = True
+# seconds between two attempts of the warm-up to build the first snapshot, after a failure (e.g. the database is down)
+warmup_retry_delay = 30
+# files probed for changes: the static tables and the clustering model (importing `clustering` also registers
+# the datasets of the Clustering page)
+source_paths = static_table_paths + [clustering.model_path]
+
+
+class DataSnapshot:
+    """Read-only, versioned set of the datasets of the app, shared by all the sessions of the process.
+
+    The datasets (see `data_pipeline.datasets` and `clustering`) are read as attributes, e.g. `snapshot.tracks_data`,
+    and built on their first request (see `data_registry.LazyDatasets`). A snapshot is built in full by the warm-up
+    thread before it is served (see `refresh_snapshot`), so the pages find their datasets built.
+    The snapshot is never modified once built: its attributes cannot be reassigned and the NumPy arrays of its
+    series stores, filter engines and neighbour index are marked read-only. The pages must not mutate its frames
+    either; anything specific to a session (e.g. the `chart` selections of the tables) is added to a per-rerun view of
+    the rows it displays, e.g. the result of `FilterEngine.top` or `artists_data.assign(...)`.
+
+    Attributes:
+        version (int): The version of the snapshot, increased on every refresh.
+        created_at (float): The time the snapshot was created (seconds since the epoch).
+        history_days (int): The days of history of the tables and series, None for the full history
+            (see `data_pipeline.history_days`).
+        watermarks (dict): The watermarks of the sources, probed before the snapshot was created
+            (see `freshness.probe_sources`).
+        datasets (LazyDatasets): The datasets of the snapshot, built or not yet.
+    """
+
+    def __init__(self, version, history_days=None, watermarks=None):
+        values = dict(
+            version=version,
+            created_at=time.time(),
+            history_days=history_days,
+            watermarks=watermarks,
+            datasets=LazyDatasets(dataset_registry, on_built=freeze_dataset),
+        )
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __getattr__(self, name):
+        # only called for the names that are not attributes, i.e. the datasets
+        if name in dataset_registry:
+            return self.datasets.get(name)
+        raise AttributeError(f"DataSnapshot has no attribute or dataset '{name}'")
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"DataSnapshot is read-only, cannot set '{name}'")
+
+    def is_built(self, name):
+        """Return whether a dataset of the snapshot is built."""
+        return self.datasets.is_built(name)
+
+    def build(self, names=None, progress=None):
+        """Build datasets of the snapshot and their dependencies, all of them by default (see `LazyDatasets.build_all`).
+
+        Returns:
+            dict: The seconds spent on every source dataset (e.g. table) and in total.
+        """
+        return self.datasets.build_all(names, progress)
+
+    def age(self):
+        """Return the age of the snapshot in seconds."""
+        return time.time() - self.created_at
+
+
+def freeze_arrays(arrays):
+    # mark the arrays read-only, so that an accidental in-place write raises instead of leaking to other sessions
+    for array in arrays:
+        if isinstance(array, np.ndarray):
+            array.flags.writeable = False
+
+
+def freeze_dataset(name, value):
+    # called on every dataset of a snapshot once it is built
+    if isinstance(value, SeriesStore):
+        freeze_arrays([value.ids, value.offsets, value.date_codes, value.values])
+    elif isinstance(value, NeighborIndex):
+        freeze_arrays([value.points, value.order, value.point_positions, value.lower, value.upper])
+    elif isinstance(value, FilterEngine):
+        freeze_arrays([value.rank_order, *value.features.values(), *value.sorted_index.values(),
+                       *value.sorted_values.values(), *value.artist_rows.values()])
+
+
+@traced('data_snapshot.build_snapshot')
+def build_snapshot(version, watermarks=None):
+    """
+    Creates a snapshot, with none of its datasets built yet.
+
+    Args:
+        version (int): The version of the snapshot.
+        watermarks (dict, optional): The watermarks of the sources, probed before the snapshot is created.
+            Defaults to None, i.e. they are probed here. Data that lands after the probe is picked up by the next probe.
+
+    Returns:
+        DataSnapshot: The snapshot.
+    """
+    if watermarks is None:
+        watermarks = probe_sources(dynamic_table_names, source_paths)
+    return DataSnapshot(version, history_days, watermarks)
+
+
+# progress of the current build, for the readiness of the app (see `warmup_status`)
+_warmup = {'state': 'idle', 'step': None, 'done': 0.0, 'error': None, 'started_at': None}
+_warmup_lock = threading.Lock()
+_warmup_thread = None
+_ready = threading.Event()
+
+
+def set_warmup_progress(step, done):
+    _warmup.update(step=step, done=done)
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def refresh_snapshot(stale=None, watermarks=None):
+    """
+    Creates a new snapshot and swaps it in.
+
+    Every snapshot, the first one included, is built in full before it is swapped in, so that no rerun builds
+    a dataset: the reruns wait for the first snapshot (see `wait_for_snapshot`) and keep the previous one during
+    a refresh. The swap is a single reference assignment: reruns holding the previous snapshot keep using it until they finish,
+    and the next `get_snapshot` call returns the new one. Only one thread builds at a time; when several sessions find
+    the same stale snapshot, the first one rebuilds it and the others get its result.
+    If the build fails while a previous snapshot exists, the previous snapshot keeps being served.
+    The progress of the build is reported in `warmup_status`.
+
+    Args:
+        stale (DataSnapshot, optional): The snapshot to replace, i.e. the current one as seen by the caller.
+            If another thread replaced it in the meantime, the new snapshot is returned without rebuilding.
+            Defaults to None, i.e. there is no snapshot yet.
+        watermarks (dict, optional): The watermarks of the sources, if they were just probed. Defaults to None.
+
+    Returns:
+        DataSnapshot: The current snapshot.
+    """
+    global _snapshot
+    with _snapshot_lock:
+        current = _snapshot
+        if current is not stale:
+            return current
+        version = current.version + 1 if current is not None else 1
+        _warmup.update(state='building' if current is None else 'refreshing', step=None, done=0.0, error=None,
+                       started_at=time.time())
+        start = time.perf_counter()
+        try:
+            snapshot = build_snapshot(version, watermarks)
+            snapshot.build(progress=set_warmup_progress)
+        except Exception as e:
+            _warmup.update(state='failed' if current is None else 'ready', step=None, error=str(e))
+            if current is None:
+                raise
+            print(f"Failed to refresh the data snapshot, serving version {current.version}: {e}")
+            return current
+        _snapshot = snapshot
+        _warmup.update(state='ready', step=None, done=1.0)
+        _ready.set()
+    print(f"Built data snapshot version {version} in {time.perf_counter() - start:.2f}s")
+    return snapshot
+
+
+_last_probe = 0.0
+_revalidate_lock = threading.Lock()
+
+
+def revalidate(snapshot):
+    """
+    Probes the sources of a snapshot and rebuilds it if any of them changed since it was built.
+    Only one thread revalidates at a time; the others return the snapshot as is.
+
+    Args:
+        snapshot (DataSnapshot): The current snapshot.
+
+    Returns:
+        DataSnapshot: The current snapshot, rebuilt if its sources changed.
+    """
+    global _last_probe
+    if not _revalidate_lock.acquire(blocking=False):
+        return snapshot
+    try:
+        _last_probe = time.monotonic()
+        watermarks = probe_sources(dynamic_table_names, source_paths, previous=snapshot.watermarks)
+        changed = changed_sources(snapshot.watermarks, watermarks)
+        if not changed:
+            return snapshot
+        print(f"Sources of data snapshot version {snapshot.version} changed: {', '.join(changed)}")
+        return refresh_snapshot(stale=snapshot, watermarks=watermarks)
+    except Exception as e:
+        print(f"Failed to revalidate the data snapshot, serving version {snapshot.version}: {e}")
+        return snapshot
+    finally:
+        _revalidate_lock.release()
+
+
+def warmup_loop():
+    # build the first snapshot, retrying after failures, then revalidate it every `probe_interval` seconds
+    global _last_probe
+    while True:
+        snapshot = _snapshot
+        if snapshot is None:
+            try:
+                refresh_snapshot(stale=None)
+                _last_probe = time.monotonic()
+            except Exception as e:
+                print(f"Failed to build the data snapshot, retrying in {warmup_retry_delay}s: {e}")
+                time.sleep(warmup_retry_delay)
+            continue
+        wait = probe_interval - (time.monotonic() - _last_probe)
+        if wait > 0:
+            time.sleep(max(wait, 1.0))
+            continue
+        revalidate(snapshot)
+
+
+def start_warmup():
+    """
+    Starts the warm-up thread of the process, if it is not running yet: it builds the first snapshot in full
+    in the background and then keeps it fresh (see `revalidate`), so that no rerun builds a dataset or refreshes
+    the snapshot itself.
+    Call it as early as possible, e.g. at the top of `streamlit_app.py`; further calls do nothing.
+
+    Returns:
+        threading.Thread: The warm-up thread.
+    """
+    global _warmup_thread
+    with _warmup_lock:
+        if _warmup_thread is None or not _warmup_thread.is_alive():
+            _warmup_thread = threading.Thread(target=warmup_loop, name='snapshot-warmup', daemon=True)
+            _warmup_thread.start()
+        return _warmup_thread
+
+
+def warmup_status():
+    """
+    Returns the readiness of the data and the progress of the current build.
+
+    Returns:
+        dict: 'ready' (whether a snapshot is available), 'version' (the version of the current snapshot, or None),
+        'state' ('idle', 'building', 'refreshing', 'ready' or 'failed'), 'step' (the current step of the build),
+        'done' (the fraction of the build done), 'error' (the error of the last failed build) and 'started_at'
+        (the start time of the last build), and 'datasets' (the datasets of the current snapshot built so far).
+    """
+    snapshot = _snapshot
+    return {'ready': snapshot is not None, 'version': None if snapshot is None else snapshot.version, **_warmup,
+            'datasets': [] if snapshot is None else snapshot.datasets.built()}
+
+
+def wait_for_snapshot(timeout=None):
+    """
+    Waits for the first snapshot to be built by the warm-up thread (started if needed).
+
+    Args:
+        timeout (float, optional): The maximum number of seconds to wait. Defaults to None, i.e. until it is built.
+
+    Returns:
+        DataSnapshot: The current snapshot, or None if it is not built after `timeout` seconds.
+
+    Raises:
+        RuntimeError: If the last attempt of the warm-up to build the snapshot failed.
+    """
+    start_warmup()
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while _snapshot is None:
+        if _warmup['state'] == 'failed':
+            raise RuntimeError(f"The data could not be loaded: {_warmup['error']}")
+        remaining = 0.2 if deadline is None else min(0.2, deadline - time.monotonic())
+        if remaining <= 0:
+            return None
+        _ready.wait(remaining)
+    return _snapshot
+
+
+def get_snapshot():
+    """
+    Returns the data snapshot shared by all the sessions, waiting for the warm-up to build it on first use
+    (see `start_warmup`).
+
+    Every `probe_interval` seconds, the sources of the snapshot are probed (see `revalidate`) and the snapshot is
+    rebuilt if they changed. This is done by the warm-up thread; if it is not running, the probe is started by the
+    rerun that finds it due. With `stale_while_revalidate`, it then runs in a background thread and the current
+    snapshot keeps being served until the new one is swapped in; otherwise the rerun waits for the new snapshot.
+
+    Each page should call this once per rerun and read everything from the returned snapshot,
+    so that a refresh in the middle of a rerun does not mix two versions of the data.
+
+    Returns:
+        DataSnapshot: The current snapshot.
+    """
+    global _last_probe
+    with span('data_snapshot.get_snapshot') as call:
+        snapshot = _snapshot
+        if snapshot is None:
+            call.set(cache='miss')
+            snapshot = wait_for_snapshot()
+        else:
+            call.set(cache='hit')
+            warmup_running = _warmup_thread is not None and _warmup_thread.is_alive()
+            if not warmup_running and time.monotonic() - _last_probe > probe_interval and not _revalidate_lock.locked():
+                if stale_while_revalidate:
+                    _last_probe = time.monotonic()
+                    threading.Thread(target=revalidate, args=(snapshot,), name='snapshot-revalidate', daemon=True).start()
+                else:
+                    snapshot = revalidate(snapshot)
+        call.set(version=snapshot.version)
+    return snapshot
@@ -0,0 +1,150 @@
+import datetime
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import streamlit as st
+from tracing import span
+
+
+
+# total size of the serialized figures kept by the figure cache (APP_FIGURE_CACHE_MB), shared by all the sessions;
+# the least recently used figures are evicted first
+figure_cache_max_bytes = int(float(os.environ.get('APP_FIGURE_CACHE_MB', 64)) * 2**20)
+
+
+def canonical(value):
+    """
+    Returns a JSON-serializable form of the inputs of a figure, the same for equal inputs
+    (e.g. the keys of a dict are sorted and a NumPy scalar is a Python number).
+
+    Raises:
+        TypeError: If a value is not a supported input, e.g. a DataFrame (the figure should be keyed on the inputs
+            the DataFrame is computed from, e.g. the filters).
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, np.generic):
+        return canonical(value.item())
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return {str(key): canonical(value[key]) for key in sorted(value, key=str)}
+    if isinstance(value, (set, frozenset)):
+        return sorted((canonical(item) for item in value), key=repr)
+    if isinstance(value, (list, tuple, np.ndarray, pd.Index, pd.Series)):
+        return [canonical(item) for item in value]
+    raise TypeError(f"Unsupported figure input: {type(value).__name__}")
+
+
+def figure_key(name, snapshot_version, inputs):
+    """Return the cache key of a figure: a hash of its name, the version of the data snapshot and its inputs."""
+    payload = json.dumps([name, snapshot_version, canonical(inputs)], separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class FigureCache:
+    """LRU cache of serialized Plotly figures, bounded by the total size of their JSON.
+
+    The figures are stored as JSON, so a hit skips the data preparation and the building of the traces: the figure is
+    only read back from its JSON. A figure larger than the whole cache is not kept.
+
+    Args:
+        max_bytes (int, optional): The total size of the figures kept. Defaults to `figure_cache_max_bytes`.
+    """
+
+    def __init__(self, max_bytes=figure_cache_max_bytes):
+        self.max_bytes = max_bytes
+        self._figures = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._metrics = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, key):
+        """Return the JSON of a figure, or None if it is not cached."""
+        with self._lock:
+            entry = self._figures.get(key)
+            if entry is None:
+                self._metrics['misses'] += 1
+                return None
+            self._figures.move_to_end(key)
+            self._metrics['hits'] += 1
+            return entry[0]
+
+    def put(self, key, figure_json):
+        """Cache the JSON of a figure, evicting the least recently used figures to stay within `max_bytes`."""
+        size = len(figure_json.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._figures:
+                self._bytes -= self._figures.pop(key)[1]
+            while self._figures and self._bytes + size > self.max_bytes:
+                _, (_, evicted_size) = self._figures.popitem(last=False)
+                self._bytes -= evicted_size
+                self._metrics['evictions'] += 1
+            self._figures[key] = (figure_json, size)
+            self._bytes += size
+
+    def metrics(self):
+        """Return the number of figures and bytes cached, and the counts of hits, misses and evictions."""
+        with self._lock:
+            return {'figures': len(self._figures), 'bytes': self._bytes, **self._metrics}
+
+    def clear(self):
+        with self._lock:
+            self._figures.clear()
+            self._bytes = 0
+
+
+# process-wide figure cache shared by all the sessions
+figure_cache = FigureCache()
+
+
+def cached_figure_json(name, snapshot_version, inputs, build):
+    """
+    Returns the JSON of a figure from the figure cache, building it on a miss.
+
+    Args:
+        name (str): The name of the figure, e.g. 'clustering.heatmap'.
+        snapshot_version (int): The version of the data snapshot the figure is built from.
+        inputs (dict): Everything else the figure depends on, e.g. the filters and the selected tracks
+            (see `canonical`). Inputs that do not change the figure should be left out, so they do not miss the cache.
+        build (callable): Builds the figure (plotly.graph_objects.Figure) on a miss.
+
+    Returns:
+        str: The JSON of the figure.
+    """
+    import plotly.io
+    key = figure_key(name, snapshot_version, inputs)
+    with span(f'figures.{name}') as call:
+        figure_json = figure_cache.get(key)
+        if figure_json is None:
+            call.set(cache='miss')
+            # the figure is validated when it is read back (see `show_figure`)
+            figure_json = plotly.io.to_json(build(), validate=False)
+            figure_cache.put(key, figure_json)
+        else:
+            call.set(cache='hit')
+        call.set(bytes=len(figure_json))
+    return figure_json
+
+
+def show_figure(name, snapshot_version, inputs, build, use_container_width=False, **options):
+    """
+    Displays a figure from the figure cache (see `cached_figure_json`) with `st.plotly_chart`.
+
+    Args:
+        name, snapshot_version, inputs, build: See `cached_figure_json`.
+        use_container_width (bool, optional): Whether the chart takes the width of its container. Defaults to False.
+        **options: Other arguments of `st.plotly_chart`, e.g. `key` and `on_select`.
+
+    Returns:
+        The value returned by `st.plotly_chart`, e.g. the selection of the chart with `on_select='rerun'`.
+    """
+    import plotly.io
+    figure = plotly.io.from_json(cached_figure_json(name, snapshot_version, inputs, build))
+    return st.plotly_chart(figure, use_container_width=use_container_width, **options)
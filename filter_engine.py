@@ -0,0 +1,144 @@
+import numpy as np
+
+
+
+class FilterEngine:
+    """Range and artist filters over the tracks data, built once per data snapshot.
+
+    Every filterable column is kept as a contiguous NumPy array along with its sorted index (the argsort of the column),
+    and the artists are indexed to their row positions. A query combines the boolean masks of all the filters
+    in one pass and only the final selection of rows is materialized.
+
+    The rows are also presorted by `rank_column` (descending, ties in row order), so a top-N query after the filters
+    is a prefix scan of the mask in rank order.
+
+    Args:
+        data (pandas.DataFrame): The tracks data, e.g. as returned by `process_tracks_data`.
+        columns (list): The numeric columns that can be filtered by range.
+        artist_column (str, optional): The column of the artist names. Defaults to 'artist_name'.
+        rank_column (str, optional): The column ranking the rows in top-N queries. Defaults to 'current_track_popularity'.
+    """
+
+    def __init__(self, data, columns, artist_column='artist_name', rank_column='current_track_popularity'):
+        self.data = data
+        self.rank_column = rank_column
+        self.features = {}
+        self.sorted_index = {}
+        self.sorted_values = {}
+        for column in columns:
+            values = np.ascontiguousarray(data[column].to_numpy())
+            order = np.argsort(values, kind='stable')
+            self.features[column] = values
+            self.sorted_index[column] = order
+            self.sorted_values[column] = values[order]
+        # row positions by descending rank value, ties in row order
+        rank_values = data[rank_column].to_numpy(dtype=np.float64)
+        self.rank_order = np.lexsort((np.arange(len(data)), -rank_values))
+        # artist name -> row positions
+        self.artist_rows = {artist: np.asarray(rows) for artist, rows in data.groupby(artist_column, sort=True).indices.items()}
+
+    def __len__(self):
+        return len(self.data)
+
+    def range_bounds(self, column, low, high):
+        """Return the positions in the sorted index of the rows with `low <= column <= high`."""
+        sorted_values = self.sorted_values[column]
+        return np.searchsorted(sorted_values, low, side='left'), np.searchsorted(sorted_values, high, side='right')
+
+    def mask(self, ranges, artists=None):
+        """
+        Builds the boolean mask of the rows matching all the filters.
+
+        Args:
+            ranges (dict): Column names mapped to inclusive `(low, high)` ranges.
+            artists (list, optional): The artist names to keep. Defaults to None, i.e. all artists.
+
+        Returns:
+            numpy.ndarray: The boolean mask of the rows.
+        """
+        if artists is None:
+            mask = np.ones(len(self), dtype=bool)
+        else:
+            mask = np.zeros(len(self), dtype=bool)
+            for artist in artists:
+                mask[self.artist_rows.get(artist, np.empty(0, dtype=np.intp))] = True
+        for column, (low, high) in ranges.items():
+            start, end = self.range_bounds(column, low, high)
+            if start == 0 and end == len(self):
+                # the range covers the whole column, e.g. a slider left at its default values
+                continue
+            if end - start < len(self) // 8:
+                # narrow range: mark the matching rows through the sorted index
+                column_mask = np.zeros(len(self), dtype=bool)
+                column_mask[self.sorted_index[column][start:end]] = True
+            else:
+                values = self.features[column]
+                column_mask = (values >= low) & (values <= high)
+            mask &= column_mask
+        return mask
+
+    def select(self, ranges, artists=None):
+        """
+        Returns the rows matching all the filters (see `mask`).
+
+        Returns:
+            pandas.DataFrame: The selected rows of the data.
+        """
+        return self.data.iloc[np.flatnonzero(self.mask(ranges, artists))]
+
+    def top_rows(self, mask, n, by=None, ascending=False):
+        """
+        Returns the positions of the first `n` rows of the mask, ordered by `by`.
+
+        Ordering by the rank column scans the presorted rows in chunks and stops as soon as `n` rows are found.
+        Any other ordering falls back to an `argpartition` of the masked rows.
+
+        Args:
+            mask (numpy.ndarray): The boolean mask of the rows.
+            n (int): The number of rows.
+            by (str, optional): The column to order by. Defaults to the rank column.
+            ascending (bool, optional): Whether to order `by` in ascending order. Defaults to False.
+
+        Returns:
+            numpy.ndarray: The row positions, in order.
+        """
+        by = by or self.rank_column
+        if by == self.rank_column and not ascending:
+            chunk_size = max(4 * n, 1024)
+            found, count = [], 0
+            for start in range(0, len(self), chunk_size):
+                rows = self.rank_order[start:start + chunk_size]
+                rows = rows[mask[rows]]
+                found.append(rows)
+                count += len(rows)
+                if count >= n:
+                    break
+            return np.concatenate(found)[:n] if found else np.empty(0, dtype=np.intp)
+        rows = np.flatnonzero(mask)
+        keys = self.data[by].to_numpy(dtype=np.float64)[rows]
+        if not ascending:
+            keys = -keys
+        if n < len(rows):
+            # keep every row tied with the n-th key, the ties are then broken in row order
+            keep = keys <= np.partition(keys, n - 1)[n - 1]
+            rows, keys = rows[keep], keys[keep]
+        return rows[np.lexsort((rows, keys))][:n]
+
+    def top(self, ranges, n, artists=None, by=None, ascending=False):
+        """
+        Returns the top `n` rows matching all the filters, with their rank numbers in a `rank` column (1 to n).
+
+        Args:
+            ranges (dict): Column names mapped to inclusive `(low, high)` ranges.
+            n (int): The number of rows.
+            artists (list, optional): The artist names to keep. Defaults to None, i.e. all artists.
+            by (str, optional): The column to order by. Defaults to the rank column.
+            ascending (bool, optional): Whether to order `by` in ascending order. Defaults to False.
+
+        Returns:
+            pandas.DataFrame: The top rows, in rank order.
+        """
+        rows = self.top_rows(self.mask(ranges, artists), n, by=by, ascending=ascending)
+        top = self.data.iloc[rows].reset_index(drop=True)
+        top.insert(0, 'rank', np.arange(1, len(top) + 1))
+        return top
@@ -0,0 +1,63 @@
+import os
+import pandas as pd
+from queries import latest_date
+from static_snapshot import file_fingerprint, file_hash
+from tracing import span
+
+
+
+def probe_sources(table_names, csv_paths, previous=None):
+    """
+    Probes the watermarks of the sources of the data: the latest date (`MAX(date)`) of every dynamic table
+    and the fingerprint (size, modification time) of every static CSV file.
+    The hash of a file is only computed when its fingerprint differs from the previous watermark.
+
+    Args:
+        table_names (list): The dynamic tables, e.g. `data_pipeline.dynamic_table_names`.
+        csv_paths (list): The static CSV files, e.g. `data_pipeline.static_table_paths`.
+        previous (dict, optional): The previous watermarks, to reuse the hashes of unchanged files. Defaults to None.
+
+    Returns:
+        dict: The latest date of every table ('empty' if it has no rows, None if the query failed) under 'tables',
+        and the fingerprint and SHA-256 hash of every file (None if the file is missing) under 'files'.
+    """
+    previous_files = (previous or {}).get('files', {})
+    watermarks = {'tables': {}, 'files': {}}
+    with span('freshness.probe_sources'):
+        for table_name in table_names:
+            date = latest_date(table_name)
+            if date is None:
+                watermarks['tables'][table_name] = None
+            else:
+                watermarks['tables'][table_name] = 'empty' if pd.isna(date) else str(date.date())
+        for csv_path in csv_paths:
+            if not os.path.exists(csv_path):
+                watermarks['files'][csv_path] = None
+                continue
+            fingerprint = file_fingerprint(csv_path)
+            known = previous_files.get(csv_path)
+            if known is not None and all(known[key] == value for key, value in fingerprint.items()):
+                watermarks['files'][csv_path] = known
+            else:
+                watermarks['files'][csv_path] = {**fingerprint, 'sha256': file_hash(csv_path)}
+    return watermarks
+
+
+def changed_sources(previous, current):
+    """
+    Compares two watermarks of `probe_sources`.
+    A table whose probe failed (None) is not considered changed, so the current data keeps being served while
+    the database cannot be reached. A file is changed if its content (hash) changed, not only its modification time.
+
+    Returns:
+        list: The names of the tables and files that changed.
+    """
+    changed = []
+    for table_name, date in current['tables'].items():
+        if date is not None and date != previous['tables'].get(table_name):
+            changed.append(table_name)
+    for csv_path, file in current['files'].items():
+        known = previous['files'].get(csv_path)
+        if (file is None) != (known is None) or (file is not None and file['sha256'] != known['sha256']):
+            changed.append(csv_path)
+    return changed
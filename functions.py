@@ -1,5 +1,12 @@
+import os
+import numpy as np
 import pandas as pd
 import streamlit as st
+import streamlit.components.v1 as components
+import plotly.graph_objects as go
+from queries import history_series
+from scatter_charts import build_group_scatter_traces, max_scatter_points
+from tracing import traced_cache
 
 
 # for tracks page
@@ -7,24 +14,16 @@ import streamlit as st
 def show_tracks_table(filtered_data):
     """Show the table of the most popular tracks.
     Args:
-        filtered_data (pandas.DaraFrame): The data to display.
-        n (int): The number of rows to display sorted by current popularity.
+        filtered_data (pandas.DaraFrame): The data to display, in rank order with its `rank` column 
+            (see `FilterEngine.top`).
    """
-    df = (filtered_data.sort_values(by='current_track_popularity', ascending=False)
-          .reset_index(drop=True)
-          .rename_axis('index')
-          .reset_index()
-          .assign(index=lambda x: x['index'] + 1)
-        #.set_index('index')
-        )
-    
     data_table = st.data_editor(
-        df,
-        column_order=("chart", "index", "original_track_name", "artist_name", "album_image_medium", "current_track_popularity", "track_id"
+        filtered_data,
+        column_order=("chart", "rank", "original_track_name", "artist_name", "album_image_medium", "current_track_popularity", "track_id"
                       "track_popularity_list","track_spotify_url", "album_release_date"),
         column_config={
             "chart": "Chart",
-            "index": "Rank",
+            "rank": "Rank",
             "original_track_name": "Track",
             "artist_name": "Artist",
            "current_track_popularity": "Popularity",
@@ -37,7 +36,7 @@ def show_tracks_table(filtered_data):
             ),
         },
         hide_index=True,
-        disabled=("index", "original_track_name", "artist_name", "album_image_medium", "current_track_popularity", "track_popularity_list", "track_spotify_url"),
+        disabled=("rank", "original_track_name", "artist_name", "album_image_medium", "current_track_popularity", "track_popularity_list", "track_spotify_url"),
         use_container_width=False,
         width=3000,
     )
@@ -45,10 +44,127 @@ def show_tracks_table(filtered_data):
     
 
 
+def show_similar_tracks_table(similar_tracks):
+    """Show the table of the tracks similar to a track.
+    Args:
+        similar_tracks (pandas.DaraFrame): The similar tracks, sorted by their `distance` to the track
+            (see `NeighborIndex.similar`).
+   """
+    st.dataframe(
+        similar_tracks,
+        column_order=("original_track_name", "artist_name", "album_image_medium", "current_track_popularity", "distance", "track_spotify_url"),
+        column_config={
+            "original_track_name": "Track",
+            "artist_name": "Artist",
+            "album_image_medium": st.column_config.ImageColumn("Album Artwork", width='small'),
+            "current_track_popularity": "Popularity",
+            "distance": st.column_config.NumberColumn("Distance", format="%.3f"),
+            "track_spotify_url": st.column_config.LinkColumn("Listen on Spotify"),
+        },
+        hide_index=True,
+        use_container_width=True,
+    )
+
+
+# for all pages
+
+def load_datasets(snapshot, *names):
+    """Return datasets of the data snapshot, showing a spinner while the ones not built yet are built
+    (see `data_snapshot.DataSnapshot`), or an error that stops the page if they cannot be loaded.
+    Args:
+        snapshot (DataSnapshot): The data snapshot of the rerun.
+        names (str): The names of the datasets, e.g. 'artists_data'.
+
+    Returns:
+        list: The datasets, in the order of `names`.
+    """
+    try:
+        if not all(snapshot.is_built(name) for name in names):
+            with st.spinner('Loading the data...'):
+                snapshot.build(names)
+        return [getattr(snapshot, name) for name in names]
+    except Exception as e:
+        st.error(f"The data could not be loaded: {e}. Please try again later.")
+        st.stop()
+
+
+def lazy_tabs(labels, key):
+    """Tabs that only build the content of the selected tab. `st.tabs` runs and sends the content of every tab
+    on every rerun, while only one of them is visible; here the tabs are a horizontal radio and the page only
+    runs the content of the selected one, e.g. `if tab1: ...` instead of `with tab1: ...`.
+    Args:
+        labels (list): The labels of the tabs, the first one being selected by default.
+        key (str): The key of the radio, which keeps the selected tab across reruns.
+
+    Returns:
+        list: Whether every tab is selected, in the order of `labels`.
+    """
+    selected = st.radio('Tabs', labels, horizontal=True, key=key, label_visibility='collapsed')
+    return [label == selected for label in labels]
+
+
+@traced_cache(st.cache_data(max_entries=4), 'files.read_html')
+def read_html_file(path, mtime_ns):
+    """Read an HTML file, e.g. an exported notebook, once per version of the file (`mtime_ns`)."""
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def show_html_file(path, height=1000, width=1100):
+    """Show an HTML file (see `read_html_file`), or a warning if it is missing."""
+    if not os.path.exists(path):
+        st.warning(f'{path} is not available.')
+        return
+    components.html(read_html_file(path, os.stat(path).st_mtime_ns), scrolling=True, height=height, width=width)
+
+
+# for trend charts
+
+@traced_cache(st.cache_data(max_entries=32), 'queries.history_series')
+def get_full_history(snapshot_version, table_name, ids):
+    """Query the full history of the selected tracks or artists, once per data snapshot and selection
+    (see `queries.history_series`)."""
+    return history_series(table_name, ids)
+
+
+def full_history_toggle(snapshot, table_name, ids, key):
+    """Offer the full history in a trend chart when the data snapshot only holds the last days.
+    Args:
+        snapshot (DataSnapshot): The data snapshot of the rerun.
+        table_name (str): The table of the chart, e.g. 'tracks_popularity_table'.
+        ids (iterable): The ids of the selected tracks or artists.
+        key (str): The key of the checkbox.
+
+    Returns:
+        dict: The dates and values of every selected id (see `queries.history_series`), or None to use the
+        series of the snapshot.
+    """
+    if snapshot.history_days is None:
+        return None
+    if not st.checkbox(f'Show the full history (the charts show the last {snapshot.history_days} days)', key=key):
+        return None
+    full_history = get_full_history(snapshot.version, table_name, tuple(str(entity_id) for entity_id in ids))
+    if full_history is None:
+        st.warning('The full history is not available right now, showing the last days.')
+    return full_history
+
+
+def trend_series(series, entity_id, full_history=None):
+    """Return the dates and values of a track or artist, from the full history if it has been queried,
+    or else from the series store of the snapshot."""
+    if full_history is not None and str(entity_id) in full_history:
+        return full_history[str(entity_id)]
+    return series.dates_of(entity_id), series.values_of(entity_id)
+
+
 # scatter plot with streamlit
-def track_features_scatter_plot(filtered_data):
-    st.scatter_chart(data=filtered_data, x='valence', y='energy', 
-                    size='current_track_popularity', color='mode',)
+def track_features_scatter_plot(filtered_data, max_points=max_scatter_points):
+    """Show the valence and energy of the tracks, sized by popularity and colored by mode, as a WebGL scatter
+    of at most `max_points` tracks sampled per mode (see `scatter_charts.build_group_scatter_traces`)."""
+    traces = build_group_scatter_traces(filtered_data, 'mode', ['valence', 'energy'], hover_column='original_track_name',
+                                        size_column='current_track_popularity', max_points=max_points)
+    fig = go.Figure(data=traces, layout=dict(xaxis_title='valence', yaxis_title='energy', legend_title_text='mode'))
+    st.plotly_chart(fig, use_container_width=True)
         
 
 def write_features_description():
@@ -107,25 +223,19 @@ def write_features_description():
 
 # for artists page
 def show_artists_table(filtered_data):
-    """Show the table of the most popular tracks.
+    """Show the table of the most popular artists.
     Args:
-        filtered_data (pandas.DaraFrame): The data to display.
-        n (int): The number of rows to display sorted by current popularity.
+        filtered_data (pandas.DaraFrame): The data to display, sorted by current popularity.
    """
-    df = (filtered_data.sort_values(by='current_artist_popularity', ascending=False)
-          .reset_index(drop=True)
-          .rename_axis('index')
-          .reset_index()
-          .assign(index=lambda x: x['index'] + 1)
-        #.set_index('index')
-        )
+    df = filtered_data.reset_index(drop=True)
+    df.insert(0, 'rank', np.arange(1, len(df) + 1))
     
     data_table = st.data_editor(
         df,
-        column_order=("chart", "index", "artist_name", "artist_image_medium", "current_artist_popularity", "artist_popularity_list", "artist_url"),
+        column_order=("chart", "rank", "artist_name", "artist_image_medium", "current_artist_popularity", "artist_popularity_list", "artist_url"),
         column_config={
             "chart": "Chart",
-            "index": "Rank",
+            "rank": "Rank",
             "artist_name": "Artist",
            "current_artist_popularity": "Popularity",
             "artist_url": st.column_config.LinkColumn("On Spotify"),
@@ -135,7 +245,7 @@ def show_artists_table(filtered_data):
             ),
         },
         hide_index=True,
-        disabled=("index", "artist_name","artist_image_medium", "current_artist_popularity", "artist_popularity_list"),
+        disabled=("rank", "artist_name","artist_image_medium", "current_artist_popularity", "artist_popularity_list"),
         use_container_width=False,
         width=3000,
     )
@@ -0,0 +1,155 @@
+import heapq
+import numpy as np
+import pandas as pd
+
+
+
+# normalized audio features of the similar tracks: the features of the radar chart, plus the scaled loudness
+# of the clustering notebook
+neighbor_features = ['acousticness', 'danceability', 'valence', 'energy', 'tempo_scaled', 'instrumentalness', 'loudness_scaled']
+
+
+class NeighborIndex:
+    """KD-tree over the audio features of the tracks, built once per data snapshot, to find the tracks that sound alike.
+
+    The tree is stored in flat NumPy arrays: the points are reordered so that every node owns a contiguous slice
+    `[starts[node], ends[node])` of them, and every node keeps the bounding box of its points. A query visits the nodes
+    in order of their distance to the query point and skips the nodes farther than the current k-th nearest neighbour,
+    so it only reads a few leaves instead of computing the distance to every track.
+
+    Args:
+        data (pandas.DataFrame): The tracks data, e.g. as returned by `process_tracks_data`.
+        features (list, optional): The feature columns, in comparable (normalized) units. Defaults to `neighbor_features`.
+        id_column (str, optional): The column of the track ids. Defaults to 'track_id'.
+        leaf_size (int, optional): The maximum number of points of a leaf. Larger leaves mean fewer nodes to visit
+            in Python and more distances computed in NumPy per leaf. Defaults to 128.
+    """
+
+    def __init__(self, data, features=neighbor_features, id_column='track_id', leaf_size=128):
+        self.data = data
+        self.features = list(features)
+        self._ids = pd.Index(data[id_column])
+        points = data[self.features].to_numpy(dtype=np.float64)
+        order = np.arange(len(points))
+        starts, ends, split_dims, lefts, rights, lower, upper = [], [], [], [], [], [], []
+
+        def build(start, end):
+            node = len(starts)
+            node_points = points[order[start:end]]
+            starts.append(start)
+            ends.append(end)
+            lower.append(node_points.min(axis=0) if end > start else np.zeros(points.shape[1]))
+            upper.append(node_points.max(axis=0) if end > start else np.zeros(points.shape[1]))
+            split_dims.append(-1)
+            lefts.append(-1)
+            rights.append(-1)
+            if end - start > leaf_size:
+                # split the widest dimension at its median
+                dim = int(np.argmax(upper[node] - lower[node]))
+                middle = (end - start) // 2
+                order[start:end] = order[start:end][np.argpartition(node_points[:, dim], middle)]
+                split_dims[node] = dim
+                lefts[node] = build(start, start + middle)
+                rights[node] = build(start + middle, end)
+            return node
+
+        build(0, len(points))
+        self.order = order
+        self.points = points[order]
+        # position of every row of `data` in `points`
+        self.point_positions = np.empty_like(order)
+        self.point_positions[order] = np.arange(len(order))
+        self.starts = np.array(starts, dtype=np.int64)
+        self.ends = np.array(ends, dtype=np.int64)
+        self.split_dims = np.array(split_dims, dtype=np.int64)
+        self.lefts = np.array(lefts, dtype=np.int64)
+        self.rights = np.array(rights, dtype=np.int64)
+        self.lower = np.array(lower)
+        self.upper = np.array(upper)
+
+    def __len__(self):
+        return len(self.data)
+
+    def box_distance(self, node, point):
+        """Return the squared distance between a point and the bounding box of a node."""
+        gaps = np.maximum(self.lower[node] - point, 0) + np.maximum(point - self.upper[node], 0)
+        return float(gaps @ gaps)
+
+    def query(self, point, k):
+        """
+        Finds the `k` nearest tracks of a point of the feature space.
+
+        Args:
+            point (array-like): The point, one value per feature.
+            k (int): The number of neighbours.
+
+        Returns:
+            tuple: The euclidean distances (ascending, ties in row order) and the row positions in `data` of the neighbours.
+        """
+        point = np.asarray(point, dtype=np.float64)
+        best_distances = np.empty(0)
+        best_positions = np.empty(0, dtype=np.int64)
+        worst = np.inf
+        nodes = [(self.box_distance(0, point), 0)]
+        while nodes:
+            distance, node = heapq.heappop(nodes)
+            # a node at the distance of the k-th neighbour can still hold a tie with a lower row position
+            if distance > worst:
+                break
+            if self.split_dims[node] < 0:
+                start, end = self.starts[node], self.ends[node]
+                differences = self.points[start:end] - point
+                best_distances = np.concatenate([best_distances, np.einsum('ij,ij->i', differences, differences)])
+                best_positions = np.concatenate([best_positions, np.arange(start, end)])
+                if len(best_distances) > k:
+                    # keep the k nearest, ties in row order
+                    keep = np.lexsort((self.order[best_positions], best_distances))[:k]
+                    best_distances, best_positions = best_distances[keep], best_positions[keep]
+                if len(best_distances) == k:
+                    worst = best_distances.max()
+                continue
+            for child in (self.lefts[node], self.rights[node]):
+                child_distance = self.box_distance(child, point)
+                if child_distance <= worst:
+                    heapq.heappush(nodes, (child_distance, child))
+        order = np.lexsort((self.order[best_positions], best_distances))
+        return np.sqrt(best_distances[order]), self.order[best_positions[order]]
+
+    def neighbors(self, track_id, k):
+        """
+        Finds the `k` tracks that sound the most like a track (the track itself excluded).
+
+        Returns:
+            tuple: The euclidean distances (ascending) and the row positions in `data` of the neighbours.
+        """
+        position = self._ids.get_loc(track_id)
+        distances, positions = self.query(self.points[self.point_positions[position]], k + 1)
+        others = positions != position
+        return distances[others][:k], positions[others][:k]
+
+    def similar(self, track_ids, k):
+        """
+        Returns the `k` tracks that sound the most like each of the given tracks.
+
+        Args:
+            track_ids (iterable): The ids of the tracks. Ids missing from the index are skipped.
+            k (int): The number of similar tracks per track.
+
+        Returns:
+            pandas.DataFrame: The rows of the similar tracks, with the id of the track they are similar to in a
+            `similar_to` column and their distance to it in a `distance` column, grouped by track and sorted by distance.
+        """
+        positions, similar_to, distances = [], [], []
+        for track_id in track_ids:
+            if track_id not in self._ids:
+                continue
+            track_distances, track_positions = self.neighbors(track_id, k)
+            positions.append(track_positions)
+            distances.append(track_distances)
+            similar_to.extend([track_id] * len(track_positions))
+        if not positions:
+            return self.data.iloc[:0].assign(similar_to=[], distance=[])
+        similar = self.data.iloc[np.concatenate(positions)].reset_index(drop=True)
+        similar['similar_to'] = similar_to
+        similar['distance'] = np.concatenate(distances)
+        return similar
@@ -0,0 +1,164 @@
+import pandas as pd
+from connect_to_database import load_from_db
+from schema import apply_schema, day_number_to_datetime, to_day_number
+
+
+
+# Queries of the dynamic tables that let the database do the filtering and aggregation, so that only the result
+# is transferred: the current value of every entity, the mean per date and the history of the last days or of
+# some entities. Every table has a 'date' column, an id column and a value column.
+metric_tables = {
+    'tracks_popularity_table': ('track_id', 'track_popularity'),
+    'albums_popularity_table': ('album_id', 'album_popularity'),
+    'artists_popularity_table': ('artist_id', 'artist_popularity'),
+    'artists_followers_table': ('artist_id', 'followers'),
+}
+
+# SQL Server accepts up to 2100 parameters per query, the ids of `history` are sent in chunks
+max_query_ids = 1000
+
+
+def table_columns(table_name):
+    # table names cannot be query parameters, so only known tables are allowed in the queries
+    if table_name not in metric_tables:
+        raise ValueError(f"Unknown table: {table_name}")
+    return metric_tables[table_name]
+
+
+def latest_date(table_name):
+    """
+    Returns the latest date of a table.
+
+    Args:
+        table_name (str): The name of the table, e.g. 'tracks_popularity_table'.
+
+    Returns:
+        pandas.Timestamp: The latest date, NaT if the table is empty, or None if the query failed.
+    """
+    table_columns(table_name)
+    data = load_from_db(f"SELECT MAX(date) AS date FROM {table_name};")
+    if data is None:
+        return None
+    return pd.to_datetime(data['date']).iat[0]
+
+
+def current_values(table_name):
+    """
+    Returns the current value of every entity of a table, i.e. the value of its latest date (`MAX(date)` per entity),
+    e.g. the current popularity of every track.
+
+    Args:
+        table_name (str): The name of the table, e.g. 'tracks_popularity_table'.
+
+    Returns:
+        pandas.Series: The current values, indexed by id, or None if the query failed.
+    """
+    id_column, value_column = table_columns(table_name)
+    sql = f'''
+        SELECT t.{id_column}, t.{value_column}
+        FROM {table_name} t
+        JOIN (SELECT {id_column}, MAX(date) AS date FROM {table_name} GROUP BY {id_column}) latest
+        ON t.{id_column} = latest.{id_column} AND t.date = latest.date;
+    '''
+    data = load_from_db(sql)
+    if data is None:
+        return None
+    data = apply_schema(data, table_name)
+    return data.set_index(id_column)[value_column].sort_index()
+
+
+def daily_means(table_name):
+    """
+    Returns the mean value of a table per date (`GROUP BY date`), e.g. the mean track popularity.
+
+    Args:
+        table_name (str): The name of the table, e.g. 'tracks_popularity_table'.
+
+    Returns:
+        pandas.DataFrame: The columns 'date' (datetime) and 'mean', sorted by date (as `aggregates.date_group_means`),
+        or None if the query failed.
+    """
+    _, value_column = table_columns(table_name)
+    # the values are integers, cast so that the mean is not truncated
+    sql = f'''
+        SELECT date, AVG(CAST({value_column} AS FLOAT)) AS mean
+        FROM {table_name}
+        GROUP BY date
+        ORDER BY date;
+    '''
+    data = load_from_db(sql)
+    if data is None:
+        return None
+    data['date'] = day_number_to_datetime(to_day_number(data['date']))
+    return data
+
+
+def history(table_name, days=None, ids=None):
+    """
+    Returns the rows of a table, in date order as `sync_table` returns them: the last `days` days and/or the history
+    of some entities only, or the whole table.
+
+    Args:
+        table_name (str): The name of the table, e.g. 'tracks_popularity_table'.
+        days (int, optional): The number of days to keep, up to the latest date of the table. Defaults to None, i.e. all the days.
+        ids (iterable, optional): The ids of the entities to keep. Defaults to None, i.e. all the entities.
+
+    Returns:
+        pandas.DataFrame: The rows, with the compact dtypes of `schema.table_schemas`, or None if a query failed.
+    """
+    id_column, value_column = table_columns(table_name)
+    conditions, params = [], {}
+    if days is not None:
+        end = latest_date(table_name)
+        if end is None:
+            return None
+        if pd.notna(end):
+            conditions.append('date >= :start')
+            params['start'] = (end - pd.Timedelta(days=days - 1)).date()
+
+    def query(chunk_conditions, chunk_params):
+        where = f"WHERE {' AND '.join(chunk_conditions)}" if chunk_conditions else ''
+        sql = f"SELECT date, {id_column}, {value_column} FROM {table_name} {where} ORDER BY date, {id_column};"
+        return load_from_db(sql, params=chunk_params or None)
+
+    if ids is None:
+        data = query(conditions, params)
+    else:
+        ids = list(dict.fromkeys(ids))
+        chunks = []
+        for start in range(0, len(ids), max_query_ids):
+            chunk = ids[start:start + max_query_ids]
+            id_params = {f'id_{i}': entity_id for i, entity_id in enumerate(chunk)}
+            placeholders = ', '.join(f':{name}' for name in id_params)
+            chunk_data = query(conditions + [f'{id_column} IN ({placeholders})'], {**params, **id_params})
+            if chunk_data is None:
+                return None
+            chunks.append(chunk_data)
+        data = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=['date', id_column, value_column])
+        if len(chunks) > 1:
+            data = data.sort_values(['date', id_column], kind='stable', ignore_index=True)
+    if data is None:
+        return None
+    return apply_schema(data, table_name)
+
+
+def history_series(table_name, ids):
+    """
+    Returns the full history of some entities, e.g. for the trend chart of the selected tracks
+    when the data snapshot only holds the last days (see `data_pipeline.history_days`).
+
+    Args:
+        table_name (str): The name of the table, e.g. 'tracks_popularity_table'.
+        ids (iterable): The ids of the entities.
+
+    Returns:
+        dict: The dates (datetime) and values (numpy.ndarray) of every entity with rows, with ids as keys,
+        or None if the query failed.
+    """
+    id_column, value_column = table_columns(table_name)
+    data = history(table_name, ids=ids)
+    if data is None:
+        return None
+    data = data.assign(date=day_number_to_datetime(data['date']))
+    return {str(entity_id): (rows['date'].to_numpy(), rows[value_column].to_numpy())
+            for entity_id, rows in data.groupby(id_column, observed=True, sort=False)}
@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+
+
+# default number of points drawn by a scatter chart, shared by its groups (e.g. the clusters)
+max_scatter_points = 5000
+# decimals of the coordinates sent to the browser, the audio features have at most 3 or 4
+scatter_decimals = 4
+
+
+def stratified_sample(codes, n_groups, max_points, seed=0):
+    """
+    Selects at most `max_points` rows, shared by the groups: every group first gets up to a floor of
+    `max_points / (4 * groups)` rows, so the small groups stay visible, and the rest is shared in proportion to
+    the remaining rows of every group. The rows of a group are drawn uniformly at random, so the sample keeps the
+    shape (density) of every group; the draw is seeded, so the same rows are drawn on every rerun.
+
+    Args:
+        codes (numpy.ndarray): The group of every row, from 0 to `n_groups - 1`.
+        n_groups (int): The number of groups.
+        max_points (int): The number of rows to keep, None to keep all the rows.
+        seed (int, optional): The seed of the draw. Defaults to 0.
+
+    Returns:
+        numpy.ndarray: The positions of the selected rows, sorted.
+    """
+    if max_points is None or len(codes) <= max_points:
+        return np.arange(len(codes))
+    sizes = np.bincount(codes, minlength=n_groups)
+    floor = max_points // (4 * max(1, np.count_nonzero(sizes)))
+    quotas = np.minimum(sizes, floor)
+    left = sizes - quotas
+    remaining = max_points - quotas.sum()
+    # largest remainder split of the remaining rows, in proportion to the rows left in every group
+    share = remaining * left / left.sum()
+    extra = np.floor(share).astype(np.int64)
+    extra[np.argsort(extra - share, kind='stable')[:remaining - extra.sum()]] += 1
+    quotas += np.minimum(extra, left)
+
+    rng = np.random.default_rng(seed)
+    order = np.argsort(codes, kind='stable')
+    starts = np.searchsorted(codes[order], np.arange(n_groups + 1))
+    selected = [rng.choice(order[starts[group]:starts[group + 1]], quotas[group], replace=False)
+                for group in range(n_groups) if quotas[group] > 0]
+    return np.sort(np.concatenate(selected))
+
+
+def build_group_scatter_traces(data, group_column, columns, group_order=None, colors=None, id_column=None,
+                               hover_column=None, size_column=None, marker=None, max_points=max_scatter_points, seed=0):
+    """
+    Builds the traces of a scatter chart with one trace per group (e.g. per cluster), from the NumPy arrays of the
+    columns: a WebGL 3D scatter (`Scatter3d`) for 3 columns, or a WebGL 2D scatter (`Scattergl`) for 2.
+    At most `max_points` points are drawn, sampled per group (see `stratified_sample`).
+
+    The points carry a compact id instead of a hover text: the integer of `id_column` is sent as the `customdata` of
+    every point and shown on hover, to be looked up in the data (see `lookup_point`). A hover text (`hover_column`)
+    is only sent when all the rows are drawn.
+
+    Args:
+        data (pandas.DataFrame): The rows to draw.
+        group_column (str): The column of the groups.
+        columns (list): The columns of the x, y (and z) axes.
+        group_order (list, optional): The order of the groups in the legend. Defaults to None, i.e. sorted.
+        colors (dict, optional): The color of every group. Defaults to None, i.e. the colors of the template.
+        id_column (str, optional): The integer column of the id of every point, e.g. 'track_number'. Defaults to None.
+        hover_column (str, optional): The column of the hover title of every point, if all the rows are drawn.
+            Defaults to None.
+        size_column (str, optional): The column scaled to the marker sizes, from 4 to 16 px. Defaults to None.
+        marker (dict, optional): Other marker properties, e.g. `dict(size=4)`. Defaults to None.
+        max_points (int, optional): The number of points drawn, None to draw all the rows. Defaults to `max_scatter_points`.
+        seed (int, optional): The seed of the sampling. Defaults to 0.
+
+    Returns:
+        list: The traces.
+    """
+    groups = data[group_column].to_numpy()
+    present = set(pd.unique(groups))
+    labels = [label for label in (group_order or []) if label in present]
+    labels += sorted(present.difference(labels))
+    codes = pd.Categorical(groups, categories=labels).codes.astype(np.int64)
+    selected = stratified_sample(codes, len(labels), max_points, seed)
+
+    axes = ['x', 'y', 'z'][:len(columns)]
+    coordinates = {axis: np.round(data[column].to_numpy(dtype=np.float64)[selected], scatter_decimals)
+                   for axis, column in zip(axes, columns)}
+    ids = data[id_column].to_numpy()[selected] if id_column is not None else None
+    # the hover texts are most of the payload of a large chart (see `benchmarks.scatter_charts`)
+    hover = data[hover_column].to_numpy()[selected] if hover_column is not None and len(selected) == len(data) else None
+    if size_column is not None:
+        values = data[size_column].to_numpy(dtype=np.float64)
+        low, high = values.min(), values.max()
+        scaled = (values[selected] - low) / (high - low) if high > low else np.full(len(selected), 0.5)
+        sizes = np.round(4 + 12 * scaled, 1)
+    selected_codes = codes[selected]
+
+    # the hover labels are shared by the points of the trace, only the id (or the title) is per point
+    title = '<b>%{hovertext}</b><br><br>' if hover is not None else ''
+    title += '#%{customdata}<br>' if ids is not None else ''
+    axes_labels = '<br>'.join(f'{column}=%{{{axis}}}' for axis, column in zip(axes, columns))
+    trace_class = go.Scatter3d if len(columns) == 3 else go.Scattergl
+    traces = []
+    for code, label in enumerate(labels):
+        rows = np.flatnonzero(selected_codes == code)
+        if len(rows) == 0:
+            continue
+        trace_marker = dict(marker or {})
+        if colors is not None and label in colors:
+            trace_marker['color'] = colors[label]
+        if size_column is not None:
+            trace_marker['size'] = sizes[rows]
+        traces.append(trace_class(
+            **{axis: axis_values[rows] for axis, axis_values in coordinates.items()},
+            mode='markers',
+            name=str(label),
+            legendgroup=str(label),
+            marker=trace_marker,
+            customdata=ids[rows] if ids is not None else None,
+            hovertext=hover[rows] if hover is not None else None,
+            hovertemplate=f'{title}{group_column}={label}<br>{axes_labels}<extra></extra>',
+        ))
+    return traces
+
+
+def lookup_point(data, id_column, point_id):
+    """
+    Returns the row of a point id shown on hover (see `build_group_scatter_traces`).
+
+    Args:
+        data (pandas.DataFrame): The rows of the chart.
+        id_column (str): The integer column of the ids.
+        point_id (int): The id.
+
+    Returns:
+        pandas.Series: The row, or None if no row has this id.
+    """
+    positions = np.flatnonzero(data[id_column].to_numpy() == point_id)
+    return data.iloc[positions[0]] if len(positions) > 0 else None
@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+
+
+# Compact dtypes of every table, applied when the table is loaded:
+# - Spotify ids (22-char strings repeated across rows) as categoricals
+# - popularity values (0-100) as uint8, followers as uint32
+# - dates as day numbers (days since 1970-01-01), see `to_day_number`
+table_schemas = {
+    'tracks_popularity_table': {'date': 'day', 'track_id': 'category', 'track_popularity': 'uint8'},
+    'albums_popularity_table': {'date': 'day', 'album_id': 'category', 'album_popularity': 'uint8'},
+    'artists_popularity_table': {'date': 'day', 'artist_id': 'category', 'artist_popularity': 'uint8'},
+    'artists_followers_table': {'date': 'day', 'artist_id': 'category', 'followers': 'uint32'},
+    'artists_table': {'artist_id': 'category'},
+    'albums_table': {'album_id': 'category', 'artist_id': 'category', 'album_release_date': 'uint16',
+                     'album_total_tracks': 'uint16'},
+    'tracks_table': {'track_id': 'category', 'album_id': 'category', 'track_duration_ms': 'uint32'},
+    'tracks_features_table': {'track_id': 'category', 'duration_ms': 'uint32', 'time_signature': 'uint8',
+                              'track_key': 'uint8', 'mode': 'uint8', 'type': 'category'},
+    'tracks_clustered': {'date': 'day', 'track_id': 'category', 'album_id': 'category', 'artist_id': 'category',
+                         'album_release_date': 'uint16', 'time_signature': 'uint8', 'track_key': 'uint8',
+                         'mode': 'uint8', 'cluster': 'uint8', 'type': 'category'},
+}
+
+# day numbers fit in uint16 until the year 2149
+day_number_dtype = 'uint16'
+
+# memory usage of the tables converted with `apply_schema(..., report=True)`, with table names as keys
+memory_report = {}
+
+
+def to_day_number(dates):
+    """Convert dates (strings, datetime.date or datetime64 values) to day numbers, i.e. days since 1970-01-01."""
+    days = pd.to_datetime(dates).to_numpy().astype('datetime64[D]').astype(np.int64)
+    return days.astype(day_number_dtype)
+
+
+def day_number_to_datetime(days):
+    """Convert day numbers back to datetime64 values, e.g. for the x-axis of a chart."""
+    return pd.to_datetime(np.asarray(days, dtype=np.int64), unit='D')
+
+
+def apply_schema(table, table_name, report=False):
+    """
+    Converts the columns of a table to the compact dtypes of its schema in `table_schemas`.
+    Columns missing from the table or from the schema are left as they are.
+
+    Args:
+        table (pandas.DataFrame): The table, as returned by `pd.read_sql` or `pd.read_csv`.
+        table_name (str): The name of the table, e.g. 'tracks_popularity_table'.
+        report (bool, optional): Whether to record the memory usage before and after the conversion in `memory_report`.
+            Measuring the memory of string columns is slow on large tables. Defaults to False.
+
+    Returns:
+        pandas.DataFrame: The table with compact dtypes.
+    """
+    schema = table_schemas.get(table_name, {})
+    if report:
+        bytes_before = table.memory_usage(deep=True).sum()
+    for column, dtype in schema.items():
+        if column not in table.columns:
+            continue
+        if dtype == 'day':
+            if table[column].dtype != day_number_dtype:
+                table[column] = to_day_number(table[column])
+        elif str(table[column].dtype) != dtype:
+            table[column] = table[column].astype(dtype)
+    if report:
+        bytes_after = table.memory_usage(deep=True).sum()
+        memory_report[table_name] = {
+            'rows': len(table),
+            'bytes_before': int(bytes_before),
+            'bytes_after': int(bytes_after),
+            'bytes_saved': int(bytes_before - bytes_after),
+        }
+    return table
+
+
+def concat_tables(tables):
+    """
+    Concatenates tables with compact dtypes, keeping the categorical columns categorical.
+    (`pd.concat` falls back to object dtype when the categories of the tables differ.)
+
+    Args:
+        tables (list): The tables (pandas.DataFrame) to concatenate, with the same columns.
+
+    Returns:
+        pandas.DataFrame: The concatenated table.
+    """
+    categorical = [column for column in tables[0].columns
+                   if all(isinstance(table[column].dtype, pd.CategoricalDtype) for table in tables)]
+    data = pd.concat([table.drop(columns=categorical) for table in tables], ignore_index=True)
+    for column in categorical:
+        data[column] = union_categoricals([table[column] for table in tables])
+    return data[tables[0].columns]
+
+
+def get_memory_report():
+    """
+    Returns the memory saved by the compact dtypes for every table converted with `apply_schema(..., report=True)`.
+
+    Returns:
+        pandas.DataFrame: The rows, the memory usage in MB before and after the conversion and the MB saved per table.
+    """
+    report = pd.DataFrame.from_dict(memory_report, orient='index')
+    if report.empty:
+        return report
+    for column in ['bytes_before', 'bytes_after', 'bytes_saved']:
+        report[column.replace('bytes', 'mb')] = report.pop(column) / 2**20
+    report['ratio'] = report['mb_after'] / report['mb_before']
+    return report.rename_axis('table')
+
+
+if __name__ == '__main__':
+    # report the memory saved on the local CSV tables
+    import os
+    for table_name in table_schemas:
+        if os.path.exists(f"data/{table_name}.csv"):
+            apply_schema(pd.read_csv(f"data/{table_name}.csv"), table_name, report=True)
+    print(get_memory_report().round(3).to_string())
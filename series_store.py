@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_integer_dtype
+from schema import day_number_to_datetime
+
+
+
+class SeriesStore:
+    """Columnar store for the daily popularity/followers series of many entities.
+
+    The long `(date, <id>, <value>)` table is sorted once by entity and date and kept as flat NumPy arrays:
+    - `values`: the metric values of all entities, one contiguous block per entity, in date order.
+    - `date_codes`: for every value, the position of its date on the shared `dates` axis.
+    - `offsets`: entity `i` owns `values[offsets[i]:offsets[i + 1]]`.
+
+    Per-entity series are returned as slices (views) of these arrays, so no per-row Python objects are created.
+    """
+
+    def __init__(self, ids, offsets, date_codes, values, dates):
+        """
+        Args:
+            ids (numpy.ndarray): The sorted unique entity ids.
+            offsets (numpy.ndarray): Start offset of every entity in `values`, plus the total length at the end.
+            date_codes (numpy.ndarray): Position of each value's date in `dates`.
+            values (numpy.ndarray): The metric values, grouped by entity and sorted by date.
+            dates (pandas.DatetimeIndex): The shared, sorted date axis.
+        """
+        self.ids = ids
+        self.offsets = offsets
+        self.date_codes = date_codes
+        self.values = values
+        self.dates = dates
+        self._index = pd.Index(ids)
+
+    @classmethod
+    def from_table(cls, table, id_column, value_column):
+        """Build the store from a long popularity table.
+
+        Args:
+            table (pandas.DataFrame): Table with the columns `date` (datetime or day number), `id_column` and `value_column`.
+            id_column (str): The entity id column, e.g. 'track_id' or 'artist_id'.
+            value_column (str): The metric column, e.g. 'track_popularity' or 'followers'.
+
+        Returns:
+            SeriesStore: The columnar store.
+        """
+        if is_integer_dtype(table['date']):
+            # day numbers (see `schema.apply_schema`) are factorized as integers and converted once on the date axis
+            date_codes, days = pd.factorize(table['date'], sort=True)
+            dates = day_number_to_datetime(days)
+        else:
+            date_codes, dates = pd.factorize(pd.to_datetime(table['date']), sort=True)
+        id_codes, ids = pd.factorize(table[id_column], sort=True)
+        # sort by entity, then by date, in a single vectorized pass
+        order = np.lexsort((date_codes, id_codes))
+        offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(id_codes, minlength=len(ids)), out=offsets[1:])
+        return cls(
+            ids=np.asarray(ids),
+            offsets=offsets,
+            date_codes=date_codes[order].astype(np.int32),
+            values=table[value_column].to_numpy()[order],
+            dates=pd.DatetimeIndex(dates),
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, entity_id):
+        return entity_id in self._index
+
+    def _bounds(self, entity_id):
+        position = self._index.get_loc(entity_id)
+        return self.offsets[position], self.offsets[position + 1]
+
+    def values_of(self, entity_id):
+        """Return the values of one entity as a view of the store (ordered by date)."""
+        start, end = self._bounds(entity_id)
+        return self.values[start:end]
+
+    def dates_of(self, entity_id):
+        """Return the dates matching `values_of(entity_id)`."""
+        start, end = self._bounds(entity_id)
+        return self.dates[self.date_codes[start:end]]
+
+    def values_list(self, entity_ids):
+        """Return the value series of several entities, e.g. for a `LineChartColumn`.
+
+        Args:
+            entity_ids (iterable): The entity ids. Ids missing from the store get an empty series.
+
+        Returns:
+            list: One NumPy view per entity id.
+        """
+        positions = self._index.get_indexer(entity_ids)
+        empty = self.values[:0]
+        return [self.values[self.offsets[p]:self.offsets[p + 1]] if p >= 0 else empty for p in positions]
+
+    def latest(self):
+        """Return the most recent value of every entity.
+
+        Returns:
+            pandas.Series: The latest values, indexed by entity id.
+        """
+        return pd.Series(self.values[self.offsets[1:] - 1], index=self._index)
+
+    def mean_by_date(self):
+        """Return the mean value over all entities for every date of the date axis.
+
+        Returns:
+            pandas.Series: The mean values, indexed by date.
+        """
+        totals = np.bincount(self.date_codes, weights=self.values, minlength=len(self.dates))
+        counts = np.bincount(self.date_codes, minlength=len(self.dates))
+        return pd.Series(totals / counts, index=self.dates)
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import threading
+import pandas as pd
+import pyarrow.feather as feather
+from schema import apply_schema, table_schemas
+
+
+
+# directory of the compiled snapshots of the static CSV tables
+snapshot_dir = "data/snapshots"
+
+_snapshot_lock = threading.Lock()
+
+
+def is_dictionary_column(column):
+    # Spotify ids and names repeat across rows, so they are stored dictionary-encoded
+    return column.endswith('_id') or column.endswith('_name')
+
+
+def file_fingerprint(path):
+    """Return the size and modification time of a file, used to detect changes cheaply."""
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def file_hash(path):
+    """Return the SHA-256 hash of a file's content."""
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def snapshot_name(csv_path):
+    return os.path.splitext(os.path.basename(csv_path))[0]
+
+
+def snapshot_paths(csv_path):
+    name = snapshot_name(csv_path)
+    return os.path.join(snapshot_dir, f"{name}.feather"), os.path.join(snapshot_dir, f"{name}.json")
+
+
+def build_snapshot(csv_path):
+    """
+    Compiles a CSV file into an uncompressed Feather (Arrow IPC) snapshot, with the compact dtypes of its schema
+    (see `schema.table_schemas`) and the id and name columns dictionary-encoded, and writes a manifest with the fingerprint
+    of the source file and the schema of the snapshot.
+
+    Args:
+        csv_path (str): The path of the CSV file.
+
+    Returns:
+        dict: The manifest of the snapshot.
+    """
+    snapshot_path, manifest_path = snapshot_paths(csv_path)
+    os.makedirs(snapshot_dir, exist_ok=True)
+    table = apply_schema(pd.read_csv(csv_path), snapshot_name(csv_path))
+    for column in table.columns:
+        if is_dictionary_column(column) and table[column].dtype == object:
+            table[column] = table[column].astype('category')
+    # uncompressed, so that the snapshot can be memory-mapped
+    table.to_feather(snapshot_path + '.tmp', compression='uncompressed')
+    os.replace(snapshot_path + '.tmp', snapshot_path)
+    manifest = {
+        'source': csv_path,
+        'fingerprint': file_fingerprint(csv_path),
+        'sha256': file_hash(csv_path),
+        'table_schema': table_schemas.get(snapshot_name(csv_path), {}),
+        'rows': len(table),
+        'schema': {column: str(dtype) for column, dtype in table.dtypes.items()},
+    }
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def ensure_snapshot(csv_path):
+    """
+    Makes sure the snapshot of a CSV file is up to date, rebuilding it if the CSV file or the table schema changed.
+    A change of size or modification time alone is confirmed with the hash of the file before rebuilding.
+
+    Args:
+        csv_path (str): The path of the CSV file.
+
+    Returns:
+        str: The path of the snapshot.
+    """
+    snapshot_path, manifest_path = snapshot_paths(csv_path)
+    with _snapshot_lock:
+        if not (os.path.exists(snapshot_path) and os.path.exists(manifest_path)):
+            build_snapshot(csv_path)
+            return snapshot_path
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('table_schema') != table_schemas.get(snapshot_name(csv_path), {}):
+            build_snapshot(csv_path)
+            return snapshot_path
+        fingerprint = file_fingerprint(csv_path)
+        if manifest['fingerprint'] != fingerprint:
+            if manifest['sha256'] == file_hash(csv_path):
+                # same content (e.g. a fresh checkout), only the fingerprint is refreshed
+                manifest['fingerprint'] = fingerprint
+                with open(manifest_path, 'w', encoding='utf-8') as f:
+                    json.dump(manifest, f, indent=2)
+            else:
+                build_snapshot(csv_path)
+    return snapshot_path
+
+
+def read_table(csv_path, columns=None):
+    """
+    Reads a static table through its compiled snapshot instead of parsing the CSV file.
+    The snapshot is memory-mapped and holds pre-typed columns, so no type inference runs on read,
+    and only the requested columns are loaded.
+
+    The id columns are returned as categoricals. The name columns are returned as strings, like `pd.read_csv` does,
+    since the pages concatenate and format them.
+
+    Args:
+        csv_path (str): The path of the CSV file, e.g. 'data/tracks_table.csv'.
+        columns (list, optional): The columns to load. Defaults to all the columns.
+
+    Returns:
+        pandas.DataFrame: The table.
+    """
+    snapshot_path = ensure_snapshot(csv_path)
+    table = feather.read_table(snapshot_path, columns=columns, memory_map=True).to_pandas()
+    for column in table.columns:
+        if column.endswith('_name') and isinstance(table[column].dtype, pd.CategoricalDtype):
+            table[column] = table[column].astype(object)
+    return table
+
@@ -1,4 +1,10 @@
 import  streamlit as st
+from data_snapshot import start_warmup, wait_for_snapshot, warmup_status
+from tracing import debug_panel, trace_rerun
+
+
+# --- DATA WARM-UP [the data snapshot is built in a background thread, once per process] ---
+start_warmup()
 
 
 
@@ -31,5 +37,22 @@ about_page=st.Page(
 # --- NAVIGATION SETUP [WITHOUT SECTIONS] ---
 pg = st.navigation(pages=[main_page, artists_page, clustering_page, about_page])
 st.session_state.update(st.session_state)
-pg.run()
+# --- WAIT FOR THE DATA [only until the first snapshot of the process is built, with all the datasets of the pages] ---
+if pg.title != about_page.title and not warmup_status()['ready']:
+    progress = st.progress(0.0, text='Loading the data...')
+    try:
+        while wait_for_snapshot(timeout=0.5) is None:
+            status = warmup_status()
+            progress.progress(status['done'], text=f"Loading the data: {status['step'] or 'starting'}...")
+    except RuntimeError as e:
+        progress.empty()
+        st.error(f"{e}. Please try again later.")
+        st.stop()
+    progress.empty()
+# --- TRACING [APP_TRACING=1 logs every rerun, ?debug=1 shows the spans of the session's reruns] ---
+debug = st.query_params.get('debug') == '1'
+with trace_rerun(pg.title, debug=debug) as trace:
+    pg.run()
+if debug:
+    debug_panel(trace)
 
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+import pandas as pd
+from aggregates import DateGroupAggregate
+
+
+def popularity_table():
+    return pd.DataFrame({
+        'date': np.array([0, 0, 0, 1, 1, 1], dtype=np.int32),
+        'track_id': ['a', 'b', 'c', 'a', 'b', 'c'],
+        'track_popularity': [10, 20, 30, 40, 50, 60],
+    })
+
+
+def test_save_and_load_with_string_groups(tmp_path):
+    # the clusters are strings, as in `clustering.cluster_popularity_trend`
+    cluster_of = pd.Series(['0', '1', '1'], index=['a', 'b', 'c'], dtype=object)
+    aggregate = DateGroupAggregate('track_popularity', 'track_id', cluster_of, groups_key='model-1')
+    aggregate.update(popularity_table())
+    path = str(tmp_path / 'aggregate.npz')
+    aggregate.save(path)
+
+    loaded = DateGroupAggregate('track_popularity', 'track_id', cluster_of, groups_key='model-1')
+    assert loaded.load(path)
+    pd.testing.assert_frame_equal(loaded.means(), aggregate.means())
+    assert loaded.means()['group'].tolist() == ['0', '1', '0', '1']
+    assert loaded.means()['mean'].tolist() == [10, 25, 40, 55]
+
+
+def test_load_ignores_other_groups_and_unreadable_files(tmp_path):
+    cluster_of = pd.Series(['0', '1', '1'], index=['a', 'b', 'c'])
+    aggregate = DateGroupAggregate('track_popularity', 'track_id', cluster_of, groups_key='model-1')
+    aggregate.update(popularity_table())
+    path = str(tmp_path / 'aggregate.npz')
+    aggregate.save(path)
+    assert not DateGroupAggregate('track_popularity', 'track_id', cluster_of, groups_key='model-2').load(path)
+
+    with open(path, 'wb') as f:
+        f.write(b'not an npz file')
+    rebuilt = DateGroupAggregate('track_popularity', 'track_id', cluster_of, groups_key='model-1')
+    assert not rebuilt.load(path)
+    assert rebuilt.update(popularity_table()) == 6
+
+
+def groupby_means(table, cluster_of):
+    # the means of the baseline: merge the whole history with the clusters and group it
+    data = table.merge(cluster_of.rename('group'), left_on='track_id', right_index=True)
+    means = data.groupby(['date', 'group'])['track_popularity'].mean().reset_index()
+    return means['group'].tolist(), means['track_popularity'].tolist()
+
+
+def random_table(n_tracks=40, n_days=6, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'date': np.repeat(np.arange(n_days, dtype=np.int32), n_tracks),
+        'track_id': np.tile([f't{i}' for i in range(n_tracks)], n_days),
+        'track_popularity': rng.integers(0, 100, n_tracks * n_days),
+    })
+
+
+def test_regroup_matches_a_rebuild_with_the_new_clusters(tmp_path):
+    rng = np.random.default_rng(1)
+    table = random_table()
+    # the first snapshot only knows 30 tracks in 3 clusters
+    old = pd.Series(rng.choice(['0', '1', '2'], 30), index=[f't{i}' for i in range(30)], dtype=object)
+    aggregate = DateGroupAggregate('track_popularity', 'track_id', old, groups_key='model-1')
+    aggregate.update(table.iloc[:150])
+    path = str(tmp_path / 'aggregate.npz')
+    aggregate.save(path)
+
+    # the next one: 5 tracks change cluster, 3 are dropped, 10 are new and a cluster appears
+    new = old.copy()
+    new.iloc[:5] = ['3', '3', '0', '1', '2']
+    new = pd.concat([new.iloc[3:], pd.Series(rng.choice(['0', '3'], 10), index=[f't{i}' for i in range(30, 40)])])
+    changed = 3 + 10 + int((old.iloc[3:] != new.iloc[:27]).sum())
+    for regrouped in [aggregate, DateGroupAggregate('track_popularity', 'track_id', new, groups_key='model-1')]:
+        if regrouped is not aggregate:
+            # after a restart, from the persisted aggregate and the mapping it was built with
+            assert regrouped.load(path)
+        assert regrouped.regroup(new, table.iloc[:150]) == changed
+        regrouped.update(table)
+        means = regrouped.means()
+        groups, expected = groupby_means(table, new)
+        assert means['group'].tolist() == groups
+        assert means['mean'].tolist() == pytest.approx(expected)
+        assert regrouped.regroup(new, table) == 0
@@ -0,0 +1,100 @@
+import os
+import pandas as pd
+import pytest
+import sqlalchemy
+import connect_to_database
+from connect_to_database import EngineManager, get_new_data, load_watermarks, save_watermark, sync_table
+from schema import to_day_number
+
+
+table_name = 'tracks_popularity_table'
+
+
+def popularity_rows(dates):
+    return pd.DataFrame([(date, track_id, popularity) for date in dates for track_id, popularity in [('a', 10), ('b', 20)]],
+                        columns=['date', 'track_id', 'track_popularity'])
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """A SQLite stand-in of the database, with the local snapshots in `tmp_path/data`, recording the queries."""
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('data')
+    monkeypatch.setattr(connect_to_database, '_synced_tables', {})
+    url = f"sqlite:///{tmp_path / 'local.db'}"
+    engine = sqlalchemy.create_engine(url)
+    manager = EngineManager(url)
+    queries = []
+    read_sql = manager.read_sql
+    monkeypatch.setattr(manager, 'read_sql', lambda sql, params=None: queries.append((sql, params)) or read_sql(sql, params))
+    monkeypatch.setattr(connect_to_database, '_engine_manager', manager)
+
+    def insert(dates):
+        popularity_rows(dates).to_sql(table_name, engine, if_exists='append', index=False)
+
+    yield insert, queries
+    manager.dispose()
+    engine.dispose()
+
+
+def synced_days(data):
+    return sorted(set(data['date'].tolist()))
+
+
+def test_sync_table_appends_the_new_rows_and_moves_the_watermark(database):
+    insert, queries = database
+    insert(['2024-01-01', '2024-01-02', '2024-01-03'])
+    popularity_rows(['2024-01-01', '2024-01-02']).to_csv(f'data/{table_name}.csv', index=False)
+
+    # first sync: the local snapshot is loaded and only the rows after its latest date are queried
+    data = sync_table(table_name)
+    assert queries[-1] == (f"SELECT * FROM {table_name} WHERE date > :latest_date;",
+                           {'latest_date': pd.Timestamp('2024-01-02').date()})
+    assert synced_days(data) == list(to_day_number(['2024-01-01', '2024-01-02', '2024-01-03']))
+    assert len(data) == 6 and str(data['track_popularity'].dtype) == 'uint8'
+    assert load_watermarks() == {table_name: '2024-01-03'}
+    assert len(pd.read_csv(f'data/{table_name}.csv')) == 6
+
+    # next sync in the process: from the watermark, without reading the snapshot again
+    insert(['2024-01-04'])
+    data = sync_table(table_name)
+    assert queries[-1][1] == {'latest_date': pd.Timestamp('2024-01-03').date()}
+    assert len(data) == 8 and load_watermarks() == {table_name: '2024-01-04'}
+    expected_csv = popularity_rows(['2024-01-01', '2024-01-02', '2024-01-03', '2024-01-04'])
+    pd.testing.assert_frame_equal(pd.read_csv(f'data/{table_name}.csv'), expected_csv)
+
+    # nothing new: the data and the watermark are unchanged
+    assert sync_table(table_name) is data
+    assert load_watermarks() == {table_name: '2024-01-04'}
+
+
+def test_sync_table_resumes_from_the_later_of_the_snapshot_and_the_watermark(database):
+    insert, queries = database
+    insert(['2024-01-01', '2024-01-02', '2024-01-03'])
+    popularity_rows(['2024-01-01', '2024-01-02']).to_csv(f'data/{table_name}.csv', index=False)
+    # a watermark lagging the snapshot, e.g. after a crash between the CSV append and the watermark write
+    save_watermark(table_name, '2024-01-01')
+    sync_table(table_name)
+    assert queries[-1][1] == {'latest_date': pd.Timestamp('2024-01-02').date()}
+
+    # a watermark ahead of the snapshot
+    connect_to_database._synced_tables.clear()
+    save_watermark(table_name, '2024-01-05')
+    sync_table(table_name)
+    assert queries[-1][1] == {'latest_date': pd.Timestamp('2024-01-05').date()}
+
+
+def test_sync_table_loads_the_whole_table_without_a_snapshot(database):
+    insert, queries = database
+    insert(['2024-01-01', '2024-01-02'])
+    data = sync_table(table_name)
+    assert queries == [(f"SELECT * FROM {table_name};", None)]
+    assert len(data) == 4 and load_watermarks() == {table_name: '2024-01-02'}
+    assert len(pd.read_csv(f'data/{table_name}.csv')) == 4
+
+
+def test_get_new_data_only_queries_known_tables(database):
+    _, queries = database
+    with pytest.raises(ValueError, match='Unknown table'):
+        get_new_data('tracks_popularity_table; DROP TABLE tracks_table', '2024-01-01')
+    assert queries == []
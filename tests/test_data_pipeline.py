@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+from data_pipeline import get_track_versions
+
+
+def tracks_with_versions(seed=0):
+    # duplicate track names across and within artists, with many ties in popularity
+    rng = np.random.default_rng(seed)
+    n_tracks = 300
+    return pd.DataFrame({
+        'track_id': [f'id{i:03d}' for i in rng.permutation(n_tracks)],
+        'artist_name': rng.choice(['Queen', 'Muse', 'Rush'], n_tracks),
+        'original_track_name': rng.choice(['Intro', 'Live', 'Outro', 'Home', 'Run'], n_tracks),
+        'current_track_popularity': rng.integers(40, 45, n_tracks),
+    })
+
+
+def baseline_track_versions(data):
+    # the per-group sort of the original pipeline, with the same tie-break on track_id
+    return (data
+            .groupby(['artist_name', 'original_track_name'])
+            .apply(lambda x: x.sort_values(['current_track_popularity', 'track_id'], ascending=[False, True])
+                   .assign(canonical_track_id=lambda v: v['track_id'].iloc[0], version_rank=np.arange(len(x))),
+                   include_groups=False)
+            .reset_index(drop=True)
+            [['track_id', 'canonical_track_id', 'version_rank']]
+            )
+
+
+def test_get_track_versions_matches_the_baseline_groupby():
+    data = tracks_with_versions()
+    versions = get_track_versions(data)
+    expected = baseline_track_versions(data)
+    pd.testing.assert_frame_equal(versions, expected, check_dtype=False)
+
+    # the canonical version is the most popular one of its family, and every track is ranked once
+    keys = ['artist_name', 'original_track_name']
+    canonical = data.set_index('track_id').loc[versions.loc[versions['version_rank'] == 0, 'track_id']]
+    family_max = data.groupby(keys)['current_track_popularity'].max()
+    assert (canonical.set_index(keys)['current_track_popularity'].sort_index() == family_max).all()
+    assert sorted(versions['track_id']) == sorted(data['track_id'])
@@ -0,0 +1,42 @@
+import threading
+import pytest
+from data_registry import DataRegistry, LazyDatasets
+
+
+def test_build_all_loads_the_sources_together_and_times_them():
+    registry = DataRegistry()
+    started = threading.Barrier(3, timeout=5)
+
+    def source(name):
+        # every source waits for the two others, so they must be loaded in parallel
+        started.wait()
+        return name
+
+    for name in ['static_tables', 'tracks_table', 'artists_table']:
+        registry.dataset(name)(lambda name=name: source(name))
+    registry.dataset('tracks_data', depends_on=('static_tables', 'tracks_table'))(lambda *tables: tables)
+    registry.dataset('artists_data', depends_on=('static_tables', 'artists_table'))(lambda *tables: tables)
+    datasets = LazyDatasets(registry)
+
+    timings = datasets.build_all()
+    assert set(timings) == {'static_tables', 'tracks_table', 'artists_table', 'total'}
+    assert timings['total'] >= max(timings[name] for name in ['static_tables', 'tracks_table', 'artists_table'])
+    assert datasets.get('tracks_data') == ('static_tables', 'tracks_table')
+    assert datasets.missing() == []
+
+
+def test_build_all_names_the_failed_source():
+    registry = DataRegistry()
+    registry.dataset('static_tables')(lambda: 'static')
+
+    @registry.dataset('tracks_table')
+    def tracks_table():
+        raise ConnectionError('database unreachable')
+
+    registry.dataset('tracks_data', depends_on=('static_tables', 'tracks_table'))(lambda *tables: tables)
+    datasets = LazyDatasets(registry)
+    with pytest.raises(RuntimeError, match='tracks_table') as raised:
+        datasets.build_all()
+    assert isinstance(raised.value.__cause__, ConnectionError)
+    # the failed dataset is not kept, the next build retries it
+    assert 'tracks_table' in datasets.missing()
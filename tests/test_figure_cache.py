@@ -0,0 +1,54 @@
+import json
+import pytest
+from streamlit.testing.v1 import AppTest
+from figure_cache import FigureCache, figure_cache, figure_key
+
+
+def figure_page():
+    import plotly.graph_objects as go
+    import streamlit as st
+    from figure_cache import show_figure
+
+    def build():
+        return go.Figure(go.Bar(x=['0', '1', '2'], y=[3, 1, 2]), layout=dict(title='Tracks per cluster'))
+
+    # the same figure, displayed from the figure cache and by Streamlit
+    show_figure('tests.bar', 1, {'n': 3}, build, use_container_width=True)
+    st.plotly_chart(build(), use_container_width=True)
+
+
+@pytest.fixture
+def cache():
+    figure_cache.clear()
+    yield figure_cache
+    figure_cache.clear()
+
+
+def test_cached_figure_renders_as_plotly_chart(cache):
+    at = AppTest.from_function(figure_page).run()
+    assert not at.exception
+    cached, plotly_chart = (element.proto for element in at.get('plotly_chart'))
+    assert json.loads(cached.spec) == json.loads(plotly_chart.spec)
+    assert cached.config == plotly_chart.config
+    assert (cached.use_container_width, cached.theme) == (plotly_chart.use_container_width, plotly_chart.theme)
+
+    # the rerun is served from the cache, with the same chart
+    hits = cache.metrics()['hits']
+    at.run()
+    assert cache.metrics()['hits'] == hits + 1
+    assert at.get('plotly_chart')[0].proto.spec == cached.spec
+
+
+def test_figure_key_is_canonical():
+    assert figure_key('a', 1, {'x': [1, 2], 'y': 'b'}) == figure_key('a', 1, {'y': 'b', 'x': (1, 2)})
+    assert figure_key('a', 1, {'x': [1, 2]}) != figure_key('a', 2, {'x': [1, 2]})
+
+
+def test_least_recently_used_figures_are_evicted():
+    cache = FigureCache(max_bytes=10)
+    cache.put('a', '1234')
+    cache.put('b', '1234')
+    assert cache.get('a') == '1234'
+    cache.put('c', '1234')
+    assert cache.get('b') is None
+    assert cache.metrics()['evictions'] == 1
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+from filter_engine import FilterEngine
+
+
+def tracks(n_tracks=5000, seed=0):
+    # integer popularity and rounded features, so there are many ties
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'artist_name': rng.choice(['Queen', 'Muse', 'Rush', 'Yes'], n_tracks),
+        'current_track_popularity': rng.integers(0, 30, n_tracks),
+        'energy': np.round(rng.random(n_tracks), 1),
+        'valence': np.round(rng.random(n_tracks), 2),
+    })
+
+
+def expected_top(data, mask, n, by, ascending=False):
+    masked = data[mask]
+    return masked.nsmallest(n, by) if ascending else masked.nlargest(n, by)
+
+
+@pytest.mark.parametrize('by', [None, 'energy'])
+@pytest.mark.parametrize('ascending', [False, True])
+@pytest.mark.parametrize('n', [1, 10, 2000, 10000])
+@pytest.mark.parametrize('ranges, artists', [
+    ({'valence': (0.2, 0.3)}, None),
+    ({'valence': (0.0, 1.0)}, ['Queen', 'Yes']),
+    ({'valence': (2.0, 3.0)}, None),
+    ({'valence': (0.0, 1.0)}, []),
+])
+def test_top_rows_matches_nlargest(ranges, artists, n, ascending, by):
+    data = tracks()
+    engine = FilterEngine(data, ['energy', 'valence'])
+    mask = engine.mask(ranges, artists)
+    rows = engine.top_rows(mask, n, by=by, ascending=ascending)
+    by = by or 'current_track_popularity'
+    expected = expected_top(data, mask, n, by, ascending)
+    assert data[by].to_numpy()[rows].tolist() == expected[by].tolist()
+    # ties are kept in row order (`nlargest` only guarantees it when n < matches)
+    stable = data[mask].sort_values(by, ascending=ascending, kind='stable').head(n)
+    assert rows.tolist() == stable.index.tolist()
+
+def test_top_ranks_the_filtered_rows():
+    data = tracks()
+    engine = FilterEngine(data, ['energy', 'valence'])
+    top = engine.top({'energy': (0.5, 0.8)}, 20, artists=['Muse'])
+    mask = (data['artist_name'] == 'Muse') & data['energy'].between(0.5, 0.8)
+    expected = data[mask].nlargest(20, 'current_track_popularity').reset_index(drop=True)
+    assert top['rank'].tolist() == list(range(1, 21))
+    pd.testing.assert_frame_equal(top.drop(columns='rank'), expected)
+
+    empty = engine.top({'energy': (2.0, 3.0)}, 20)
+    assert empty.empty and list(empty.columns) == ['rank'] + list(data.columns)
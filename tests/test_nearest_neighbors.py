@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+from nearest_neighbors import NeighborIndex
+
+
+features = ['x', 'y', 'z']
+
+
+def points_data(n_points=3000, n_duplicates=200, seed=0):
+    # random points on a grid of exact binary fractions, so that many distances are exactly tied, and a block of duplicates
+    rng = np.random.default_rng(seed)
+    points = rng.integers(0, 9, (n_points, len(features))) / 8
+    points[rng.choice(n_points, n_duplicates, replace=False)] = [0.5, 0.5, 0.5]
+    data = pd.DataFrame(points, columns=features)
+    data.insert(0, 'track_id', [f'id{i}' for i in range(n_points)])
+    return data
+
+
+def brute_force(points, point, k):
+    distances = np.sqrt(((points - point) ** 2).sum(axis=1))
+    # nearest first, ties in row order
+    positions = np.lexsort((np.arange(len(points)), distances))[:k]
+    return distances[positions], positions
+
+
+@pytest.mark.parametrize('leaf_size', [8, 128])
+@pytest.mark.parametrize('k', [1, 5, 50, 250])
+def test_query_matches_brute_force(k, leaf_size):
+    data = points_data()
+    index = NeighborIndex(data, features=features, leaf_size=leaf_size)
+    points = data[features].to_numpy()
+    rng = np.random.default_rng(k)
+    queries = np.vstack([rng.integers(0, 9, (20, len(features))) / 8, [[0.5, 0.5, 0.5]], points[:20]])
+    for point in queries:
+        distances, positions = index.query(point, k)
+        expected_distances, expected_positions = brute_force(points, point, k)
+        assert np.allclose(distances, expected_distances)
+        assert positions.tolist() == expected_positions.tolist()
+
+
+def test_query_returns_every_point_when_k_is_larger():
+    data = points_data(n_points=50, n_duplicates=5)
+    index = NeighborIndex(data, features=features, leaf_size=8)
+    distances, positions = index.query([0.25, 0.375, 0.625], 80)
+    expected_distances, expected_positions = brute_force(data[features].to_numpy(), [0.25, 0.375, 0.625], 80)
+    assert len(positions) == 50
+    assert np.allclose(distances, expected_distances) and positions.tolist() == expected_positions.tolist()
+
+
+def test_similar_excludes_the_track_itself():
+    data = points_data()
+    index = NeighborIndex(data, features=features, leaf_size=32)
+    points = data[features].to_numpy()
+    duplicate = data.index[(points == 0.5).all(axis=1)][3]
+    track_ids = ['id7', data.loc[duplicate, 'track_id'], 'missing']
+    similar = index.similar(track_ids, 10)
+    assert similar['similar_to'].tolist() == ['id7'] * 10 + [data.loc[duplicate, 'track_id']] * 10
+    for track_id, group in similar.groupby('similar_to', sort=False):
+        position = data.index[data['track_id'] == track_id][0]
+        distances, positions = brute_force(points, points[position], 11)
+        expected = positions[positions != position][:10]
+        assert group['track_id'].tolist() == data['track_id'].to_numpy()[expected].tolist()
+        assert np.allclose(group['distance'], distances[positions != position][:10])
+    # a track among duplicates is only similar to the other duplicates
+    assert (similar.loc[similar['similar_to'] != 'id7', 'distance'] == 0).all()
+    assert index.similar(['missing'], 10).empty
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+from scatter_charts import build_group_scatter_traces, lookup_point, stratified_sample
+
+
+def clustered_tracks(n_tracks=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'cluster': rng.choice(['0', '1', '2'], n_tracks, p=[0.7, 0.29, 0.01]),
+        'energy': rng.random(n_tracks),
+        'valence': rng.random(n_tracks),
+        'acousticness': rng.random(n_tracks),
+        'hover_info': [f'track {i}' for i in range(n_tracks)],
+        'track_number': np.arange(n_tracks, dtype=np.int32),
+    })
+
+
+def test_stratified_sample_keeps_every_group():
+    codes = np.repeat([0, 1, 2], [7000, 2900, 100])
+    selected = stratified_sample(codes, 3, 1000)
+    assert len(selected) == 1000 and len(np.unique(selected)) == 1000
+    counts = np.bincount(codes[selected])
+    # the small group keeps its floor, the others share the rest in proportion to their size
+    floor = 1000 // 12
+    assert counts[2] >= floor
+    assert abs((counts[0] - floor) / (counts[1] - floor) - (7000 - floor) / (2900 - floor)) < 0.01
+    assert (stratified_sample(codes, 3, 1000) == selected).all()
+    assert (stratified_sample(codes, 3, None) == np.arange(len(codes))).all()
+
+
+def test_points_carry_their_id_and_no_hover_text_above_the_budget():
+    data = clustered_tracks()
+    traces = build_group_scatter_traces(data, 'cluster', ['energy', 'valence', 'acousticness'], id_column='track_number',
+                                        hover_column='hover_info', max_points=500)
+    assert sum(len(trace.x) for trace in traces) == 500
+    for trace in traces:
+        assert trace.type == 'scatter3d' and trace.hovertext is None
+        rows = data.iloc[trace.customdata]
+        assert (rows['cluster'] == trace.name).all()
+        assert np.allclose(rows['energy'], trace.x, atol=1e-4)
+        assert '#%{customdata}' in trace.hovertemplate
+
+
+def test_hover_text_is_sent_when_all_the_rows_are_drawn():
+    data = clustered_tracks(100)
+    traces = build_group_scatter_traces(data, 'cluster', ['energy', 'valence'], hover_column='hover_info')
+    assert all(trace.type == 'scattergl' for trace in traces)
+    assert sorted(text for trace in traces for text in trace.hovertext) == sorted(data['hover_info'])
+
+
+def test_lookup_point():
+    data = clustered_tracks(100).iloc[::-1]
+    assert lookup_point(data, 'track_number', 42)['hover_info'] == 'track 42'
+    assert lookup_point(data, 'track_number', 1000) is None
@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+import pytest
+from schema import to_day_number
+from series_store import SeriesStore
+
+
+def popularity_table():
+    # shuffled rows, entities with different date ranges and one entity with a single date
+    rows = [
+        ('2024-01-03', 'b', 30), ('2024-01-01', 'a', 10), ('2024-01-02', 'b', 20), ('2024-01-03', 'a', 12),
+        ('2024-01-02', 'a', 11), ('2024-01-04', 'c', 50), ('2024-01-01', 'b', 19), ('2024-01-04', 'a', 13),
+    ]
+    table = pd.DataFrame(rows, columns=['date', 'track_id', 'track_popularity'])
+    table['date'] = pd.to_datetime(table['date'])
+    return table
+
+
+@pytest.mark.parametrize('day_numbers', [False, True])
+def test_series_store_matches_pandas_groupby(day_numbers):
+    table = popularity_table()
+    if day_numbers:
+        table['date'] = to_day_number(table['date'])
+    store = SeriesStore.from_table(table, 'track_id', 'track_popularity')
+    expected = popularity_table().sort_values(['track_id', 'date'])
+    grouped = expected.groupby('track_id')['track_popularity']
+
+    assert len(store) == 3 and 'a' in store and 'd' not in store
+    values = store.values_list(['a', 'b', 'c', 'd'])
+    for entity_id, entity_values in zip(['a', 'b', 'c'], values):
+        assert entity_values.tolist() == grouped.get_group(entity_id).tolist()
+        assert list(store.dates_of(entity_id)) == expected.loc[expected['track_id'] == entity_id, 'date'].tolist()
+    # ids missing from the store get an empty series
+    assert len(values[3]) == 0
+    pd.testing.assert_series_equal(store.latest(), grouped.last(), check_names=False, check_index_type=False)
+    mean_by_date = expected.groupby('date')['track_popularity'].mean()
+    assert np.allclose(store.mean_by_date().to_numpy(), mean_by_date.to_numpy())
+    assert list(store.mean_by_date().index) == list(mean_by_date.index)
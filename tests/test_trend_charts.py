@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+from trend_charts import lttb
+
+
+def reference_lttb(x, y, n_out):
+    # the point-by-point LTTB of Steinarsson's thesis
+    n = len(y)
+    edge = lambda k: k * (n - 2) // (n_out - 2) + 1
+    selected = [0]
+    previous = 0
+    for i in range(n_out - 2):
+        next_start, next_end = edge(i + 1), min(edge(i + 2), n)
+        avg_x, avg_y = np.mean(x[next_start:next_end]), np.mean(y[next_start:next_end])
+        best, best_area = None, -1.0
+        for j in range(edge(i), edge(i + 1)):
+            area = abs((x[previous] - avg_x) * (y[j] - y[previous]) - (x[previous] - x[j]) * (avg_y - y[previous]))
+            if area > best_area:
+                best, best_area = j, area
+        selected.append(best)
+        previous = best
+    selected.append(n - 1)
+    return np.array(selected)
+
+
+@pytest.mark.parametrize('n, n_out', [(1000, 100), (1000, 3), (101, 100), (5000, 777)])
+def test_lttb_matches_the_reference(n, n_out):
+    rng = np.random.default_rng(n_out)
+    x = np.cumsum(rng.random(n))
+    y = np.cumsum(rng.normal(size=n))
+    x_out, y_out = lttb(x, y, n_out)
+    assert len(x_out) == len(y_out) == n_out
+    # the endpoints are kept and the points stay in order
+    assert (x_out[0], x_out[-1], y_out[0], y_out[-1]) == (x[0], x[-1], y[0], y[-1])
+    assert (np.diff(x_out) > 0).all()
+    selected = reference_lttb(x, y, n_out)
+    assert (x_out == x[selected]).all() and (y_out == y[selected]).all()
+
+
+def test_lttb_keeps_dates_and_peaks():
+    dates = pd.date_range('2024-01-01', periods=365)
+    y = np.zeros(365)
+    y[200] = 100.0
+    x_out, y_out = lttb(dates, y, 30)
+    assert isinstance(x_out, pd.DatetimeIndex) and len(x_out) == 30
+    assert x_out[0] == dates[0] and x_out[-1] == dates[-1]
+    assert 100.0 in y_out and dates[200] in x_out
+
+
+@pytest.mark.parametrize('n', [0, 1, 50, 100])
+def test_lttb_returns_short_series_unchanged(n):
+    x, y = np.arange(n), np.arange(n, dtype=np.float64)
+    x_out, y_out = lttb(x, y, 100)
+    assert x_out is x and y_out is y
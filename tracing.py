@@ -0,0 +1,213 @@
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+
+
+# Tracing of the reruns: timing spans around the data loads and the figure builders, and cache hits/misses.
+# - APP_TRACING=1 traces every rerun and logs one JSON line per rerun (and per span run outside of a rerun,
+#   e.g. in the threads building the datasets of `data_registry.LazyDatasets`), to stdout or to the file set in APP_TRACE_LOG.
+# - the `?debug=1` query parameter traces the reruns of that session only and shows them in a debug panel.
+# When neither is set, a span costs a thread-local lookup.
+tracing_enabled = os.environ.get('APP_TRACING', '').lower() not in ('', '0', 'false', 'no')
+trace_log_path = os.environ.get('APP_TRACE_LOG')
+
+# the latest traced reruns of the process, for the debug panel
+recent_traces = deque(maxlen=200)
+
+_local = threading.local()
+_log_lock = threading.Lock()
+
+
+def emit(record):
+    """Write a trace record as a JSON line."""
+    line = json.dumps(record, default=str)
+    if trace_log_path:
+        with _log_lock, open(trace_log_path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+    else:
+        print(line)
+
+
+class span:
+    """Context manager timing a block of code, e.g. `with span('tracks.trend_line_figure'): ...`.
+
+    The span is recorded in the trace of the current rerun (see `trace_rerun`), or logged on its own if tracing is
+    enabled and there is no rerun trace in the thread. Attributes (e.g. row counts) can be added with `set`.
+    """
+
+    __slots__ = ('name', 'attributes', 'trace', 'start')
+
+    def __init__(self, name, **attributes):
+        self.name = name
+        self.attributes = attributes
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self.trace = getattr(_local, 'trace', None)
+        if self.trace is None and not tracing_enabled:
+            self.start = None
+            return self
+        self.start = time.perf_counter()
+        if self.trace is not None:
+            self.trace['depth'] += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.start is None:
+            return False
+        record = {'span': self.name, 'ms': round((time.perf_counter() - self.start) * 1000, 3), **self.attributes}
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+        if self.trace is not None:
+            self.trace['depth'] -= 1
+            record['depth'] = self.trace['depth']
+            self.trace['spans'].append(record)
+        else:
+            record['thread'] = threading.current_thread().name
+            emit(record)
+        return False
+
+
+def traced(name):
+    """Decorator running every call of a function in a `span`."""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def traced_cache(cache_decorator, name=None):
+    """
+    Applies a Streamlit cache decorator (`st.cache_data(...)` or `st.cache_resource(...)`) and runs every call
+    in a `span` recording whether the call was a cache hit or a miss (the function body ran).
+
+    Example:
+        @traced_cache(st.cache_data(max_entries=2))
+        def get_clustered_data(...): ...
+
+    Args:
+        cache_decorator (callable): The cache decorator.
+        name (str, optional): The name of the span. Defaults to the qualified name of the function.
+
+    Returns:
+        callable: The decorator.
+    """
+    def decorate(function):
+        span_name = name or f"{function.__module__}.{function.__qualname__}"
+        misses = threading.local()
+
+        # the cache wraps this function, so it only runs on a miss; the signature and source of `function`
+        # are kept for the cache keys (`functools.wraps` sets `__wrapped__`)
+        @functools.wraps(function)
+        def compute(*args, **kwargs):
+            misses.count = getattr(misses, 'count', 0) + 1
+            return function(*args, **kwargs)
+
+        cached = cache_decorator(compute)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(span_name) as call:
+                before = getattr(misses, 'count', 0)
+                result = cached(*args, **kwargs)
+                call.set(cache='miss' if getattr(misses, 'count', 0) > before else 'hit')
+            return result
+
+        wrapper.clear = cached.clear
+        return wrapper
+    return decorate
+
+
+class trace_rerun:
+    """Context manager collecting the spans of a page rerun into one trace, e.g. around `pg.run()`.
+
+    The rerun is traced if tracing is enabled or if `debug` is True (the debug panel of the session).
+    The finished trace is logged if tracing is enabled and kept in `recent_traces`.
+    """
+
+    def __init__(self, page, debug=False):
+        self.page = page
+        self.active = tracing_enabled or debug
+        self.trace = None
+
+    def __enter__(self):
+        if self.active:
+            self.trace = {'page': self.page, 'started_at': time.time(), 'depth': 0, 'spans': []}
+            _local.trace = self.trace
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.trace is None:
+            return False
+        _local.trace = None
+        self.trace['ms'] = round((time.perf_counter() - self.start) * 1000, 3)
+        del self.trace['depth']
+        if exc_type is not None:
+            self.trace['error'] = exc_type.__name__
+        recent_traces.append(self.trace)
+        if tracing_enabled:
+            emit(self.trace)
+        return False
+
+
+def summarize(traces):
+    """
+    Aggregates the spans of several reruns by span name: number of calls, cache hits and misses,
+    total and percentile durations.
+
+    Args:
+        traces (iterable): Traces of `trace_rerun`, e.g. `recent_traces`.
+
+    Returns:
+        list: One dict per span name, the slowest (total time) first.
+    """
+    durations, hits, misses = {}, {}, {}
+    for trace in traces:
+        for record in trace['spans']:
+            durations.setdefault(record['span'], []).append(record['ms'])
+            if record.get('cache') == 'hit':
+                hits[record['span']] = hits.get(record['span'], 0) + 1
+            elif record.get('cache') == 'miss':
+                misses[record['span']] = misses.get(record['span'], 0) + 1
+    summary = []
+    for name, values in durations.items():
+        values = sorted(values)
+        summary.append({
+            'span': name,
+            'calls': len(values),
+            'cache_hits': hits.get(name, 0),
+            'cache_misses': misses.get(name, 0),
+            'total_ms': round(sum(values), 3),
+            'p50_ms': values[len(values) // 2],
+            'p95_ms': values[min(len(values) - 1, int(len(values) * 0.95))],
+        })
+    return sorted(summary, key=lambda row: -row['total_ms'])
+
+
+def debug_panel(trace):
+    """
+    Shows the spans of a rerun and the summary of the recent reruns of the process in the sidebar.
+
+    Args:
+        trace (trace_rerun): The finished rerun trace.
+    """
+    import streamlit as st
+    if trace.trace is None:
+        return
+    with st.sidebar.expander(f"Debug: {trace.trace['page']} rerun in {trace.trace['ms']:.0f} ms"):
+        st.write('###### This rerun')
+        st.dataframe([{'span': '  ' * record['depth'] + record['span'], 'ms': record['ms'],
+                       'cache': record.get('cache', '')} for record in trace.trace['spans']],
+                     hide_index=True, use_container_width=True)
+        st.write(f'###### Last {len(recent_traces)} traced reruns')
+        st.dataframe(summarize(list(recent_traces)), hide_index=True, use_container_width=True)
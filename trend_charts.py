@@ -0,0 +1,72 @@
+import numpy as np
+import plotly.graph_objects as go
+
+
+
+# default number of points kept per series, and number of traces above which the charts are rendered with WebGL
+max_points_per_series = 500
+webgl_trace_threshold = 20
+
+
+def lttb(x, y, n_out):
+    """
+    Downsamples a series with the largest-triangle-three-buckets (LTTB) algorithm, which keeps the points
+    that shape the line (peaks, drops) instead of averaging them away.
+
+    Args:
+        x (numpy.ndarray or pandas.DatetimeIndex): The x values (numbers or dates), sorted.
+        y (numpy.ndarray): The y values.
+        n_out (int): The number of points to keep.
+
+    Returns:
+        tuple: The downsampled x and y values. The series is returned as is if it has at most `n_out` points.
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return x, y
+    x_values = np.asarray(x)
+    if np.issubdtype(x_values.dtype, np.datetime64):
+        x_values = x_values.astype('datetime64[ns]').view(np.int64)
+    x_values = x_values.astype(np.float64)
+    y_values = np.asarray(y, dtype=np.float64)
+
+    # the first and last points are always kept, the others are split into n_out - 2 buckets
+    # (integer bucket edges, a float bucket width can round an edge down by one point)
+    edges = np.arange(n_out - 1, dtype=np.int64) * (n - 2) // (n_out - 2) + 1
+    # average point of every bucket, the last point stands for the bucket after the last one
+    counts = np.diff(np.append(edges, n))
+    avg_x = np.add.reduceat(x_values, edges) / counts
+    avg_y = np.add.reduceat(y_values, edges) / counts
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        # keep the point of the bucket forming the largest triangle with the previous kept point
+        # and the average point of the next bucket
+        px, py = x_values[previous], y_values[previous]
+        area = np.abs((px - avg_x[i + 1]) * (y_values[start:end] - py) - (px - x_values[start:end]) * (avg_y[i + 1] - py))
+        previous = start + int(area.argmax())
+        selected[i + 1] = previous
+    return x[selected], y[selected]
+
+
+def build_trend_traces(series, max_points=max_points_per_series, webgl_threshold=webgl_trace_threshold):
+    """
+    Builds the line traces of a trend chart from NumPy arrays, downsampling every series with LTTB.
+    The traces are rendered with WebGL (`Scattergl`) when there are more than `webgl_threshold` of them.
+
+    Args:
+        series (list): `(name, x, y)` tuples, one per line, e.g. from `SeriesStore.dates_of` and `SeriesStore.values_of`.
+        max_points (int, optional): The maximum number of points per line. Defaults to `max_points_per_series`.
+        webgl_threshold (int, optional): The number of traces above which `Scattergl` is used. Defaults to `webgl_trace_threshold`.
+
+    Returns:
+        list: The traces.
+    """
+    trace_class = go.Scattergl if len(series) > webgl_threshold else go.Scatter
+    traces = []
+    for name, x, y in series:
+        x, y = lttb(x, y, max_points)
+        traces.append(trace_class(x=x, y=y, mode='lines', name=name))
+    return traces